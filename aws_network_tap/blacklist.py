@@ -3,31 +3,22 @@ Blacklists instances from being tapped.
 Sensors and Brains should not be tapped.
 """
 
-import logging
-from aws_network_tap.models.ec2_api_client import Ec2ApiClient
+from typing import List
+from aws_network_tap import instance_list
 from aws_network_tap.models.tag_config import EC2Config
 
+NAME = 'blacklist'
+
 
 def set_blacklist(region: str, enabled: bool = True) -> None:
-    mode = 'ADD TO' if enabled else 'REMOVE FROM'
-    pasted_input = input(f"Enter instance_id (or comma separated list of instance_ids) {mode} blacklist: ")
-    if not pasted_input:
-        return
-    instance_ids = [x.strip() for x in pasted_input.split(',')]
+    instance_ids = instance_list.prompt(NAME, enabled=enabled)
     if not instance_ids:
         return
-    for instance_id in instance_ids:
-        Ec2ApiClient.blacklist_instance(region=region, instance_id=instance_id, enabled=enabled)
-    logging.info('Blacklists config updated')
-
-
-def main() -> None:
-    logging.getLogger().setLevel(logging.INFO)
-    region = Ec2ApiClient.get_region()
-    set_blacklist(region=region, enabled=True)
-    blacklist = Ec2ApiClient.get_instances_by_tag(region=region, tag=EC2Config.T_BLACKLIST)
-    print(f"Current Blacklist: {blacklist}")
-    set_blacklist(region=region, enabled=False)
+    instance_list.update(region, EC2Config.T_BLACKLIST, NAME, instance_ids, enabled=enabled)
+
+
+def main(argv: List[str] = None) -> None:
+    instance_list.main(EC2Config.T_BLACKLIST, NAME, argv)
 
 
 if __name__ == '__main__':
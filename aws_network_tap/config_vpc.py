@@ -1,14 +1,21 @@
 """
-Used interactively to configure the VPCs that should be tapped.
+Used interactively to configure the VPCs that should be tapped,
+or with --apply to bring many VPCs to a declared configuration at once.
 No actual instance tapping happens until spile_driver is called
 """
 
+import argparse
 import logging
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
 from aws_network_tap.models.ec2_api_client import Ec2ApiClient, VPC_Props, Mirror_Target_Props
+from aws_network_tap.models.metrics import Metrics
 from aws_network_tap.models.nlb_factory import NlbFactory
 from aws_network_tap.models.nlb_target_factory import NlbTargetFactory
 from aws_network_tap.models.tag_config import VPCTagConfig
+from aws_network_tap.models.vpc_declaration import VPC_Declared, VPCDeclaration
+
+NEW_NLB_TARGET = '<new nlb target>'
 
 
 def find_target(region: str, vpc_id: str) -> str:
@@ -38,6 +45,7 @@ def find_mirror_target(region: str, vpc_id: str) -> Union[str, None]:
     d_target_id = NlbTargetFactory(region=region, vpc_ids=[vpc_id]).find_or_create(
         nlb_or_eni_arn=target_arn
     )
+    Ec2ApiClient.list_mirror_targets(region=region, refresh=True)  # include the new target for the next VPC
     logging.info(f"Created Traffic Mirroring Target {d_target_id}")
     return d_target_id
 
@@ -70,11 +78,87 @@ def prompt_vpc_config(vpc_prop: VPC_Props, region: str) -> None:
     logging.info(f'VPC Traffic Mirroring Target updated to {mirror_target_arn} in {new_config.enrollment} Enrollment Mode')
 
 
-def main() -> None:
+def resolve_target(region: str, vpc_id: str, target: Union[str, None], dry_run: bool) -> Union[str, None]:
+    """ the mirror target id of a declared target; `nlb` finds or creates the VPC's own NLB and target """
+    if target != VPCDeclaration.TARGET_NLB:
+        return target
+    nlb = NlbFactory(region=region, vpc_id=vpc_id)
+    nlb_arn = nlb.find_nlb() if dry_run else nlb.find_or_create()
+    if not nlb_arn:
+        return NEW_NLB_TARGET
+    target_factory = NlbTargetFactory(region=region, vpc_ids=[vpc_id])
+    if dry_run:
+        return target_factory.find_target(nlb_or_eni_arn=nlb_arn) or NEW_NLB_TARGET
+    return target_factory.find_or_create(nlb_or_eni_arn=nlb_arn)
+
+
+def apply_vpc_config(declared: VPC_Declared, region: str, dry_run: bool = False) -> str:
+    """ returns the line describing the change """
+    vpc_prop = declared.vpc_prop
+    label = f'{vpc_prop.vpc_id}:{vpc_prop.name}'
+    try:
+        target_id = resolve_target(region, vpc_prop.vpc_id, declared.target, dry_run)
+        config = VPCDeclaration.config(declared, target_id)
+        if not config:
+            return f'unchanged {label}'
+        current = VPCTagConfig(vpc_prop.tags)
+        change = (f'{label} target {current.target} -> {config.target}, '
+                  f'enrollment {current.tags.get(VPCTagConfig.T_ENROLLMENT)} -> {declared.enrollment}')
+        if dry_run:
+            return f'would change {change}'
+        Ec2ApiClient.set_vpc_config(region=region, vpc_id=vpc_prop.vpc_id, config=config)
+        return f'changed {change}'
+    except Exception as e:
+        logging.exception(f'Failed to configure {label}')
+        return f'FAILED {label}: {e}'
+
+
+def apply(path: str, region: str, dry_run: bool = False, max_workers: int = 8) -> bool:
+    """ brings every VPC matched by the declaration file to its declared config, returns False on any failure """
+    declaration = VPCDeclaration.load(path)
+    with Metrics.phase(Metrics.VPC_LISTING):
+        declared = declaration.declared(Ec2ApiClient.list_vpcs(region=region))
+    logging.info(f'{len(declared)} VPCs declared in {path}')
+    if not declared:
+        return True
+    with Metrics.phase(Metrics.WRITE), ThreadPoolExecutor(max_workers=max_workers) as pool:
+        lines = list(pool.map(lambda x: apply_vpc_config(x, region, dry_run), declared))
+    for line in lines:
+        print(line)
+    if not dry_run:
+        Ec2ApiClient.list_mirror_targets(region=region, refresh=True)
+    return not any(line.startswith('FAILED') for line in lines)
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Configure the VPCs that should be tapped')
+    parser.add_argument('--apply', default=None,
+                        help='yaml or json file declaring the target and enrollment mode of VPCs, '
+                             'only differences are applied')
+    parser.add_argument('--dry-run', action='store_true', help='with --apply, print the changes only')
+    parser.add_argument('--concurrency', type=int, default=8, help='VPCs configured in parallel (default 8)')
+    parser.add_argument('--region', default=None, help='default: the current region')
+    Metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    return args
+
+
+def main(argv: List[str] = None) -> None:
+    args = parse_args(argv)
     logging.getLogger().setLevel(logging.INFO)
-    region = Ec2ApiClient.get_region()
+    Metrics.setup(args)
+    region = args.region or Ec2ApiClient.get_region()
+    if args.apply:
+        ok = apply(args.apply, region, dry_run=args.dry_run, max_workers=args.concurrency)
+        Metrics.write(args)
+        if not ok:
+            raise SystemExit(1)
+        return
     for vpc_prop in Ec2ApiClient.list_vpcs(region=region):  # type: VPC_Props
         prompt_vpc_config(vpc_prop, region)
+    Metrics.write(args)
 
 
 if __name__ == '__main__':
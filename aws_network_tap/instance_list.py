@@ -0,0 +1,107 @@
+"""
+Shared command line for the blacklist and whitelist tools.
+Instance ids come from the interactive prompt, or in batch from --ids, a file or stdin, or a tag selector.
+"""
+import argparse
+import logging
+import re
+import sys
+from typing import IO, List, Set
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient
+from aws_network_tap.models.metrics import Metrics
+
+INSTANCE_ID = re.compile(r'i-[0-9a-f]+')
+
+
+def read_ids(stream: IO[str]) -> List[str]:
+    """ instance ids separated by commas or whitespace, `#` starts a comment """
+    ids = []  # type: List[str]
+    for line in stream:
+        ids.extend(x for x in re.split(r'[\s,]+', line.split('#')[0]) if x)
+    return ids
+
+
+def parse_args(name: str, argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=f'Add instances to or remove them from the {name}. Without --ids, --file or --selector '
+                    f'the instance ids are prompted for.'
+    )
+    parser.add_argument('--remove', action='store_true', help=f'remove the instances from the {name}')
+    parser.add_argument('--ids', default=None, help='comma separated instance ids')
+    parser.add_argument('--file', default=None, help='file of instance ids, `-` for stdin')
+    parser.add_argument('--selector', default=None,
+                        help='instances carrying a tag, as Key=Value, or Key for any value')
+    parser.add_argument('--region', default=None, help='default: the current region')
+    parser.add_argument('--concurrency', type=int, default=8, help='parallel tagging calls (default 8)')
+    Metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    return args
+
+
+def select_ids(args: argparse.Namespace, region: str) -> Set[str]:
+    ids = set()  # type: Set[str]
+    if args.ids:
+        ids.update(x.strip() for x in args.ids.split(',') if x.strip())
+    if args.file == '-':
+        ids.update(read_ids(sys.stdin))
+    elif args.file:
+        with open(args.file) as f:
+            ids.update(read_ids(f))
+    if args.selector:
+        key, _, value = args.selector.partition('=')
+        with Metrics.phase(Metrics.DISCOVERY):
+            ids.update(Ec2ApiClient.find_instances(
+                region=region, key=key, value=value if '=' in args.selector else None
+            ))
+    return ids
+
+
+def update(region: str, tag: str, name: str, instance_ids: Set[str], enabled: bool, max_workers: int = 8) -> bool:
+    """ returns False when any instance failed """
+    invalid = {x for x in instance_ids if not INSTANCE_ID.fullmatch(x)}
+    for instance_id in sorted(invalid):
+        print(f'FAILED {instance_id}: not an instance id')
+    valid = sorted(instance_ids - invalid)
+    with Metrics.phase(Metrics.WRITE):
+        failures = Ec2ApiClient.tag_instances(
+            region=region, instance_ids=valid, tag=tag, enabled=enabled, max_workers=max_workers
+        ) if valid else {}
+    for instance_id, error in sorted(failures.items()):
+        print(f'FAILED {instance_id}: {error}')
+    logging.info(f'{name.capitalize()} config updated: {len(valid) - len(failures)} instances '
+                 f'{"added" if enabled else "removed"}, {len(failures) + len(invalid)} failed')
+    return not failures and not invalid
+
+
+def main(tag: str, name: str, argv: List[str] = None) -> None:
+    args = parse_args(name, argv)
+    logging.getLogger().setLevel(logging.INFO)
+    Metrics.setup(args)
+    region = args.region or Ec2ApiClient.get_region()
+    if not (args.ids or args.file or args.selector):
+        interactive(region, tag, name)
+        Metrics.write(args)
+        return
+    ok = update(region, tag, name, select_ids(args, region), enabled=not args.remove, max_workers=args.concurrency)
+    print(f"Current {name.capitalize()}: {sorted(Ec2ApiClient.get_instances_by_tag(region=region, tag=tag))}")
+    Metrics.write(args)
+    if not ok:
+        raise SystemExit(1)
+
+
+def prompt(name: str, enabled: bool) -> Set[str]:
+    mode = 'ADD TO' if enabled else 'REMOVE FROM'
+    pasted_input = input(f"Enter instance_id (or comma separated list of instance_ids) {mode} {name}: ")
+    return {x.strip() for x in pasted_input.split(',') if x.strip()}
+
+
+def interactive(region: str, tag: str, name: str) -> None:
+    instance_ids = prompt(name, enabled=True)
+    if instance_ids:
+        update(region, tag, name, instance_ids, enabled=True)
+    print(f"Current {name.capitalize()}: {sorted(Ec2ApiClient.get_instances_by_tag(region=region, tag=tag))}")
+    instance_ids = prompt(name, enabled=False)
+    if instance_ids:
+        update(region, tag, name, instance_ids, enabled=False)
@@ -0,0 +1,79 @@
+"""
+AWS Lambda entry point for session_mirror_tap.
+
+A scheduled invocation reconciles every configured VPC, like the command line tool.
+An invocation carrying EC2 state-change events, directly from EventBridge or as SQS/SNS records,
+reconciles only the affected instances.
+
+Options are the command line flags, read from the SESSION_MIRROR_TAP_ARGS environment variable.
+Importing this module is cheap: the tapper is imported on the first invocation and boto3 with the first client,
+and both are kept with their clients and caches for the warm invocations that follow.
+"""
+import os
+import shlex
+import tempfile
+from typing import Any, Dict, List
+
+ARGS_ENV = 'SESSION_MIRROR_TAP_ARGS'
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'aws_network_tap')  # /tmp is the only writable path in Lambda
+
+_args = None  # type: Any
+_config_cache = None  # type: Any
+
+
+def _setup() -> Any:
+    global _args, _config_cache
+    if _args is None:
+        from aws_network_tap import tap
+        from aws_network_tap.models.event_reconciler import VPCConfigCache
+        from aws_network_tap.models.nitro_catalog import NitroCatalog
+        args = tap.parse_args(shlex.split(os.environ.get(ARGS_ENV, '')))
+        if not args.filter_cache:
+            args.filter_cache = os.path.join(CACHE_DIR, 'filters.json')
+        tap.setup(args)
+        NitroCatalog.cache_dir = CACHE_DIR
+        _config_cache = VPCConfigCache()
+        _args = args
+    return _args
+
+
+def instance_events(event: Dict[str, Any]) -> List[Any]:
+    """ the EC2 state-change events of an invocation, [] for a scheduled one """
+    from aws_network_tap.models.event_source import parse_event
+    bodies = [x.get('body') or x.get('Sns') for x in event.get('Records', [])] if 'Records' in event else [event]
+    events = []
+    for body in bodies:
+        try:
+            parsed = parse_event(body) if body else None
+        except ValueError:
+            parsed = None
+        if parsed:
+            events.append(parsed)
+    return events
+
+
+def handler(event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+    args = _setup()
+    from aws_network_tap import tap
+    events = instance_events(event or {})
+    if events:
+        from aws_network_tap.models.event_reconciler import EventReconciler
+        from aws_network_tap.models.session_executor import SessionExecutor
+        executor = SessionExecutor(max_workers=args.concurrency)
+        reconciler = EventReconciler(
+            default_region=tap.resolve_regions(args.regions)[0], executor=executor, config_cache=_config_cache,
+            plan_only=args.plan_only,
+        )
+        plan = reconciler.reconcile(events)  # raises, so the batch is redelivered
+        if args.plan_only:
+            tap.print_plan(plan)
+        return {'events': len(events), 'planned': plan.counts(), 'writes': executor.report.counts}
+    from aws_network_tap.models.run_summary import RunSummary
+    from aws_network_tap.models.sap_filter import SapFilter
+    SapFilter.clear()  # a warm container would otherwise keep filter ids deleted or profiles edited since
+    summary = RunSummary()
+    summary.extend(tap.tap_regions(tap.resolve_regions(args.regions), args))
+    lines = list(summary.lines())
+    for line in lines:
+        print(line)
+    return {'failed': summary.failed, 'summary': lines}
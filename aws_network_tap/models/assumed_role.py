@@ -0,0 +1,65 @@
+from typing import Dict, List, TYPE_CHECKING
+from aws_network_tap.constants import VENDOR
+from aws_network_tap.models.client_pool import ClientPool
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
+
+class AssumedRole:
+    """
+    boto3 session for a role in another account.
+    botocore refreshes the credentials ahead of their expiry, so long runs never see them lapse.
+    """
+    SESSION_NAME = VENDOR + 'SessionMirrorTap'
+    DURATION = 3600
+
+    def __init__(self, role_arn: str, external_id: str = None, duration: int = DURATION) -> None:
+        if not role_arn.startswith('arn:') or ':role/' not in role_arn:
+            raise ValueError(f'invalid role arn `{role_arn}`')
+        self.role_arn = role_arn
+        self.external_id = external_id
+        self.duration = duration
+
+    def _fetch(self) -> Dict[str, str]:
+        kwargs = {
+            'RoleArn': self.role_arn,
+            'RoleSessionName': self.SESSION_NAME,
+            'DurationSeconds': self.duration,
+        }
+        if self.external_id:
+            kwargs['ExternalId'] = self.external_id
+        # always assume from the base credentials, never from another assumed role
+        sts = ClientPool.client('sts', credentials=ClientPool.DEFAULT_CREDENTIALS)
+        credentials = sts.assume_role(**kwargs)['Credentials']
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat(),
+        }
+
+    def session(self) -> 'boto3.Session':
+        import boto3  # type: ignore
+        from botocore.credentials import RefreshableCredentials  # type: ignore
+        from botocore.session import get_session  # type: ignore
+        credentials = RefreshableCredentials.create_from_metadata(
+            metadata=self._fetch(),
+            refresh_using=self._fetch,
+            method='sts-assume-role',
+        )
+        botocore_session = get_session()
+        botocore_session._credentials = credentials
+        return boto3.Session(botocore_session=botocore_session)
+
+    def register(self) -> None:
+        """ make this role the credential set used by every pooled client in this process """
+        ClientPool.add_session(self.role_arn, self.session())
+        ClientPool.credentials = self.role_arn
+
+    @staticmethod
+    def read_roles(path: str) -> List[str]:
+        """ one role arn per line, blank lines and # comments are ignored """
+        with open(path) as f:
+            lines = [x.split('#', 1)[0].strip() for x in f]
+        return [x for x in lines if x]
@@ -0,0 +1,123 @@
+"""
+Process wide pool of boto3 sessions and clients.
+Clients are thread safe once built, so one client per (service, region, credentials) is shared by every caller,
+which saves client construction and TLS handshakes on each call.
+"""
+import importlib.util
+import threading
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+from aws_network_tap.models.metrics import Metrics
+from aws_network_tap.models.rate_governor import RateGovernor
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+    from botocore.config import Config  # type: ignore  # noqa: F401
+
+
+class ClientPool:
+    DEFAULT_CREDENTIALS = 'default'
+
+    # tunable botocore settings, see configure()
+    options = {
+        'max_pool_connections': 50,
+        'connect_timeout': 10,
+        'read_timeout': 60,
+        'tcp_keepalive': True,
+        'retry_mode': 'standard',
+        'max_attempts': 5,
+    }  # type: Dict[str, Any]
+
+    credentials = DEFAULT_CREDENTIALS  # credential set used when none is named
+    governor = None  # type: Optional[RateGovernor]
+    GOVERNED_SERVICES = ['ec2']
+    _sessions = {}  # type: Dict[str, boto3.Session]
+    _clients = {}  # type: Dict[Tuple[str, str, str], boto3.client]
+    _accounts = {}  # type: Dict[str, str]
+    _lock = threading.RLock()  # boto3 sessions are not thread safe while building clients
+
+    @classmethod
+    def configure(cls, **options: Any) -> None:
+        """ change the botocore settings; clients built with the old settings are dropped """
+        unknown = set(options) - set(cls.options)
+        if unknown:
+            raise ValueError(f'unknown client options {sorted(unknown)}')
+        with cls._lock:
+            cls.options = dict(cls.options, **options)
+            cls._clients.clear()
+
+    @classmethod
+    def govern(cls, governor: Optional[RateGovernor]) -> None:
+        """ rate limit the governed services; clients built before are dropped """
+        with cls._lock:
+            cls.governor = governor
+            cls._clients.clear()
+
+    @classmethod
+    def config(cls) -> 'Config':
+        from botocore.config import Config  # boto3 is imported on the first client, not by importing the tool
+        kwargs = {
+            'max_pool_connections': cls.options['max_pool_connections'],
+            'connect_timeout': cls.options['connect_timeout'],
+            'read_timeout': cls.options['read_timeout'],
+        }
+        retries = {'max_attempts': cls.options['max_attempts']}  # type: Dict[str, Any]
+        # older botocore releases do not know about keep-alive or retry modes
+        if 'tcp_keepalive' in Config.OPTION_DEFAULTS:
+            kwargs['tcp_keepalive'] = cls.options['tcp_keepalive']
+        if importlib.util.find_spec('botocore.retries'):
+            retries['mode'] = cls.options['retry_mode']
+        return Config(retries=retries, **kwargs)
+
+    @classmethod
+    def add_session(cls, credentials: str, session: 'boto3.Session') -> None:
+        """ register a named credential set, such as an assumed role """
+        with cls._lock:
+            cls._sessions[credentials] = session
+            for key in [x for x in cls._clients if x[2] == credentials]:
+                del cls._clients[key]
+            cls._accounts.pop(credentials, None)
+
+    @classmethod
+    def session(cls, credentials: str = None) -> 'boto3.Session':
+        credentials = credentials or cls.credentials
+        with cls._lock:
+            if credentials not in cls._sessions:
+                if credentials != cls.DEFAULT_CREDENTIALS:
+                    raise KeyError(f'unknown credentials `{credentials}`')
+                import boto3  # type: ignore
+                cls._sessions[credentials] = boto3.Session()
+            return cls._sessions[credentials]
+
+    @classmethod
+    def client(cls, service: str, region: str = None, credentials: str = None) -> 'boto3.client':
+        credentials = credentials or cls.credentials
+        key = (service, region or '', credentials)
+        client = cls._clients.get(key)
+        if client:
+            return client
+        with cls._lock:
+            if key not in cls._clients:
+                client = cls.session(credentials).client(service, region_name=region, config=cls.config())
+                Metrics.attach(client)
+                if cls.governor and service in cls.GOVERNED_SERVICES:
+                    cls.governor.attach(client, RateGovernor.key(cls.account_id(credentials), region or ''))
+                cls._clients[key] = client
+            return cls._clients[key]
+
+    @classmethod
+    def account_id(cls, credentials: str = None) -> str:
+        """ the caller identity is resolved once per credential set """
+        credentials = credentials or cls.credentials
+        if credentials not in cls._accounts:
+            who = cls.client('sts', credentials=credentials).get_caller_identity()
+            cls._accounts[credentials] = who["Account"]
+        return cls._accounts[credentials]
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._sessions.clear()
+            cls._clients.clear()
+            cls._accounts.clear()
+            cls.credentials = cls.DEFAULT_CREDENTIALS
+            cls.governor = None
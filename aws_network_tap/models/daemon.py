@@ -0,0 +1,79 @@
+"""
+Scheduling and liveness for the long running session_mirror_tap --daemon mode.
+"""
+import json
+import os
+import random
+import time
+from typing import Callable, Dict, Tuple, Union
+
+
+class ResyncScheduler:
+    """
+    Frequent cheap incremental passes and a less frequent full resync, each on its own jittered interval,
+    so a fleet of daemons does not hit the API in lockstep.
+    """
+
+    def __init__(self, incremental_interval: float, full_interval: float, jitter: float = 0.1,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if not 0 <= jitter < 1:
+            raise ValueError('jitter must be a fraction between 0 and 1')
+        self.incremental_interval = incremental_interval
+        self.full_interval = full_interval
+        self.jitter = jitter
+        self.clock = clock
+        now = clock()
+        self.next_incremental = now
+        self.next_full = now  # the first pass is always a full resync
+
+    def _jittered(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def next_pass(self) -> Tuple[float, bool]:
+        """ returns (seconds until the next pass, whether it is a full resync) """
+        due = min(self.next_incremental, self.next_full)
+        return max(due - self.clock(), 0.0), self.next_full <= self.next_incremental
+
+    def completed(self, full: bool) -> None:
+        now = self.clock()
+        self.next_incremental = now + self._jittered(self.incremental_interval)
+        if full:
+            self.next_full = now + self._jittered(self.full_interval)
+
+
+class Liveness:
+    """ json status file for liveness probes; stale `updated` means the daemon is wedged """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+        self.status = {
+            'pid': os.getpid(),
+            'started': time.time(),
+            'state': 'starting',
+            'passes': 0,
+            'last_pass': None,
+            'last_full_sync': None,
+            'last_error': None,
+        }  # type: Dict[str, Union[str, int, float, None]]
+
+    def update(self, **status: Union[str, int, float, None]) -> None:
+        self.status.update(status)
+        self.status['updated'] = time.time()
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.status, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def completed(self, full: bool, seconds: float, error: str = None) -> None:
+        now = time.time()
+        passes = self.status['passes']
+        self.update(
+            state='idle',
+            passes=(passes if isinstance(passes, int) else 0) + 1,
+            last_pass=now,
+            last_pass_seconds=seconds,
+            last_error=error,
+            **({'last_full_sync': now} if full else {})
+        )
@@ -2,14 +2,19 @@
 
 from collections import namedtuple
 import logging
-from typing import Iterable, List, Union, Dict
-import boto3  # type: ignore
-from ec2_metadata import ec2_metadata  # type: ignore
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Set, Union, Dict, TYPE_CHECKING
 from aws_network_tap.models.aws_tag import AWSTag
+from aws_network_tap.models.client_pool import ClientPool
 from aws_network_tap.models.tag_config import VPCTagConfig, EC2Config
 from aws_network_tap.constants import VENDOR
 
-ENI_Tag = namedtuple("ENI_Tag", "instance_id interface_id tags state")
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
+ENI_Tag = namedtuple("ENI_Tag", "instance_id interface_id tags state vpc_id az")
+ENI_Tag.__new__.__defaults__ = (None, None)  # vpc_id, az
 VPC_Props = namedtuple("VPC_Props", "vpc_id name tags")
 Subnet_Props = namedtuple("Subnet_Props", "subnet_id name arn az")
 Mirror_Target_Props = namedtuple("Mirror_Target_Props", "target_id name type vpc_id vpc_bound")
@@ -21,10 +26,13 @@ class Ec2ApiClient:
     STATE_RUNNING = "running"
     STATE_STOPPED = 'stopped'
 
+    FILTER_VALUES_MAX = 200  # describe_* filters accept a bounded number of values
+    TAG_RESOURCES_MAX = 200  # instances per create_tags/delete_tags call
+    REGION_ENV = ['AWS_REGION', 'AWS_DEFAULT_REGION']  # set in Lambda and most containers
+
     def __init__(self, account_number: str = None, region: str = None, vpc_ids: List[str] = None):
         if not account_number:
-            who = boto3.client("sts").get_caller_identity()
-            account_number = who["Account"]
+            account_number = ClientPool.account_id()
         self.account_number = account_number
         if not region:
             region = self.get_region()
@@ -32,9 +40,17 @@ class Ec2ApiClient:
         self.ec2_client = self._get_client(self.region)
         self.vpc_ids = vpc_ids
 
+    @classmethod
+    def __get_region_env(cls) -> Union[str, None]:
+        for key in cls.REGION_ENV:
+            if os.environ.get(key):
+                return os.environ[key]
+        return None
+
     @classmethod
     def __get_region_ec2(cls) -> Union[str, None]:
         try:
+            from ec2_metadata import ec2_metadata  # type: ignore  # imported late, it probes IMDS off EC2
             return ec2_metadata.region
         except:
             return None
@@ -42,7 +58,7 @@ class Ec2ApiClient:
     @classmethod
     def __get_region_aws_config(cls) -> Union[str, None]:
         try:
-            return boto3.Session().region_name
+            return ClientPool.session().region_name
         except:
             return None
 
@@ -50,7 +66,9 @@ class Ec2ApiClient:
     def get_region(cls) -> str:
         REGION_KEY = 'region'
         if not cls.cache.get(REGION_KEY):
-            region = cls.__get_region_ec2()
+            region = cls.__get_region_env()
+            if not region:
+                region = cls.__get_region_ec2()
             if not region:
                 region = cls.__get_region_aws_config()
             if not region:
@@ -59,15 +77,20 @@ class Ec2ApiClient:
         return cls.cache[REGION_KEY]
 
     @classmethod
-    def _get_client(cls, region: str) -> boto3.client:
-        return boto3.client("ec2", region_name=region)
+    def _get_client(cls, region: str) -> 'boto3.client':
+        return ClientPool.client("ec2", region=region)
 
     @classmethod
-    def list_vpcs(cls, region: str) -> Iterable[VPC_Props]:
-        vpcs = cls._get_client(region=region).describe_vpcs()
-        for vpc in vpcs["Vpcs"]:
-            tags = AWSTag.to_dict(vpc.get(AWSTag.TAGS_KEY))
-            yield VPC_Props(vpc["VpcId"], tags.get(AWSTag.NAME_KEY), tags)
+    def list_vpcs(cls, region: str, configured_only: bool = False) -> Iterable[VPC_Props]:
+        """ configured_only fetches just the VPCs carrying a mirroring target tag """
+        kwargs = {}
+        if configured_only:
+            kwargs['Filters'] = [{"Name": "tag-key", "Values": [VPCTagConfig.T_TARGET]}]
+        paginator = cls._get_client(region=region).get_paginator("describe_vpcs")
+        for page in paginator.paginate(**kwargs):
+            for vpc in page["Vpcs"]:
+                tags = AWSTag.to_dict(vpc.get(AWSTag.TAGS_KEY))
+                yield VPC_Props(vpc["VpcId"], tags.get(AWSTag.NAME_KEY), tags)
 
     def list_subnets(self) -> Iterable[Subnet_Props]:
         subnets = self.ec2_client.describe_subnets(
@@ -81,40 +104,87 @@ class Ec2ApiClient:
     TARGET_NIC = "network-interface"
     TARGET_NLB = 'network-load-balancer'
 
+    LB_ARNS_MAX = 20  # describe_load_balancers accepts at most 20 arns
+
+    mirror_targets = {}  # type: Dict[str, List[Mirror_Target_Props]]  # by region, for the length of a session
+
+    @classmethod
+    def list_mirror_targets(cls, region: str, refresh: bool = False) -> List[Mirror_Target_Props]:
+        """ cached per region, refresh after creating a target """
+        if refresh or region not in cls.mirror_targets:
+            cls.mirror_targets[region] = list(cls._describe_mirror_targets(region=region))
+        return cls.mirror_targets[region]
+
     @classmethod
-    def list_mirror_targets(cls, region: str) -> Iterable[Mirror_Target_Props]:
-        response = cls._get_client(region=region).describe_traffic_mirror_targets()['TrafficMirrorTargets']
-        for target in response:
-            tags = AWSTag.to_dict(target.get(AWSTag.TAGS_KEY))
+    def _describe_interface_vpcs(cls, region: str, interface_ids: List[str]) -> Dict[str, str]:
+        """ interface id to vpc id, in batches """
+        vpcs = {}  # type: Dict[str, str]
+        paginator = cls._get_client(region=region).get_paginator("describe_network_interfaces")
+        for i in range(0, len(interface_ids), cls.FILTER_VALUES_MAX):
+            chunk = interface_ids[i:i + cls.FILTER_VALUES_MAX]
+            # the filter form skips deleted interfaces instead of failing the whole batch
+            for page in paginator.paginate(Filters=[{"Name": "network-interface-id", "Values": chunk}]):
+                for interface in page["NetworkInterfaces"]:
+                    vpcs[interface["NetworkInterfaceId"]] = interface["VpcId"]
+        return vpcs
+
+    @classmethod
+    def _describe_load_balancers(cls, region: str, lb_arns: List[str]) -> Dict[str, Dict]:
+        """ load balancer arn to description, in batches """
+        client = ClientPool.client('elbv2', region=region)
+        lbs = {}  # type: Dict[str, Dict]
+        for i in range(0, len(lb_arns), cls.LB_ARNS_MAX):
+            chunk = lb_arns[i:i + cls.LB_ARNS_MAX]
+            try:
+                response = client.describe_load_balancers(LoadBalancerArns=chunk)['LoadBalancers']
+            except Exception as e:
+                if 'or more load balancers not found' not in str(e):
+                    raise
+                # one deleted NLB fails the whole batch, so retry this batch one arn at a time
+                response = []
+                for lb_arn in chunk:
+                    try:
+                        response.extend(client.describe_load_balancers(LoadBalancerArns=[lb_arn])['LoadBalancers'])
+                    except Exception as e:
+                        if 'or more load balancers not found' not in str(e):
+                            raise
+            for lb in response:
+                lbs[lb['LoadBalancerArn']] = lb
+        return lbs
+
+    @classmethod
+    def _describe_mirror_targets(cls, region: str) -> Iterable[Mirror_Target_Props]:
+        targets = []  # type: List[Dict]
+        paginator = cls._get_client(region=region).get_paginator("describe_traffic_mirror_targets")
+        for page in paginator.paginate():
+            targets.extend(page['TrafficMirrorTargets'])
+        interface_vpcs = cls._describe_interface_vpcs(
+            region=region, interface_ids=[x['NetworkInterfaceId'] for x in targets if x['Type'] == cls.TARGET_NIC]
+        )
+        lbs = cls._describe_load_balancers(
+            region=region, lb_arns=[x['NetworkLoadBalancerArn'] for x in targets if x['Type'] == cls.TARGET_NLB]
+        )
+        for target in targets:
+            tags = AWSTag.to_dict(target.get(AWSTag.TAGS_KEY, []))
+            id = target['TrafficMirrorTargetId']
             # get the VPC_ID
+            vpc_id = None
+            vpc_bound = False
             if target['Type'] == cls.TARGET_NIC:
-                try:
-                    vpc_id = cls._get_client(region=region).describe_network_interfaces(NetworkInterfaceIds=[
-                            target['NetworkInterfaceId'],
-                    ])["NetworkInterfaces"][0]["VpcId"]
-                    vpc_bound = True
-                except Exception as e:
-                    if 'does not exist' in str(e):
-                        id = target['TrafficMirrorTargetId']
-                        logging.warning(f'Invalid Instance Session Mirroring Target `{id}`, delete manually.')
-                        continue
+                if target['NetworkInterfaceId'] not in interface_vpcs:
+                    logging.warning(f'Invalid Instance Session Mirroring Target `{id}`, delete manually.')
+                    continue
+                vpc_id = interface_vpcs[target['NetworkInterfaceId']]
+                vpc_bound = True
             if target['Type'] == cls.TARGET_NLB:
-                try:
-                    lb = boto3.client('elbv2', region_name=region).describe_load_balancers(
-                        LoadBalancerArns=[
-                            target['NetworkLoadBalancerArn']
-                        ],
-                    )['LoadBalancers'][0]
-                except Exception as e:
-                    if 'or more load balancers not found' in str(e):
-                        id = target['TrafficMirrorTargetId']
-                        logging.warning(f'Invalid NLB Session Mirroring Target `{id}`, delete manually.')
-                        continue
-                    raise
+                lb = lbs.get(target['NetworkLoadBalancerArn'])
+                if not lb:
+                    logging.warning(f'Invalid NLB Session Mirroring Target `{id}`, delete manually.')
+                    continue
                 vpc_id = lb["VpcId"]
-                vpc_bound = True if lb.get("Schema") == "internal" else False
+                vpc_bound = True if lb.get("Scheme") == "internal" else False
             yield Mirror_Target_Props(
-                target['TrafficMirrorTargetId'],
+                id,
                 tags.get(AWSTag.NAME_KEY),
                 target['Type'],
                 vpc_id,
@@ -131,39 +201,88 @@ class Ec2ApiClient:
             client.delete_tags(Tags=config.get_aws_tags(), Resources=[vpc_id])
 
     @classmethod
-    def blacklist_instance(cls, region: str, instance_id: str, enabled: bool) -> None:
-        """ enables/disables instances being blacklisted from tapping """
+    def tag_instances(cls, region: str, instance_ids: List[str], tag: str, enabled: bool,
+                      max_workers: int = 8) -> Dict[str, str]:
+        """
+        sets or removes EC2Config.T_WHITELIST or T_BLACKLIST on many instances, in parallel multi-resource calls.
+        A failing call is retried one instance at a time, returns the error of each instance that failed.
+        """
+        if tag not in EC2Config.LIST_TAGS:
+            raise ValueError('only specific tags are supported')
         client = cls._get_client(region=region)
         config = EC2Config()
-        config.blacklist = enabled
-        if config.blacklist:
-            client.create_tags(Tags=config.get_aws_tags(), Resources=[instance_id])
-        else:
-            client.delete_tags(Tags=config.get_aws_tags(), Resources=[instance_id])
+        setattr(config, 'blacklist' if tag == EC2Config.T_BLACKLIST else 'whitelist', enabled)
+        tags = config.get_aws_tags()
+        call = client.create_tags if enabled else client.delete_tags
+
+        def tag_chunk(chunk: List[str]) -> Dict[str, str]:
+            try:
+                call(Tags=tags, Resources=chunk)
+                return {}
+            except Exception as e:
+                if len(chunk) == 1:
+                    return {chunk[0]: str(e)}
+            errors = {}
+            for instance_id in chunk:  # one bad id fails the whole call, find it
+                try:
+                    call(Tags=tags, Resources=[instance_id])
+                except Exception as e:
+                    errors[instance_id] = str(e)
+            return errors
+
+        instance_ids = sorted(set(instance_ids))
+        chunks = [
+            instance_ids[i:i + cls.TAG_RESOURCES_MAX] for i in range(0, len(instance_ids), cls.TAG_RESOURCES_MAX)
+        ]
+        failures = {}  # type: Dict[str, str]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for errors in pool.map(tag_chunk, chunks):
+                failures.update(errors)
+        return failures
 
     @classmethod
-    def whitelist_instance(cls, region: str, instance_id: str, enabled: bool) -> None:
-        """ enables/disables instances being whitelisted to tapping """
-        client = cls._get_client(region=region)
-        config = EC2Config()
-        config.whitelist = enabled
-        if config.whitelist:
-            client.create_tags(Tags=config.get_aws_tags(), Resources=[instance_id])
+    def find_instances(cls, region: str, key: str, value: str = None) -> Set[str]:
+        """ ids of the instances carrying a tag, with any value when value is not given """
+        if value is None:
+            filters = [{"Name": "tag-key", "Values": [key]}]
         else:
-            client.delete_tags(Tags=config.get_aws_tags(), Resources=[instance_id])
+            filters = [{"Name": f"tag:{key}", "Values": [value]}]
+        instance_ids = set()  # type: Set[str]
+        paginator = cls._get_client(region=region).get_paginator("describe_instances")
+        for page in paginator.paginate(Filters=filters):
+            for reservation in page["Reservations"]:
+                instance_ids.update(x["InstanceId"] for x in reservation["Instances"])
+        return instance_ids
 
     @classmethod
-    def get_instances_by_tag(cls, region: str, tag: str) -> List[str]:
+    def get_instances_by_tag(cls, region: str, tag: str) -> Set[str]:
         """ Tag should be EC2Config.T_WHITELIST or T_BLACKLIST """
-        # TODO paginate this
-        if tag not in EC2Config.TAGS:
+        if tag not in EC2Config.LIST_TAGS:
             raise ValueError('only specific tags are supported')
-        response = cls._get_client(region=region).describe_tags(Filters=[
+        instance_ids = set()  # type: Set[str]
+        paginator = cls._get_client(region=region).get_paginator("describe_tags")
+        for page in paginator.paginate(Filters=[
             {
                 'Name': 'tag:' + tag,
                 'Values': [
                     EC2Config.V_TRUE,
                 ]
             },
-        ])['Tags']
-        return [x['ResourceId'] for x in response]
+            {
+                'Name': 'resource-type',
+                'Values': ['instance'],
+            },
+        ]):
+            instance_ids.update(x['ResourceId'] for x in page['Tags'])
+        return instance_ids
+
+    @classmethod
+    def list_regions(cls, region: str) -> List[str]:
+        """ regions enabled for the account """
+        response = cls._get_client(region=region).describe_regions(Filters=[
+            {
+                'Name': 'opt-in-status',
+                'Values': ['opt-in-not-required', 'opted-in'],
+            },
+        ])['Regions']
+        return sorted(x['RegionName'] for x in response)
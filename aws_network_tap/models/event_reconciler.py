@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient, VPC_Props
+from aws_network_tap.models.event_source import EventCoalescer, Instance_Event
+from aws_network_tap.models.mirror_plan import MirrorPlan
+from aws_network_tap.models.session_executor import SessionExecutor
+from aws_network_tap.models.session_index import SessionIndex
+from aws_network_tap.models.spile import Spile
+from aws_network_tap.models.spile_tapper import SpileTapper
+from aws_network_tap.models.tag_config import VPCTagConfig
+
+
+class VPCConfigCache:
+    """ VPCTagConfig of the configured VPCs per region, refreshed after ttl seconds """
+
+    def __init__(self, ttl: float = 300) -> None:
+        self.ttl = ttl
+        self._configs = {}  # type: Dict[str, Tuple[float, Dict[str, VPCTagConfig]]]
+        self._lock = threading.Lock()
+
+    def configs(self, region: str) -> Dict[str, VPCTagConfig]:
+        with self._lock:
+            loaded, configs = self._configs.get(region, (0.0, {}))
+            if time.monotonic() - loaded > self.ttl:
+                configs = {
+                    vpc_prop.vpc_id: VPCTagConfig(vpc_prop.tags)
+                    for vpc_prop in Ec2ApiClient.list_vpcs(region=region, configured_only=True)  # type: VPC_Props
+                }
+                self._configs[region] = (time.monotonic(), configs)
+            return configs
+
+    def get(self, region: str, vpc_id: str) -> VPCTagConfig:
+        return self.configs(region).get(vpc_id) or VPCTagConfig()
+
+
+class EventReconciler:
+    """
+    Reconciles only the ENIs of the instances named by state-change events, with the same plan logic as a sweep.
+    """
+
+    def __init__(self, default_region: str, executor: SessionExecutor, config_cache: VPCConfigCache = None,
+                 plan_only: bool = False) -> None:
+        self.default_region = default_region
+        self.executor = executor
+        self.config_cache = config_cache or VPCConfigCache()
+        self.plan_only = plan_only  # neither filters nor sessions are written
+
+    def reconcile(self, events: List[Instance_Event]) -> MirrorPlan:
+        plan = MirrorPlan()
+        by_region = {}  # type: Dict[str, List[str]]
+        for instance_id, event in EventCoalescer.latest(events).items():
+            by_region.setdefault(event.region or self.default_region, []).append(instance_id)
+        for region, instance_ids in by_region.items():
+            plan.extend(self.plan_instances(region, instance_ids))
+        logging.info(f'Reconciling {len(events)} events for {sum(len(x) for x in by_region.values())} instances: '
+                     f'{plan.counts()}')
+        if not self.plan_only:
+            self.executor.run(plan)
+        return plan
+
+    def plan_instances(self, region: str, instance_ids: List[str]) -> MirrorPlan:
+        plan = MirrorPlan()
+        tapper = SpileTapper(region=region)
+        by_vpc = {}  # type: Dict[str, List[Spile]]
+        for i in range(0, len(instance_ids), tapper.FILTER_VALUES_MAX):
+            chunk = instance_ids[i:i + tapper.FILTER_VALUES_MAX]
+            for spile in tapper.discover(instance_ids=chunk):  # type: Spile
+                by_vpc.setdefault(spile.eni_tag.vpc_id, []).append(spile)
+        session_index = None  # type: Optional[SessionIndex]
+        for vpc_id, spiles in by_vpc.items():
+            config = self.config_cache.get(region, vpc_id)
+            if not config.enabled:
+                continue
+            if config.pooled and session_index is None:
+                session_index = SessionIndex.build(tapper.ec2_client)  # pool limits count every session
+            if session_index is not None:
+                spiles = [Spile(tapper.ec2_client, x.eni_tag, session_index=session_index) for x in spiles]
+            plan.extend(SpileTapper.plan(
+                region=region, vpc_ids=[vpc_id], config=config, session_index=session_index,
+                install_filter=not self.plan_only, spiles=spiles,
+            ))
+        return plan
@@ -0,0 +1,147 @@
+"""
+Sources of EC2 instance state-change notifications, for reconciling single instances as they launch.
+Sources are pluggable: an SQS queue in AWS, or a JSON-lines file / in-memory queue for local runs and tests.
+"""
+import json
+import logging
+import queue
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from typing import Dict, IO, Iterator, List, Union, TYPE_CHECKING
+from aws_network_tap.models.client_pool import ClientPool
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
+Instance_Event = namedtuple("Instance_Event", "instance_id state region receipt")
+
+DETAIL_TYPE = 'EC2 Instance State-change Notification'
+
+
+def parse_event(body: Union[str, Dict], receipt: str = None) -> Union[Instance_Event, None]:
+    """ an EventBridge state-change event, optionally wrapped in an SNS notification """
+    event = json.loads(body) if isinstance(body, str) else body
+    if 'Message' in event and 'detail' not in event:
+        event = json.loads(event['Message'])
+    if event.get('detail-type') != DETAIL_TYPE:
+        return None
+    detail = event.get('detail', {})
+    if not detail.get('instance-id'):
+        return None
+    return Instance_Event(detail['instance-id'], detail.get('state'), event.get('region'), receipt)
+
+
+class EventSource(ABC):
+    """ receive() returns [] when nothing arrived within the timeout """
+    closed = False
+
+    @abstractmethod
+    def receive(self, timeout: float) -> List[Instance_Event]:
+        pass
+
+    def ack(self, events: List[Instance_Event]) -> None:
+        """ called once the events are reconciled """
+
+
+class MemoryEventSource(EventSource):
+    """ queue of event dicts, put None to close """
+
+    def __init__(self, events: 'queue.Queue[Union[Dict, None]]' = None) -> None:
+        self.events = events if events is not None else queue.Queue()
+
+    def receive(self, timeout: float) -> List[Instance_Event]:
+        try:
+            item = self.events.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return []
+        if item is None:
+            self.closed = True
+            return []
+        event = parse_event(item)
+        return [event] if event else []
+
+
+class JsonLinesEventSource(EventSource):
+    """ one event per line, from a file or stdin; closes at end of input """
+
+    def __init__(self, stream: IO[str]) -> None:
+        self.stream = stream
+
+    def receive(self, timeout: float) -> List[Instance_Event]:
+        line = self.stream.readline()
+        if not line:
+            self.closed = True
+            return []
+        if not line.strip():
+            return []
+        try:
+            event = parse_event(line)
+        except ValueError:
+            logging.warning(f'Ignoring malformed event: {line.strip()}')
+            return []
+        return [event] if event else []
+
+
+class SqsEventSource(EventSource):
+    """ EventBridge rule delivering to SQS; messages are deleted once reconciled """
+    BATCH_MAX = 10
+    WAIT_MAX = 20
+
+    def __init__(self, queue_url: str, region: str = None, sqs_client: 'boto3.client' = None) -> None:
+        self.queue_url = queue_url
+        self.sqs_client = sqs_client or ClientPool.client('sqs', region=region)
+
+    def receive(self, timeout: float) -> List[Instance_Event]:
+        messages = self.sqs_client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=self.BATCH_MAX,
+            WaitTimeSeconds=int(min(max(timeout, 0), self.WAIT_MAX)),
+        ).get('Messages', [])
+        events = []
+        ignored = []
+        for message in messages:
+            try:
+                event = parse_event(message['Body'], receipt=message['ReceiptHandle'])
+            except ValueError:
+                logging.warning(f'Ignoring malformed event: {message["Body"]}')
+                event = None
+            if event:
+                events.append(event)
+            else:
+                ignored.append(Instance_Event(None, None, None, message['ReceiptHandle']))
+        self.ack(ignored)  # never redeliver messages that can not be handled
+        return events
+
+    def ack(self, events: List[Instance_Event]) -> None:
+        receipts = [x.receipt for x in events if x.receipt]
+        for i in range(0, len(receipts), self.BATCH_MAX):
+            self.sqs_client.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+                {'Id': str(n), 'ReceiptHandle': receipt} for n, receipt in enumerate(receipts[i:i + self.BATCH_MAX])
+            ])
+
+
+class EventCoalescer:
+    """
+    Groups events arriving within a short window after the first one, so a burst of launches is one batch.
+    """
+
+    def __init__(self, source: EventSource, window: float = 5.0, poll: float = 20.0) -> None:
+        self.source = source
+        self.window = window
+        self.poll = poll
+
+    def batches(self) -> Iterator[List[Instance_Event]]:
+        while not self.source.closed:
+            events = self.source.receive(timeout=self.poll)
+            if not events:
+                continue
+            deadline = time.monotonic() + self.window
+            while not self.source.closed and time.monotonic() < deadline:
+                events.extend(self.source.receive(timeout=deadline - time.monotonic()))
+            yield events
+
+    @staticmethod
+    def latest(events: List[Instance_Event]) -> Dict[str, Instance_Event]:
+        """ deduplicate, the last event of each instance wins """
+        return {x.instance_id: x for x in events if x.instance_id}
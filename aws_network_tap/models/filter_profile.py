@@ -0,0 +1,170 @@
+"""
+Named Traffic Mirror Filter profiles, to keep bulk traffic (backups, replication, S3) away from the sensors.
+
+    rules_max: 10                  # the account's quota of rules per filter (default 10, the AWS default)
+    profiles:
+      no-bulk:
+        dns: true                  # mirror amazon-dns (default true)
+        protocols: [tcp, udp]      # accepted protocols (default all)
+        reject:                    # evaluated before the accepts
+          - cidr: 52.216.0.0/15    # the remote side of the traffic (default any)
+            protocol: tcp
+            ports: 443             # remote ports, a number or `from-to`
+          - local_ports: 5432-5433 # ports on the mirrored instance
+            protocol: tcp
+            direction: egress      # ingress, egress or both (default)
+
+The `default` profile mirrors everything, and is the filter installed before profiles existed.
+A VPC picks a profile with its VPCTagConfig.T_FILTER_PROFILE tag, and an instance may override it.
+"""
+import json
+from collections import namedtuple
+from typing import Any, Dict, List, Tuple, Union
+from aws_network_tap.constants import VENDOR
+
+Filter_Rule = namedtuple(
+    "Filter_Rule", "direction number action protocol source_cidr destination_cidr source_ports destination_ports"
+)  # ports are (from, to) or None, protocol None is any
+
+Rule_Changes = namedtuple("Rule_Changes", "create modify delete")  # new rules, (rule id, rule) pairs, rule ids
+
+
+class FilterProfile:
+    DEFAULT = 'default'
+    INGRESS = 'ingress'
+    EGRESS = 'egress'
+    DIRECTIONS = [INGRESS, EGRESS]
+    ANY_CIDRS = ['0.0.0.0/0', '::/0']
+    PROTOCOLS = {'tcp': 6, 'udp': 17, 'icmp': 1, 'icmpv6': 58}
+    PORT_PROTOCOLS = [6, 17]
+    REJECT_NUMBER_MAX = 99  # rejects are numbered from 1, accepts from 100, lower numbers are evaluated first
+    ACCEPT_NUMBER_START = 100
+    ACCEPT_NUMBER_STEP = 10
+    RULES_MAX = 10  # AWS default quota of rules per filter, both directions together
+
+    def __init__(self, name: str, reject: List[Dict[str, Any]] = None, protocols: List[str] = None,
+                 dns: bool = True, rules_max: int = RULES_MAX) -> None:
+        self.name = name
+        self.reject = reject or []
+        self.protocols = [self.protocol(x) for x in protocols or []]
+        self.dns = dns
+        rules = self.rules()  # validate, so a profile over the quota never leaves a half built filter
+        if len(rules) > rules_max:
+            raise ValueError(f'{self.name}: {len(rules)} filter rules, over the quota of {rules_max} per filter')
+
+    @classmethod
+    def default(cls) -> 'FilterProfile':
+        return cls(cls.DEFAULT)
+
+    @classmethod
+    def load(cls, path: str) -> Dict[str, 'FilterProfile']:
+        import yaml  # type: ignore
+        with open(path) as f:
+            document = json.load(f) if path.endswith('.json') else yaml.safe_load(f)
+        document = document or {}
+        rules_max = int(document.get('rules_max') or cls.RULES_MAX)
+        profiles = {}  # type: Dict[str, FilterProfile]
+        for name, spec in (document.get('profiles') or {}).items():
+            if name == cls.DEFAULT:
+                raise ValueError(f'{path}: the {cls.DEFAULT} profile can not be redefined')
+            spec = spec or {}
+            profiles[name] = cls(name, spec.get('reject'), spec.get('protocols'), spec.get('dns', True), rules_max)
+        return profiles
+
+    @classmethod
+    def protocol(cls, value: Union[str, int, None]) -> Union[int, None]:
+        if value is None or value == 'all':
+            return None
+        if isinstance(value, int):
+            return value
+        if value.lower() not in cls.PROTOCOLS:
+            raise ValueError(f'unknown protocol {value}')
+        return cls.PROTOCOLS[value.lower()]
+
+    @staticmethod
+    def ports(value: Union[str, int, None]) -> Union[Tuple[int, int], None]:
+        if value is None:
+            return None
+        low, _, high = str(value).partition('-')
+        return int(low), int(high or low)
+
+    def _reject_rules(self, direction: str, entry: Dict[str, Any]) -> List[Filter_Rule]:
+        protocol = self.protocol(entry.get('protocol'))
+        remote_ports, local_ports = self.ports(entry.get('ports')), self.ports(entry.get('local_ports'))
+        if (remote_ports or local_ports) and protocol not in self.PORT_PROTOCOLS:
+            raise ValueError(f'{self.name}: ports need protocol tcp or udp: {entry}')
+        rules = []  # type: List[Filter_Rule]
+        for remote in [entry['cidr']] if entry.get('cidr') else self.ANY_CIDRS:
+            local = self.ANY_CIDRS[1] if ':' in remote else self.ANY_CIDRS[0]
+            if direction == self.INGRESS:
+                rules.append(Filter_Rule(direction, 0, 'reject', protocol, remote, local, remote_ports, local_ports))
+            else:
+                rules.append(Filter_Rule(direction, 0, 'reject', protocol, local, remote, local_ports, remote_ports))
+        return rules
+
+    def rules(self) -> List[Filter_Rule]:
+        """ the filter rules of the profile, in both directions """
+        rules = []  # type: List[Filter_Rule]
+        for direction in self.DIRECTIONS:
+            rejects = []  # type: List[Filter_Rule]
+            for entry in self.reject:
+                if entry.get('direction', 'both') not in [direction, 'both']:
+                    continue
+                rejects.extend(self._reject_rules(direction, entry))
+            if len(rejects) > self.REJECT_NUMBER_MAX:
+                raise ValueError(f'{self.name}: too many reject rules')
+            rules.extend(x._replace(number=n) for n, x in enumerate(rejects, start=1))
+            protocols = self.protocols or [None]
+            # each family takes whole hundreds, ipv6 from 200 up to 10 protocols, so the ranges never overlap
+            hundreds = -(-len(protocols) * self.ACCEPT_NUMBER_STEP // self.ACCEPT_NUMBER_START)
+            for family, cidr in enumerate(self.ANY_CIDRS):
+                for n, protocol in enumerate(protocols):
+                    number = self.ACCEPT_NUMBER_START * (1 + family * hundreds) + self.ACCEPT_NUMBER_STEP * n
+                    rules.append(Filter_Rule(direction, number, 'accept', protocol, cidr, cidr, None, None))
+        return rules
+
+    @staticmethod
+    def to_api(rule: Filter_Rule) -> Dict[str, Any]:
+        """ create_traffic_mirror_filter_rule arguments """
+        kwargs = {
+            'TrafficDirection': rule.direction,
+            'RuleNumber': rule.number,
+            'RuleAction': rule.action,
+            'SourceCidrBlock': rule.source_cidr,
+            'DestinationCidrBlock': rule.destination_cidr,
+            'Description': f'{VENDOR} {rule.direction} rule',
+        }  # type: Dict[str, Any]
+        if rule.protocol is not None:
+            kwargs['Protocol'] = rule.protocol
+        for key, ports in [('SourcePortRange', rule.source_ports), ('DestinationPortRange', rule.destination_ports)]:
+            if ports:
+                kwargs[key] = {'FromPort': ports[0], 'ToPort': ports[1]}
+        return kwargs
+
+    @staticmethod
+    def from_api(item: Dict[str, Any]) -> Filter_Rule:
+        """ a rule of a describe_traffic_mirror_filters response """
+        def ports(key: str) -> Union[Tuple[int, int], None]:
+            return (item[key]['FromPort'], item[key]['ToPort']) if item.get(key) else None
+        return Filter_Rule(
+            item['TrafficDirection'], item['RuleNumber'], item['RuleAction'], item.get('Protocol') or None,
+            item['SourceCidrBlock'], item['DestinationCidrBlock'],
+            ports('SourcePortRange'), ports('DestinationPortRange'),
+        )
+
+    def diff(self, traffic_mirror_filter: Dict[str, Any]) -> Rule_Changes:
+        """ the rule changes bringing an installed filter to this profile, matched by direction and number """
+        existing = {}  # type: Dict[Tuple[str, int], Tuple[str, Filter_Rule]]
+        for item in traffic_mirror_filter.get('IngressFilterRules', []) + traffic_mirror_filter.get(
+                'EgressFilterRules', []):
+            rule = self.from_api(item)
+            existing[(rule.direction, rule.number)] = (item['TrafficMirrorFilterRuleId'], rule)
+        changes = Rule_Changes([], [], [])
+        for rule in self.rules():
+            rule_id, current = existing.pop((rule.direction, rule.number), (None, None))
+            if current is None:
+                changes.create.append(rule)
+            elif current != rule:
+                changes.modify.append((rule_id, rule))
+        changes.delete.extend(rule_id for rule_id, _ in existing.values())
+        return changes
@@ -0,0 +1,221 @@
+"""
+Process wide instrumentation of a run: the calls and latency of each AWS operation, the time spent in each phase,
+and the planned actions of each VPC.
+Reported as a JSON run report, a Prometheus textfile for the node exporter, or a StatsD stream.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
+
+class StatsdSink:
+    """ fire and forget UDP, a missing StatsD agent never slows or fails a run """
+
+    def __init__(self, address: str, prefix: str) -> None:
+        host, _, port = address.rpartition(':')
+        self.address = (host or 'localhost', int(port))
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name: str, value: float, kind: str) -> None:
+        try:
+            self.socket.sendto(f'{self.prefix}.{name}:{value:g}|{kind}'.encode(), self.address)
+        except OSError as e:
+            logging.debug(f'StatsD send failed: {e}')
+
+
+class Metrics:
+    PREFIX = 'session_mirror_tap'
+    BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]  # seconds, the upper bounds of the latency histogram
+
+    VPC_LISTING = 'vpc_listing'
+    DISCOVERY = 'discovery'
+    LOOKUP = 'lookup'  # the session index, or the state snapshot
+    FILTERS = 'filters'
+    PLAN = 'plan'
+    WRITE = 'write'
+
+    started = time.time()
+    _api = {}  # type: Dict[Tuple[str, str], List[Any]]  # calls, errors, seconds, bucket counts
+    _phases = {}  # type: Dict[str, List[float]]  # count, seconds; summed across threads
+    _vpcs = {}  # type: Dict[str, Dict[str, int]]  # planned actions by kind
+    statsd = None  # type: Optional[StatsdSink]
+    _lock = threading.Lock()
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls.started = time.time()
+            cls._api.clear()
+            cls._phases.clear()
+            cls._vpcs.clear()
+
+    @classmethod
+    def observe_call(cls, service: str, operation: str, seconds: float, error: bool = False) -> None:
+        with cls._lock:
+            stat = cls._api.setdefault((service, operation), [0, 0, 0.0, [0] * len(cls.BUCKETS)])
+            stat[0] += 1
+            stat[1] += int(error)
+            stat[2] += seconds
+            for i, bound in enumerate(cls.BUCKETS):
+                if seconds <= bound:
+                    stat[3][i] += 1  # the report keeps each bucket's own count, prometheus() accumulates them
+                    break
+        if cls.statsd:
+            cls.statsd.send(f'api.{service}.{operation}', seconds * 1000, 'ms')
+            if error:
+                cls.statsd.send(f'api.{service}.{operation}.errors', 1, 'c')
+
+    @classmethod
+    @contextmanager
+    def phase(cls, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            with cls._lock:
+                stat = cls._phases.setdefault(name, [0, 0.0])
+                stat[0] += 1
+                stat[1] += seconds
+            if cls.statsd:
+                cls.statsd.send(f'phase.{name}', seconds * 1000, 'ms')
+
+    @classmethod
+    def count_actions(cls, vpc_id: str, counts: Dict[str, int]) -> None:
+        with cls._lock:
+            vpc = cls._vpcs.setdefault(vpc_id, {})
+            for kind, count in counts.items():
+                vpc[kind] = vpc.get(kind, 0) + count
+        if cls.statsd:
+            for kind, count in counts.items():
+                if count:
+                    cls.statsd.send(f'vpc.{vpc_id}.{kind}', count, 'c')
+
+    @classmethod
+    def _before_call(cls, context: Dict[str, Any], **kwargs: Any) -> None:
+        context['metrics_start'] = time.monotonic()
+
+    @classmethod
+    def _after_call(cls, event_name: str, context: Dict[str, Any], http_response: Any = None,
+                    exception: Exception = None, **kwargs: Any) -> None:
+        if 'metrics_start' not in context:
+            return  # answered before the call started, such as by a stubber
+        _, service, operation = event_name.split('.', 2)
+        error = exception is not None or http_response is None or http_response.status_code >= 300
+        cls.observe_call(service, operation, time.monotonic() - context.pop('metrics_start'), error)
+
+    @classmethod
+    def attach(cls, client: 'boto3.client') -> None:
+        """ time every call of the client, retries included """
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f'before-call.{service}', cls._before_call)
+        client.meta.events.register(f'after-call.{service}', cls._after_call)
+        # botocore 1.13+ only, older versions (such as the frozen 1.12) emit nothing when a call raises before a
+        # response, e.g. on a connection error, and those calls go unrecorded. Error responses reach after-call.
+        client.meta.events.register(f'after-call-error.{service}', cls._after_call)
+
+    @classmethod
+    def report(cls) -> Dict[str, Any]:
+        with cls._lock:
+            return {
+                'started': cls.started,
+                'finished': time.time(),
+                'api': {
+                    f'{service}.{operation}': {
+                        'calls': calls, 'errors': errors, 'seconds': seconds,
+                        'buckets': dict(zip([str(x) for x in cls.BUCKETS], buckets)),
+                    } for (service, operation), (calls, errors, seconds, buckets) in sorted(cls._api.items())
+                },
+                'phases': {name: {'count': x[0], 'seconds': x[1]} for name, x in sorted(cls._phases.items())},
+                'vpcs': {vpc_id: dict(x) for vpc_id, x in sorted(cls._vpcs.items())},
+            }
+
+    @classmethod
+    def merge(cls, report: Dict[str, Any]) -> None:
+        """ add the report of a worker process """
+        with cls._lock:
+            for name, api in report['api'].items():
+                service, operation = name.split('.', 1)
+                stat = cls._api.setdefault((service, operation), [0, 0, 0.0, [0] * len(cls.BUCKETS)])
+                stat[0] += api['calls']
+                stat[1] += api['errors']
+                stat[2] += api['seconds']
+                stat[3] = [x + api['buckets'].get(str(bound), 0) for x, bound in zip(stat[3], cls.BUCKETS)]
+            for name, phase in report['phases'].items():
+                stat = cls._phases.setdefault(name, [0, 0.0])
+                stat[0] += phase['count']
+                stat[1] += phase['seconds']
+        for vpc_id, counts in report['vpcs'].items():
+            cls.count_actions(vpc_id, counts)
+
+    @classmethod
+    def prometheus(cls) -> str:
+        """ the text exposition format, counters are totals since the process started """
+        report = cls.report()
+        p = cls.PREFIX
+        lines = [
+            f'# TYPE {p}_api_calls_total counter',
+            f'# TYPE {p}_api_errors_total counter',
+            f'# TYPE {p}_api_seconds histogram',
+        ]
+        for name, api in report['api'].items():
+            service, operation = name.split('.', 1)
+            labels = f'service="{service}",operation="{operation}"'
+            lines.append(f'{p}_api_calls_total{{{labels}}} {api["calls"]}')
+            lines.append(f'{p}_api_errors_total{{{labels}}} {api["errors"]}')
+            cumulative = 0
+            for bound, count in api['buckets'].items():
+                cumulative += count
+                lines.append(f'{p}_api_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_api_seconds_bucket{{{labels},le="+Inf"}} {api["calls"]}')
+            lines.append(f'{p}_api_seconds_sum{{{labels}}} {api["seconds"]}')
+            lines.append(f'{p}_api_seconds_count{{{labels}}} {api["calls"]}')
+        lines.append(f'# TYPE {p}_phase_seconds_total counter')
+        lines.append(f'# TYPE {p}_phase_runs_total counter')
+        for name, phase in report['phases'].items():
+            lines.append(f'{p}_phase_seconds_total{{phase="{name}"}} {phase["seconds"]}')
+            lines.append(f'{p}_phase_runs_total{{phase="{name}"}} {phase["count"]}')
+        lines.append(f'# TYPE {p}_vpc_actions_total counter')
+        for vpc_id, counts in report['vpcs'].items():
+            for kind, count in sorted(counts.items()):
+                lines.append(f'{p}_vpc_actions_total{{vpc_id="{vpc_id}",kind="{kind}"}} {count}')
+        lines.append(f'# TYPE {p}_last_report_timestamp_seconds gauge')
+        lines.append(f'{p}_last_report_timestamp_seconds {report["finished"]}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _write(path: str, text: str) -> None:
+        tmp_path = f'{path}.tmp'  # renamed into place, so a collector never reads half a file
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def add_arguments(cls, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument('--report-file', default=None,
+                            help='json run report: api calls and latency, phase timings and actions per VPC')
+        parser.add_argument('--prometheus-file', default=None,
+                            help='the same metrics as a Prometheus textfile, for the node exporter')
+        parser.add_argument('--statsd', default=None, help='send the metrics to a StatsD agent at host:port')
+
+    @classmethod
+    def setup(cls, args: argparse.Namespace) -> None:
+        cls.statsd = StatsdSink(args.statsd, cls.PREFIX) if args.statsd else None
+
+    @classmethod
+    def write(cls, args: argparse.Namespace) -> None:
+        """ the report files of the run so far """
+        if args.report_file:
+            cls._write(args.report_file, json.dumps(cls.report(), indent=2))
+        if args.prometheus_file:
+            cls._write(args.prometheus_file, cls.prometheus())
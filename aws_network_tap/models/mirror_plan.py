@@ -0,0 +1,67 @@
+"""
+Typed reconciliation plan: the changes needed to move the actual mirror sessions to the desired state.
+Planning only reads; applying the plan performs the writes.
+"""
+from collections import namedtuple, Counter
+from typing import Dict, Iterator, List
+
+Action = namedtuple("Action", "kind spile target_id filter_id mirror_session packet_length")
+Action.__new__.__defaults__ = (None,)  # packet_length, None mirrors whole packets
+
+
+class MirrorPlan:
+    CREATE = 'create'
+    DELETE = 'delete'
+    RETARGET = 'retarget'
+    ORPHANS = 'orphans'  # the vpc_id reported for the sessions of deleted ENIs
+
+    # order of execution: free sessions and target capacity before consuming it
+    KINDS = [
+        DELETE,
+        RETARGET,
+        CREATE,
+    ]
+
+    def __init__(self, vpc_id: str = None) -> None:
+        self.vpc_id = vpc_id
+        self.actions = []  # type: List[Action]
+        self.az_fallbacks = []  # type: List[str]  # tapped interfaces without a target in their own zone
+
+    def add(self, action: Action) -> None:
+        if action.kind not in self.KINDS:
+            raise ValueError('illegal action')
+        self.actions.append(action)
+
+    def extend(self, plan: 'MirrorPlan') -> None:
+        for action in plan:
+            self.add(action)
+        self.az_fallbacks.extend(plan.az_fallbacks)
+
+    def ordered(self) -> List[Action]:
+        return sorted(self.actions, key=lambda x: self.KINDS.index(x.kind))
+
+    def __iter__(self) -> Iterator[Action]:
+        return iter(self.actions)
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def counts(self) -> Dict[str, int]:
+        counter = Counter(x.kind for x in self.actions)
+        return {kind: counter.get(kind, 0) for kind in self.KINDS}
+
+    @staticmethod
+    def describe(action: Action) -> str:
+        eni_tag = action.spile.eni_tag
+        line = f'{action.kind:<8} {eni_tag.instance_id} {eni_tag.interface_id}'
+        if action.mirror_session:
+            line += f' {action.mirror_session.id} ({action.mirror_session.target_id})'
+        if action.kind != MirrorPlan.DELETE:
+            line += f' -> {action.target_id}'
+            if action.packet_length:
+                line += f' ({action.packet_length} bytes)'
+        return line
+
+    def apply(self) -> None:
+        for action in self.ordered():
+            action.spile.apply(action)
@@ -0,0 +1,108 @@
+"""
+Catalog of the instance types that can be a Traffic Mirroring source (the Nitro system),
+built from describe_instance_types and cached on disk so new families are picked up without a release.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Set, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
+
+class NitroCatalog:
+    TTL = 24 * 60 * 60  # seconds before the catalog is rebuilt
+    RETRY_TTL = 15 * 60  # seconds before the api is tried again after falling back
+
+    cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'aws_network_tap')  # type: Union[str, None]
+    _instance_types = {}  # type: Dict[str, Tuple[float, FrozenSet[str]]]  # region: (expires, instance types)
+    _unsupported_logged = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def instance_types(cls, ec2_client: 'boto3.client', region: str, fallback: Iterable[str] = ()) -> FrozenSet[str]:
+        """ memory, then disk, then the api; the fallback list is used when the api is unavailable """
+        cached = cls._instance_types.get(region)
+        if cached and time.time() < cached[0]:
+            return cached[1]
+        with cls._lock:
+            cached = cls._instance_types.get(region)
+            if cached and time.time() < cached[0]:
+                return cached[1]
+            loaded = cls._load(region)
+            if loaded:
+                fetched, instance_types = loaded
+                expires = fetched + cls.TTL
+            elif not ec2_client.can_paginate("describe_instance_types"):
+                if not cls._unsupported_logged:
+                    logging.warning('This botocore has no describe_instance_types, using the built in list of '
+                                    'Nitro instance types until it is upgraded')
+                    cls._unsupported_logged = True
+                instance_types = frozenset(fallback)  # not saved, an upgraded botocore builds the catalog
+                expires = time.time() + cls.RETRY_TTL
+            else:
+                try:
+                    instance_types = cls._describe(ec2_client)
+                    cls._save(region, instance_types)
+                    expires = time.time() + cls.TTL
+                except Exception as e:
+                    logging.warning(f'Unable to list Nitro instance types in {region}, using defaults: {e}')
+                    instance_types = frozenset(fallback)
+                    expires = time.time() + cls.RETRY_TTL
+            cls._instance_types[region] = (expires, instance_types)
+        return instance_types
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._instance_types.clear()
+            cls._unsupported_logged = False
+
+    @staticmethod
+    def _describe(ec2_client: 'boto3.client') -> FrozenSet[str]:
+        instance_types = set()  # type: Set[str]
+        paginator = ec2_client.get_paginator("describe_instance_types")
+        # bare metal instances are built on the Nitro system but report no hypervisor
+        for filters in [[{"Name": "hypervisor", "Values": ["nitro"]}], [{"Name": "bare-metal", "Values": ["true"]}]]:
+            for page in paginator.paginate(Filters=filters):
+                instance_types.update(x["InstanceType"] for x in page["InstanceTypes"])
+        if not instance_types:
+            raise ValueError('no instance types returned')
+        return frozenset(instance_types)
+
+    @classmethod
+    def _path(cls, region: str) -> Union[str, None]:
+        return os.path.join(cls.cache_dir, f'nitro_{region}.json') if cls.cache_dir else None
+
+    @classmethod
+    def _load(cls, region: str) -> Union[Tuple[float, FrozenSet[str]], None]:
+        """ the fetch time and instance types cached on disk, unless expired """
+        path = cls._path(region)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+        except ValueError:
+            return None
+        fetched = cached.get('fetched', 0)
+        if time.time() - fetched > cls.TTL:
+            return None
+        return fetched, frozenset(cached['instance_types'])
+
+    @classmethod
+    def _save(cls, region: str, instance_types: FrozenSet[str]) -> None:
+        path = cls._path(region)
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'fetched': time.time(), 'instance_types': sorted(instance_types)}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f'Unable to cache Nitro instance types at {path}: {e}')
@@ -3,7 +3,7 @@ from typing import Union, Set, List
 from datetime import datetime, timedelta
 import time
 import logging
-import boto3  # type: ignore
+from aws_network_tap.models.client_pool import ClientPool
 from aws_network_tap.models.ec2_api_client import VENDOR, Ec2ApiClient
 
 
@@ -13,7 +13,7 @@ class NlbFactory:
     def __init__(self, region: str, vpc_id: str) -> None:
         self.region = region
         self.vpc_id = vpc_id
-        self.client = boto3.client("elbv2", region_name=region)
+        self.client = ClientPool.client("elbv2", region=region)
 
     @property
     def lb_name(self) -> str:
@@ -0,0 +1,191 @@
+"""
+Opt-in profiling of a session_mirror_tap run, chosen by the extension of the output file:
+    run.pstats (or .prof)       cProfile statistics of every thread, for pstats or snakeviz
+    run.folded (or .collapsed)  sampled stacks of every thread, one `frame;frame;frame count` line each,
+                                for flamegraph.pl or speedscope
+    run.json                    Chrome trace of the spans of each VPC and ENI, for chrome://tracing or Perfetto
+Spans cost a single attribute check when no trace is being recorded.
+"""
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Span:
+    """ a timed section of a trace, tags may be added until it ends """
+    __slots__ = ('name', 'tags', 'start', 'thread_id')
+
+    def __init__(self, name: str, tags: Dict[str, Any]) -> None:
+        self.name = name
+        self.tags = tags
+        self.start = 0.0
+        self.thread_id = 0
+
+    def tag(self, **tags: Any) -> None:
+        self.tags.update(tags)
+
+    def __enter__(self) -> 'Span':
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        Profiler.record(self, time.perf_counter() - self.start)
+
+
+class NoSpan:
+    """ stands in for Span when no trace is recorded """
+
+    def tag(self, **tags: Any) -> None:
+        pass
+
+    def __enter__(self) -> 'NoSpan':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+class StackSampler:
+    """ samples the stacks of every other thread on an interval, counting identical stacks """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.stacks = Counter()  # type: Counter
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    @staticmethod
+    def _frame_name(frame: Any) -> str:
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, top in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []  # type: List[str]
+                frame = top  # type: Any
+                while frame is not None:
+                    names.append(self._frame_name(frame))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    ENV = 'SESSION_MIRROR_TAP_PROFILE'
+    PSTATS = ['.pstats', '.prof']
+    STACKS = ['.folded', '.collapsed']
+    TRACE = ['.json']
+
+    tracing = False  # spans are only recorded for a Chrome trace
+    _spans = []  # type: List[Dict[str, Any]]
+    _origin = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def span(cls, name: str, **tags: Any) -> Any:
+        """ `with Profiler.span('vpc', vpc_id=vpc_id) as span: ... span.tag(action='create')` """
+        if not cls.tracing:
+            return NO_SPAN
+        return Span(name, tags)
+
+    @classmethod
+    def record(cls, span: Span, seconds: float) -> None:
+        event = {
+            'name': span.name,
+            'ph': 'X',  # a complete event: start and duration
+            'ts': (span.start - cls._origin) * 1e6,
+            'dur': seconds * 1e6,
+            'pid': os.getpid(),
+            'tid': span.thread_id,
+            'args': span.tags,
+        }
+        with cls._lock:
+            cls._spans.append(event)
+
+    @classmethod
+    def path(cls, option: Optional[str]) -> Optional[str]:
+        """ the output of the --profile option, else of the environment variable """
+        return option or os.environ.get(cls.ENV) or None
+
+    @classmethod
+    def run(cls, path: str, func: Callable[..., Any], *args: Any) -> Any:
+        """ call func under the profiler chosen by the path's extension, and write the output even if it fails """
+        extension = os.path.splitext(path)[1].lower()
+        if extension in cls.PSTATS:
+            return cls._run_pstats(path, func, *args)
+        if extension in cls.STACKS:
+            sampler = StackSampler()
+            sampler.start()
+            try:
+                return func(*args)
+            finally:
+                sampler.stop()
+                with open(path, 'w') as f:
+                    f.write(sampler.collapsed())
+                logging.info(f'Wrote {sum(sampler.stacks.values())} stack samples to {path}')
+        if extension in cls.TRACE:
+            cls.tracing = True
+            cls._origin = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                cls.tracing = False
+                with cls._lock:
+                    events, cls._spans = cls._spans, []
+                with open(path, 'w') as f:
+                    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+                logging.info(f'Wrote {len(events)} trace spans to {path}')
+        raise ValueError(f'unknown profile format `{extension}`, use one of {cls.PSTATS + cls.STACKS + cls.TRACE}')
+
+    @classmethod
+    def _run_pstats(cls, path: str, func: Callable[..., Any], *args: Any) -> Any:
+        import pstats
+        profiles = []  # type: List[cProfile.Profile]
+
+        def profile_thread(*_: Any) -> None:
+            # the first event of each new thread swaps this hook for a profiler of its own
+            profile = cProfile.Profile()
+            profile.enable()
+            profiles.append(profile)
+
+        # python 3.12+ profiles through sys.monitoring, one profiler then sees every thread
+        per_thread = sys.version_info < (3, 12)
+        main_profile = cProfile.Profile()
+        if per_thread:
+            threading.setprofile(profile_thread)
+        main_profile.enable()
+        try:
+            return func(*args)
+        finally:
+            main_profile.disable()
+            if per_thread:
+                threading.setprofile(None)  # type: ignore
+            stats = pstats.Stats(main_profile)
+            for profile in profiles:
+                profile.disable()
+                stats.add(profile)
+            stats.dump_stats(path)
+            logging.info(f'Wrote the profile of {len(profiles) + 1} threads to {path}')
@@ -0,0 +1,171 @@
+"""
+Client side token buckets for the EC2 API, so the tapper stays within the request budget it shares with the
+other automation of the account, rather than retrying into RequestLimitExceeded storms.
+
+Describe and mutating calls draw from separate buckets per account and region, as EC2 throttles them apart.
+Credential sets of the same account, such as a role assumed into it, share its buckets.
+A throttle halves the bucket's rate, which recovers a little with each successful call (AIMD).
+With a state file, every process on the host shares the buckets under an exclusive file lock.
+"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
+try:
+    import fcntl
+except ImportError:  # not on windows, the buckets are then shared by threads only
+    fcntl = None  # type: ignore
+
+Budget_Usage = namedtuple("Budget_Usage", "calls throttled waited")  # waited in seconds
+
+
+class RateGovernor:
+    DESCRIBE = 'describe'
+    MUTATE = 'mutate'
+    DESCRIBE_PREFIXES = ('Describe', 'Get', 'List')
+    THROTTLE_CODES = [
+        'RequestLimitExceeded',
+        'Throttling',
+        'ThrottlingException',
+    ]
+
+    RATES = {DESCRIBE: 20.0, MUTATE: 5.0}  # requests per second, the EC2 default refill rates
+    BURST_SECONDS = 5.0  # a full bucket holds this many seconds of requests
+    BACKOFF = 0.5  # rate factor kept on a throttle
+    BACKOFF_INTERVAL = 1.0  # seconds, the throttles of one burst of concurrent calls back off once
+    RECOVERY = 0.01  # rate factor regained per successful call
+    FACTOR_MIN = 0.05
+
+    def __init__(self, rates: Dict[str, float] = None, path: str = None,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep) -> None:
+        unknown = set(rates or {}) - set(self.RATES)
+        if unknown:
+            raise ValueError(f'unknown api budgets {sorted(unknown)}')
+        self.rates = dict(self.RATES, **(rates or {}))
+        self.path = path
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {}  # type: Dict[str, List[float]]  # tokens, updated, factor, last backoff
+        self._usage = {}  # type: Dict[str, Dict[str, List[float]]]  # by key then budget: calls, throttled, waited
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse_rates(cls, value: str) -> Dict[str, float]:
+        """ `describe=20,mutate=5` """
+        rates = {}  # type: Dict[str, float]
+        for item in value.split(','):
+            budget, _, rate = item.strip().partition('=')
+            if budget not in cls.RATES or not rate:
+                raise ValueError(f'expected {",".join(f"{x}=<per second>" for x in cls.RATES)}, not `{value}`')
+            rates[budget] = float(rate)
+        return rates
+
+    @staticmethod
+    def key(account: str, region: str) -> str:
+        return f'{account}/{region}'
+
+    @classmethod
+    def budget(cls, operation: str) -> str:
+        return cls.DESCRIBE if operation.startswith(cls.DESCRIBE_PREFIXES) else cls.MUTATE
+
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, List[float]]]:
+        """ the bucket states, locked against the other threads and, with a path, the other processes """
+        with self._lock:
+            if not self.path or fcntl is None:
+                yield self._buckets
+                return
+            with open(self.path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)  # released on close
+                f.seek(0)
+                try:
+                    buckets = json.loads(f.read() or '{}')
+                except ValueError:
+                    buckets = {}  # torn by a killed process, start over with full buckets
+                yield buckets
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(buckets))
+
+    def _refill(self, buckets: Dict[str, List[float]], key: str, budget: str, now: float) -> List[float]:
+        rate = self.rates[budget]
+        burst = max(1.0, rate * self.BURST_SECONDS)
+        bucket = buckets.setdefault(f'{key}/{budget}', [burst, now, 1.0, 0.0])
+        bucket[0] = min(burst, bucket[0] + max(0.0, now - bucket[1]) * rate * bucket[2])
+        bucket[1] = now
+        return bucket
+
+    def _count(self, key: str, budget: str, calls: int = 0, throttled: int = 0, waited: float = 0.0) -> None:
+        with self._lock:
+            usage = self._usage.setdefault(key, {}).setdefault(budget, [0, 0, 0.0])
+            usage[0] += calls
+            usage[1] += throttled
+            usage[2] += waited
+
+    def acquire(self, key: str, budget: str) -> float:
+        """ take a token, waiting when the bucket is empty. Returns the seconds waited """
+        with self._state() as buckets:
+            bucket = self._refill(buckets, key, budget, self.clock())
+            bucket[0] -= 1  # a negative balance is the queue of callers already waiting
+            wait = max(0.0, -bucket[0] / (self.rates[budget] * bucket[2]))
+        if wait:
+            self.sleep(wait)
+        self._count(key, budget, calls=1, waited=wait)
+        return wait
+
+    def throttled(self, key: str, budget: str) -> None:
+        with self._state() as buckets:
+            now = self.clock()
+            bucket = self._refill(buckets, key, budget, now)
+            if now - bucket[3] >= self.BACKOFF_INTERVAL:
+                bucket[2] = max(self.FACTOR_MIN, bucket[2] * self.BACKOFF)
+                bucket[3] = now
+                bucket[0] = min(bucket[0], 0.0)
+                logging.info(f'Throttled by EC2, {budget} calls in {key} slowed to '
+                             f'{self.rates[budget] * bucket[2]:.2f} per second')
+        self._count(key, budget, throttled=1)
+
+    def succeeded(self, key: str, budget: str) -> None:
+        with self._state() as buckets:
+            bucket = self._refill(buckets, key, budget, self.clock())
+            bucket[2] = min(1.0, bucket[2] + self.RECOVERY)
+
+    def usage(self, key: str) -> Dict[str, Budget_Usage]:
+        """ the calls this process made under a key, each retry counts """
+        with self._lock:
+            return {budget: Budget_Usage(*x) for budget, x in self._usage.get(key, {}).items()}
+
+    @staticmethod
+    def since(usage: Dict[str, Budget_Usage], before: Dict[str, Budget_Usage]) -> Dict[str, Budget_Usage]:
+        result = {}  # type: Dict[str, Budget_Usage]
+        for budget, current in usage.items():
+            previous = before.get(budget, Budget_Usage(0, 0, 0.0))
+            result[budget] = Budget_Usage(*(x - y for x, y in zip(current, previous)))
+        return result
+
+    def _before_send(self, key: str, event_name: str, **kwargs: Any) -> None:
+        self.acquire(key, self.budget(event_name.rsplit('.', 1)[-1]))
+
+    def _needs_retry(self, key: str, event_name: str, response: Any = None, **kwargs: Any) -> None:
+        """ sees every attempt; returning None leaves the retry decision to botocore """
+        if response is None:
+            return  # connection error, no answer from the throttle
+        budget = self.budget(event_name.rsplit('.', 1)[-1])
+        if response[1].get('Error', {}).get('Code') in self.THROTTLE_CODES:
+            self.throttled(key, budget)
+        else:
+            self.succeeded(key, budget)
+
+    def attach(self, client: 'boto3.client', key: str) -> None:
+        """ govern every attempt of every call of the client, including botocore's own retries """
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f'before-send.{service}', partial(self._before_send, key))
+        client.meta.events.register(f'needs-retry.{service}', partial(self._needs_retry, key))
@@ -0,0 +1,72 @@
+"""
+Combined results of a session_mirror_tap run across regions.
+Results are plain tuples so they can be returned from worker processes.
+"""
+from collections import namedtuple
+from typing import Dict, Iterator, List
+from aws_network_tap.models.rate_governor import Budget_Usage
+
+Region_Result = namedtuple(
+    "Region_Result", "account region planned writes errors seconds error az_fallbacks api_usage"
+)
+Region_Result.__new__.__defaults__ = (0, None)  # az_fallbacks, api_usage by RateGovernor budget
+
+
+class RunSummary:
+
+    def __init__(self) -> None:
+        self.results = []  # type: List[Region_Result]
+
+    def add(self, result: Region_Result) -> None:
+        self.results.append(result)
+
+    def extend(self, results: List[Region_Result]) -> None:
+        self.results.extend(results)
+
+    def __iter__(self) -> Iterator[Region_Result]:
+        return iter(sorted(self.results, key=lambda x: (x.account or '', x.region)))
+
+    @property
+    def failed(self) -> bool:
+        return any(x.error or x.errors for x in self.results)
+
+    @staticmethod
+    def _total(counts: List[Dict[str, int]]) -> Dict[str, int]:
+        total = {}  # type: Dict[str, int]
+        for count in counts:
+            for key, value in count.items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    @staticmethod
+    def _api_usage(results: List[Region_Result]) -> str:
+        """ the EC2 requests made from each budget, retries included """
+        total = {}  # type: Dict[str, List[float]]
+        for result in results:
+            for budget, usage in (result.api_usage or {}).items():  # type: str, Budget_Usage
+                counts = total.setdefault(budget, [0, 0, 0.0])
+                for i, value in enumerate(usage):
+                    counts[i] += value
+        parts = [
+            f'{budget} {calls} (throttled {throttled}, waited {waited:.1f}s)'
+            for budget, (calls, throttled, waited) in sorted(total.items())
+        ]
+        return f' api {", ".join(parts)}' if parts else ''
+
+    def lines(self) -> Iterator[str]:
+        for result in self:
+            status = f'FAILED: {result.error}' if result.error else f'planned {result.planned} writes {result.writes}'
+            if result.az_fallbacks:
+                status += f' cross-zone fallbacks {result.az_fallbacks}'
+            status += self._api_usage([result])
+            yield f'{result.account or "-"} {result.region:<16} {result.seconds:8.1f}s {status}'
+            for error in result.errors:
+                yield f'    {error.kind} {error.instance_id} {error.interface_id}: {error.error}'
+        planned = self._total([x.planned for x in self.results])
+        writes = self._total([x.writes for x in self.results])
+        failed = len([x for x in self.results if x.error])
+        total = f'Total: {len(self.results)} regions ({failed} failed) planned {planned} writes {writes}'
+        az_fallbacks = sum(x.az_fallbacks for x in self.results)
+        if az_fallbacks:
+            total += f' cross-zone fallbacks {az_fallbacks}'
+        yield total + self._api_usage(self.results)
@@ -1,29 +1,147 @@
-from typing import Union
-import boto3  # type: ignore
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Tuple, Union, TYPE_CHECKING
 from .ec2_api_client import VENDOR
 from aws_network_tap.models.aws_tag import AWSTag
+from aws_network_tap.models.filter_profile import FilterProfile, Filter_Rule
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
 
 class SapFilter:
-    def __init__(self, ec2_client: boto3.client):
+    cache_path = None  # type: Union[str, None]  # optional json file of resolved filter ids, shared between runs
+    profiles = {}  # type: Dict[str, FilterProfile]  # named profiles besides the default, see FilterProfile.load
+    _filter_ids = {}  # type: Dict[Tuple[str, str, str], str]
+    _locks = {}  # type: Dict[Tuple[str, str, str], threading.Lock]
+    _lock = threading.Lock()
+
+    def __init__(self, ec2_client: 'boto3.client', profile: FilterProfile = None):
         self.ec2_client = ec2_client
+        self.profile = profile or FilterProfile.default()
+
+    @classmethod
+    def get_profile(cls, name: str = None) -> FilterProfile:
+        if not name or name == FilterProfile.DEFAULT:
+            return FilterProfile.default()
+        if name not in cls.profiles:
+            logging.warning(f'Unknown filter profile `{name}`, using the {FilterProfile.DEFAULT} profile')
+            return FilterProfile.default()
+        return cls.profiles[name]
+
+    @classmethod
+    def resolve(cls, ec2_client: 'boto3.client', account: str, region: str, install: bool = True,
+                profile: str = None) -> Union[str, None]:
+        """
+        returns the filter id, looked up once per (account, region, profile) and shared by every tap of the run.
+        Only one worker at a time may find, create or update the filter for a given account, region and profile.
+        """
+        sap_filter = cls(ec2_client=ec2_client, profile=cls.get_profile(profile))
+        key = (account, region, sap_filter.profile.name)
+        if key in cls._filter_ids:
+            return cls._filter_ids[key]
+        with cls._lock:
+            lock = cls._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in cls._filter_ids:
+                cached = sap_filter._load_cached(account, region)
+                if cached and install:
+                    sap_filter.sync(cached)
+                filter_id = cached["TrafficMirrorFilterId"] if cached else None
+                if not filter_id:
+                    filter_id = sap_filter.install() if install else sap_filter.find_filter()
+                if not filter_id:
+                    return None  # plan only, and nothing installed yet
+                cls._filter_ids[key] = filter_id
+                cls._save_cached(account, region, filter_id, sap_filter.profile.name)
+        return cls._filter_ids[key]
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._filter_ids.clear()
+
+    @staticmethod
+    def _cache_key(account: str, region: str, profile: str = FilterProfile.DEFAULT) -> str:
+        if profile == FilterProfile.DEFAULT:
+            return f'{account}:{region}'
+        return f'{account}:{region}:{profile}'
+
+    @classmethod
+    def _read_cache(cls) -> Dict[str, str]:
+        if not cls.cache_path or not os.path.exists(cls.cache_path):
+            return {}
+        try:
+            with open(cls.cache_path) as f:
+                return json.load(f)
+        except ValueError:
+            logging.warning(f'Ignoring unreadable filter cache {cls.cache_path}')
+            return {}
+
+    def _load_cached(self, account: str, region: str) -> Union[Dict[str, Any], None]:
+        """ a cached filter is only used once it is confirmed to still exist """
+        filter_id = self._read_cache().get(self._cache_key(account, region, self.profile.name))
+        if not filter_id:
+            return None
+        try:
+            filters = self.ec2_client.describe_traffic_mirror_filters(
+                TrafficMirrorFilterIds=[filter_id]
+            )["TrafficMirrorFilters"]
+        except Exception as e:
+            if "not found" not in str(e) and "NotFound" not in str(e):
+                raise
+            filters = []
+        if not filters or filters[0].get("Description") != self._filter_description:
+            logging.info(f'Cached Traffic Mirror Filter {filter_id} is no longer valid')
+            return None
+        return filters[0]
+
+    @classmethod
+    def _save_cached(cls, account: str, region: str, filter_id: str, profile: str = FilterProfile.DEFAULT) -> None:
+        if not cls.cache_path:
+            return
+        with cls._lock:
+            cache = cls._read_cache()
+            cache[cls._cache_key(account, region, profile)] = filter_id
+            tmp_path = f'{cls.cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, cls.cache_path)  # atomic, concurrent runs never read a partial file
 
     @property
     def _filter_name(self) -> str:
-        return VENDOR + " Filter"
+        if self.profile.name == FilterProfile.DEFAULT:
+            return VENDOR + " Filter"
+        return f'{VENDOR} Filter {self.profile.name}'
 
     @property
     def _filter_description(self) -> str:
-        return VENDOR + " Full Traffic + DNS Filter"
+        if self.profile.name == FilterProfile.DEFAULT:
+            return VENDOR + " Full Traffic + DNS Filter"
+        return f'{VENDOR} {self.profile.name} Filter Profile'
 
     def install(self) -> str:
-        """ returns the filter id"""
-        filter_id = self._find_filter()
-        if filter_id:
-            return filter_id
+        """ returns the filter id, an existing filter is brought up to date with the profile """
+        traffic_mirror_filter = self._find(remove_duplicates=True)
+        if traffic_mirror_filter:
+            self.sync(traffic_mirror_filter)
+            return traffic_mirror_filter["TrafficMirrorFilterId"]
         return self._create_filter()
 
-    def _find_filter(self) -> Union[str, None]:
+    def find_filter(self) -> Union[str, None]:
         """ return the filter id"""
+        traffic_mirror_filter = self._find()
+        return traffic_mirror_filter["TrafficMirrorFilterId"] if traffic_mirror_filter else None
+
+    def _find(self, remove_duplicates: bool = False) -> Union[Dict[str, Any], None]:
+        """
+        Runs that straddle a client token rotation may each create the filter.
+        Every run keeps the same one of the duplicates, the lowest id, and sessions on the others are retargeted to it.
+        """
         try:
             filters = self.ec2_client.describe_traffic_mirror_filters(
                 Filters=[
@@ -39,13 +157,84 @@ class SapFilter:
             return None
         if not filters:
             return None
+        filters = sorted(filters, key=lambda x: x["TrafficMirrorFilterId"])
         if len(filters) > 1:
-            raise ValueError("too many filters")
-        return filters[0]["TrafficMirrorFilterId"]
+            logging.warning(f'{len(filters)} Traffic Mirror Filters for profile {self.profile.name}, '
+                            f'keeping {filters[0]["TrafficMirrorFilterId"]}')
+            if remove_duplicates:
+                for duplicate in filters[1:]:
+                    self._delete_duplicate(duplicate["TrafficMirrorFilterId"])
+        return filters[0]
+
+    def _delete_duplicate(self, filter_id: str) -> None:
+        try:
+            self.ec2_client.delete_traffic_mirror_filter(TrafficMirrorFilterId=filter_id)
+            logging.info(f'Deleted duplicate Traffic Mirror Filter {filter_id}')
+        except Exception as e:  # still used by sessions, deleted by a later run once they are retargeted
+            logging.info(f'Duplicate Traffic Mirror Filter {filter_id} not deleted yet: {e}')
+
+    def sync(self, traffic_mirror_filter: Dict[str, Any]) -> None:
+        """ update the rules and network services of an installed filter in place, by rule diff """
+        filter_id = traffic_mirror_filter["TrafficMirrorFilterId"]
+        changes = self.profile.diff(traffic_mirror_filter)
+        for rule_id in changes.delete:
+            self.ec2_client.delete_traffic_mirror_filter_rule(TrafficMirrorFilterRuleId=rule_id)
+        for rule_id, rule in changes.modify:
+            kwargs = FilterProfile.to_api(rule)
+            kwargs.pop('Description')
+            remove = [
+                field for field, key in [
+                    ('protocol', 'Protocol'),
+                    ('source-port-range', 'SourcePortRange'),
+                    ('destination-port-range', 'DestinationPortRange'),
+                ] if key not in kwargs
+            ]
+            self.ec2_client.modify_traffic_mirror_filter_rule(
+                TrafficMirrorFilterRuleId=rule_id, **kwargs, **({'RemoveFields': remove} if remove else {})
+            )
+        for rule in changes.create:
+            self._create_rule(filter_id, rule)
+        has_dns = 'amazon-dns' in traffic_mirror_filter.get("NetworkServices", [])
+        if has_dns != self.profile.dns:
+            self._set_dns(filter_id)
+        if changes.create or changes.modify or changes.delete or has_dns != self.profile.dns:
+            logging.info(f'Traffic Mirror Filter {filter_id} updated to profile {self.profile.name}: '
+                         f'{len(changes.create)} rules created, {len(changes.modify)} modified, '
+                         f'{len(changes.delete)} deleted')
+
+    def _set_dns(self, filter_id: str) -> None:
+        key = 'AddNetworkServices' if self.profile.dns else 'RemoveNetworkServices'
+        self.ec2_client.modify_traffic_mirror_filter_network_services(
+            TrafficMirrorFilterId=filter_id, **{key: ['amazon-dns']}
+        )
+
+    def _create_rule(self, filter_id: str, rule: Filter_Rule) -> None:
+        try:
+            self.ec2_client.create_traffic_mirror_filter_rule(
+                TrafficMirrorFilterId=filter_id, **FilterProfile.to_api(rule)
+            )
+        except Exception as e:
+            if not self._created_already(e):
+                raise
+
+    @property
+    def _client_token(self) -> str:
+        """
+        Idempotency token shared by concurrent runs creating the same filter, so EC2 creates it only once.
+        Rotated hourly so a deleted filter is not resurrected by a stale token.
+        """
+        seed = f'{self._filter_description}:{datetime.utcnow():%Y%m%d%H}'
+        return hashlib.sha256(seed.encode()).hexdigest()[:64]
+
+    @staticmethod
+    def _created_already(e: Exception) -> bool:
+        """ a concurrent run holding the same client token got there first """
+        return 'already exists' in str(e) or 'Duplicate' in str(e)
 
     def _create_filter(self) -> str:
         # create filter and return the filter id
         filter_response = self.ec2_client.create_traffic_mirror_filter(
+            ClientToken=self._client_token,
             Description=self._filter_description,
             TagSpecifications=[
                 {
@@ -56,20 +245,10 @@ class SapFilter:
         )
         filter_id = filter_response["TrafficMirrorFilter"]["TrafficMirrorFilterId"]
         # tap dns
-        self.ec2_client.modify_traffic_mirror_filter_network_services(
-            TrafficMirrorFilterId=filter_id,
-            AddNetworkServices=['amazon-dns'],
-        )
+        if self.profile.dns:
+            self._set_dns(filter_id)
         # create filter rules
-        for direction in ["ingress", "egress"]:
-            for rule, cidr in zip([100, 200], ["0.0.0.0/0", "::/0"]):
-                self.ec2_client.create_traffic_mirror_filter_rule(
-                    TrafficMirrorFilterId=filter_id,
-                    TrafficDirection=direction,
-                    RuleNumber=rule,
-                    RuleAction="accept",
-                    DestinationCidrBlock=cidr,
-                    SourceCidrBlock=cidr,
-                    Description=VENDOR + " " + direction + " rule",
-                )
+        for rule in self.profile.rules():
+            self._create_rule(filter_id, rule)
+        logging.info(f'Traffic Mirror Filter created for profile {self.profile.name}: {filter_id}')
         return filter_id
@@ -0,0 +1,151 @@
+"""
+Runs the writes of a MirrorPlan on a bounded worker pool.
+Concurrency adapts to EC2 throttling, and a failing ENI is recorded without aborting the run.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from aws_network_tap.models.mirror_plan import Action, MirrorPlan
+from aws_network_tap.models.profiler import Profiler
+
+Action_Error = namedtuple("Action_Error", "kind instance_id interface_id error")
+
+
+class AdaptiveLimit:
+    """
+    Gate on the number of in-flight writes.
+    Halves on throttling, and grows back by one after a run of successes (AIMD).
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1) -> None:
+        if maximum < 1:
+            raise ValueError('concurrency must be at least 1')
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.limit = maximum
+        self.active = 0
+        self.successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._condition:
+            self.active -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.successes = 0
+                logging.info(f'Throttled by EC2, concurrency reduced to {self.limit}')
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self._condition.notify_all()
+
+
+class ExecutionReport:
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    def __init__(self) -> None:
+        self.counts = {self.SUCCEEDED: 0, self.FAILED: 0, self.SKIPPED: 0}  # type: Dict[str, int]
+        self.errors = []  # type: List[Action_Error]
+        self.skipped = []  # type: List[str]  # interface ids, refused by EC2 or never attempted
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def record_skipped(self, action: Action) -> None:
+        with self._lock:
+            self.counts[self.SKIPPED] += 1
+            self.skipped.append(action.spile.eni_tag.interface_id)
+
+    def record_error(self, action: Action, error: Exception) -> None:
+        eni_tag = action.spile.eni_tag
+        logging.warning(f'Failed to {action.kind} session for {eni_tag.instance_id} {eni_tag.interface_id}: {error}')
+        with self._lock:
+            self.counts[self.FAILED] += 1
+            self.errors.append(Action_Error(action.kind, eni_tag.instance_id, eni_tag.interface_id, str(error)))
+
+    def merge(self, report: 'ExecutionReport') -> None:
+        with self._lock:
+            for outcome, count in report.counts.items():
+                self.counts[outcome] += count
+            self.errors.extend(report.errors)
+            self.skipped.extend(report.skipped)
+
+    def __str__(self) -> str:
+        return ', '.join(f'{count} {outcome}' for outcome, count in self.counts.items())
+
+
+class SessionExecutor:
+    THROTTLE_ERRORS = [
+        'RequestLimitExceeded',
+        'Throttling',
+    ]
+
+    def __init__(self, max_workers: int = 8, max_attempts: int = 5, backoff: float = 1.0,
+                 stopping: threading.Event = None) -> None:
+        """ once stopping is set, in-flight writes finish and the remaining actions are skipped """
+        self.max_workers = max_workers
+        self.stopping = stopping
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.limit = AdaptiveLimit(maximum=max_workers)
+        self.report = ExecutionReport()
+
+    @classmethod
+    def is_throttle(cls, error: Exception) -> bool:
+        return any(x in str(error) for x in cls.THROTTLE_ERRORS)
+
+    def run(self, plan: MirrorPlan) -> ExecutionReport:
+        """ each kind of action completes before the next starts, so deletes free capacity for creates """
+        actions = plan.ordered()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for kind in MirrorPlan.KINDS:
+                list(pool.map(self._execute, [x for x in actions if x.kind == kind]))
+        return self.report
+
+    def _execute(self, action: Action) -> None:
+        eni_tag = action.spile.eni_tag
+        with Profiler.span('write eni', vpc_id=eni_tag.vpc_id, interface_id=eni_tag.interface_id,
+                           action=action.kind) as span:
+            span.tag(outcome=self._attempts(action))
+
+    def _attempts(self, action: Action) -> str:
+        """ apply the action, retrying throttled attempts, and return the outcome recorded """
+        for attempt in range(1, self.max_attempts + 1):
+            if self.stopping is not None and self.stopping.is_set():
+                self.report.record_skipped(action)
+                return ExecutionReport.SKIPPED
+            self.limit.acquire()
+            throttled = False
+            try:
+                result = action.spile.apply(action)
+            except Exception as e:
+                throttled = self.is_throttle(e)
+                if not throttled or attempt == self.max_attempts:
+                    self.report.record_error(action, e)
+                    return ExecutionReport.FAILED
+            finally:
+                self.limit.release(throttled=throttled)
+            if throttled:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+            if result is None and action.kind != MirrorPlan.DELETE:
+                self.report.record_skipped(action)  # tap refused, e.g. ENI already mirrored elsewhere
+                return ExecutionReport.SKIPPED
+            self.report.record(ExecutionReport.SUCCEEDED)
+            return ExecutionReport.SUCCEEDED
+        return ExecutionReport.FAILED  # unreachable, the last attempt records its error
@@ -0,0 +1,94 @@
+import logging
+import threading
+from typing import Dict, Iterator, List, Set, Tuple, Union, TYPE_CHECKING
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient
+from aws_network_tap.models.spile import MirrorSession, Spile
+
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+
+Session_Key = Tuple[str, int]  # (NetworkInterfaceId, SessionNumber)
+
+
+class SessionIndex:
+    """
+    Region wide inventory of the traffic mirror sessions, built from one paginated scan.
+    Replaces a describe_traffic_mirror_sessions call per ENI.
+    """
+    def __init__(self, sessions: Dict[Session_Key, MirrorSession] = None) -> None:
+        self.sessions = sessions if sessions else {}  # type: Dict[Session_Key, MirrorSession]
+        self.by_interface = {}  # type: Dict[str, Dict[int, MirrorSession]]
+        for (interface_id, session_number), mirror_session in self.sessions.items():
+            self.by_interface.setdefault(interface_id, {})[session_number] = mirror_session
+        self._lock = threading.Lock()  # sessions are added and removed by concurrent writers
+
+    @classmethod
+    def build(cls, ec2_client: 'boto3.client') -> 'SessionIndex':
+        sessions = {}  # type: Dict[Session_Key, MirrorSession]
+        paginator = ec2_client.get_paginator("describe_traffic_mirror_sessions")
+        for page in paginator.paginate():
+            for item in page["TrafficMirrorSessions"]:
+                key = (item["NetworkInterfaceId"], int(item["SessionNumber"]))
+                sessions[key] = Spile.to_mirror_session(item)
+        logging.info(f'Indexed {len(sessions)} Traffic Mirror Sessions')
+        return cls(sessions)
+
+    def get(self, interface_id: str, session_number: int) -> Union[MirrorSession, None]:
+        return self.sessions.get((interface_id, session_number))
+
+    def for_interface(self, interface_id: str) -> Dict[int, MirrorSession]:
+        """ every session of an ENI, by session number """
+        with self._lock:
+            return dict(self.by_interface.get(interface_id, {}))
+
+    def add(self, mirror_session: MirrorSession, session_number: int) -> None:
+        with self._lock:
+            self.sessions[(mirror_session.interface_id, session_number)] = mirror_session
+            self.by_interface.setdefault(mirror_session.interface_id, {})[session_number] = mirror_session
+
+    def _pop(self, key: Session_Key) -> None:
+        self.sessions.pop(key, None)
+        numbers = self.by_interface.get(key[0], {})
+        numbers.pop(key[1], None)
+        if not numbers:
+            self.by_interface.pop(key[0], None)
+
+    def remove(self, interface_id: str, session_number: int) -> None:
+        with self._lock:
+            self._pop((interface_id, session_number))
+
+    def discard(self, mirror_session: MirrorSession) -> None:
+        with self._lock:
+            for key in [k for k, v in self.sessions.items() if v.id == mirror_session.id]:
+                self._pop(key)
+
+    def interface_ids(self) -> Set[str]:
+        with self._lock:
+            return set(self.by_interface)
+
+    def items(self) -> List[Tuple[Session_Key, MirrorSession]]:
+        with self._lock:
+            return list(self.sessions.items())
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __iter__(self) -> Iterator[MirrorSession]:
+        with self._lock:
+            return iter(list(self.sessions.values()))
+
+    def find_orphans(self, ec2_client: 'boto3.client', interface_ids: Set[str] = None) -> List[MirrorSession]:
+        """ sessions whose source ENI no longer exists, optionally only checking the given interfaces """
+        candidates = self.interface_ids()
+        if interface_ids is not None:
+            candidates &= interface_ids
+        checked = sorted(candidates)
+        existing = set()  # type: Set[str]
+        paginator = ec2_client.get_paginator("describe_network_interfaces")
+        for i in range(0, len(checked), Ec2ApiClient.FILTER_VALUES_MAX):
+            chunk = checked[i:i + Ec2ApiClient.FILTER_VALUES_MAX]
+            # the filter form does not fail on missing ids, unlike NetworkInterfaceIds=
+            for page in paginator.paginate(Filters=[{"Name": "network-interface-id", "Values": chunk}]):
+                for interface in page["NetworkInterfaces"]:
+                    existing.add(interface["NetworkInterfaceId"])
+        return [x for x in self if x.interface_id in candidates and x.interface_id not in existing]
@@ -1,30 +1,59 @@
 import logging
-from typing import Union
-import boto3  # type: ignore
+from typing import Any, Union, Dict, List, Set, Tuple, TYPE_CHECKING
 from collections import namedtuple
 from aws_network_tap.models.sap_filter import SapFilter
 from aws_network_tap.models.ec2_api_client import ENI_Tag, VENDOR, Ec2ApiClient
 from aws_network_tap.models.aws_tag import AWSTag
+from aws_network_tap.models.mirror_plan import Action, MirrorPlan
 
-MirrorSession = namedtuple("SessionMirror", "id target_id filter_id interface_id tags")
+if TYPE_CHECKING:
+    import boto3  # type: ignore  # noqa: F401
+    from aws_network_tap.models.session_index import SessionIndex  # noqa: F401
+
+MirrorSession = namedtuple("SessionMirror", "id target_id filter_id interface_id tags packet_length")
+MirrorSession.__new__.__defaults__ = (None,)  # packet_length
 
 
 class Spile:
 
     CREATOR_KEY = 'Creator'
     CREATOR_VALUE = VENDOR + ':Tap'
+    SESSION_NUMBER = 1
+    SESSION_NUMBER_MAX = 32766
 
-    def __init__(self, ec2_client: boto3.client, eni_tag: ENI_Tag):
+    def __init__(self, ec2_client: 'boto3.client', eni_tag: ENI_Tag, session_index: 'SessionIndex' = None,
+                 session_number: int = SESSION_NUMBER):
         self.ec2_client = ec2_client
         self.eni_tag = eni_tag
+        self.session_index = session_index
+        self._session_number = session_number
 
     @property
     def session_number(self) -> int:
-        return 1
+        return self._session_number
 
-    def _find_tap(self) -> Union[MirrorSession, None]:  # TODO paginate this one
-        """ returns the traffic mirror session id"""
+    def for_session(self, session_number: int) -> 'Spile':
+        """ the same ENI, tracking another of its sessions """
+        if session_number == self.session_number:
+            return self
+        return Spile(self.ec2_client, self.eni_tag, self.session_index, session_number)
+
+    @staticmethod
+    def to_mirror_session(response: Dict) -> MirrorSession:
+        """ build a MirrorSession from a TrafficMirrorSession api response item """
+        return MirrorSession(
+            response["TrafficMirrorSessionId"],
+            response["TrafficMirrorTargetId"],
+            response["TrafficMirrorFilterId"],
+            response["NetworkInterfaceId"],
+            AWSTag.to_dict(response.get("Tags", [])),
+            response.get("PacketLength"),
+        )
 
+    def _find_tap(self) -> Union[MirrorSession, None]:
+        """ returns the traffic mirror session id"""
+        if self.session_index is not None:
+            return self.session_index.get(self.eni_tag.interface_id, self.session_number)
         try:
             response = self.ec2_client.describe_traffic_mirror_sessions(
                 Filters=[
@@ -46,23 +75,75 @@ class Spile:
             return None
         if len(response) > 1:
             raise ValueError("too many filters installed")
-        _ = response[0]
-        return MirrorSession(
-            _["TrafficMirrorSessionId"],
-            _["TrafficMirrorTargetId"],
-            _["TrafficMirrorFilterId"],
-            _["NetworkInterfaceId"],
-            AWSTag.to_dict(_["Tags"])
-        )
+        return self.to_mirror_session(response[0])
+
+    def _find_taps(self) -> Dict[int, MirrorSession]:
+        """ every session of the ENI, ours or not, by session number """
+        if self.session_index is not None:
+            return self.session_index.for_interface(self.eni_tag.interface_id)
+        try:
+            response = self.ec2_client.describe_traffic_mirror_sessions(
+                Filters=[{"Name": "network-interface-id", "Values": [self.eni_tag.interface_id]}]
+            )["TrafficMirrorSessions"]
+        except Exception as e:
+            if "not found" not in str(e):
+                raise
+            return {}
+        return {int(x["SessionNumber"]): self.to_mirror_session(x) for x in response}
+
+    def session_numbers(self, priorities: List[int], targets: List[Set[str]] = None
+                        ) -> Tuple[List[Union[int, None]], Dict[int, MirrorSession]]:
+        """
+        the session number for each priority, increasing, around the sessions created outside this tool.
+        targets holds the mirror targets each priority accepts. Our sessions on one of them keep their numbers
+        first, then the other priorities reuse our remaining sessions while the order allows.
+        Returns our sessions left without a priority. A priority with no number left gets None.
+        """
+        sessions = self._find_taps()
+        ours = sorted(n for n, x in sessions.items() if self.should_manage(x))
+        kept = []  # type: List[Union[int, None]]
+        low = 0
+        for priority, accepted in zip(priorities, targets or [set()] * len(priorities)):
+            matches = [n for n in ours if n > low and n >= priority and sessions[n].target_id in accepted]
+            kept.append(matches[0] if matches else None)
+            low = kept[-1] or low
+        numbers = []  # type: List[Union[int, None]]
+        low = 0
+        for i, priority in enumerate(priorities):
+            number = kept[i]
+            while number is None:
+                upcoming = [x for x in kept[i + 1:] if x]
+                upper = upcoming[0] if upcoming else self.SESSION_NUMBER_MAX + 1
+                spare = [n for n in ours if low < n < upper and n >= priority and n not in kept]
+                if spare:
+                    number = spare[0]
+                else:
+                    number = max(priority, low + 1)
+                    while number in sessions:  # taken by someone else, or by one of ours about to be removed
+                        number += 1
+                if upcoming and number >= upper:  # no room below the next kept session, it gives up its number
+                    kept[kept.index(upper, i + 1)] = None
+                    number = None
+            if number > self.SESSION_NUMBER_MAX:
+                logging.warning(f'No session number left for priority {priority} on {self.eni_tag.interface_id}')
+                numbers.append(None)
+                continue
+            numbers.append(number)
+            low = number
+        stale = {n: sessions[n] for n in ours if n not in numbers}
+        return numbers, stale
 
-    def _tap(self, target_id: str) -> Union[MirrorSession, None]:
-        filter_id = SapFilter(ec2_client=self.ec2_client).install()
+    def _tap(self, target_id: str, filter_id: str = None, packet_length: int = None) -> Union[MirrorSession, None]:
+        if not filter_id:
+            filter_id = SapFilter(ec2_client=self.ec2_client).install()
         # create session
         tags = {
             self.CREATOR_KEY: self.CREATOR_VALUE,
             AWSTag.NAME_KEY: self.eni_tag.tags.get(AWSTag.NAME_KEY, self.eni_tag.instance_id)}
+        kwargs = {"PacketLength": packet_length} if packet_length else {}
         try:
             _ = self.ec2_client.create_traffic_mirror_session(
+                **kwargs,
                 NetworkInterfaceId=self.eni_tag.interface_id,
                 TrafficMirrorTargetId=target_id,
                 TrafficMirrorFilterId=filter_id,
@@ -83,36 +164,74 @@ class Spile:
                 logging.warning(f'unable to tap {self.eni_tag.instance_id} due to target limit')
                 return None
             raise
-
-        return MirrorSession(
-            _["TrafficMirrorSessionId"],
-            _["TrafficMirrorTargetId"],
-            _["TrafficMirrorFilterId"],
-            _["NetworkInterfaceId"],
-            AWSTag.to_dict(_["Tags"])
-        )
+        mirror_session = self.to_mirror_session(_)
+        if self.session_index is not None:
+            self.session_index.add(mirror_session, self.session_number)
+        return mirror_session
 
     def _untap(self, mirror_session_id: str) -> None:
         self.ec2_client.delete_traffic_mirror_session(TrafficMirrorSessionId=mirror_session_id)
+        if self.session_index is not None:
+            self.session_index.remove(self.eni_tag.interface_id, self.session_number)
 
-    def manage(self, target_id: str, do_tap: bool) -> Union[MirrorSession, None]:
-        mirror_session = self._find_tap()
+    def _retarget(self, mirror_session: MirrorSession, target_id: str, filter_id: str = None,
+                  packet_length: int = None) -> MirrorSession:
+        """ point an existing session at a new target, filter and packet length in place """
+        kwargs = {
+            "TrafficMirrorSessionId": mirror_session.id,
+            "TrafficMirrorTargetId": target_id,
+        }  # type: Dict[str, Any]
+        if filter_id:
+            kwargs["TrafficMirrorFilterId"] = filter_id
+        if packet_length:
+            kwargs["PacketLength"] = packet_length
+        elif mirror_session.packet_length:
+            kwargs["RemoveFields"] = ["packet-length"]  # back to whole packets
+        _ = self.ec2_client.modify_traffic_mirror_session(**kwargs)["TrafficMirrorSession"]
+        mirror_session = self.to_mirror_session(_)
+        if self.session_index is not None:
+            self.session_index.add(mirror_session, self.session_number)
+        return mirror_session
+
+    def _plan(self, target_id: str, do_tap: bool, mirror_session: Union[MirrorSession, None],
+              filter_id: str = None, packet_length: int = None) -> Union[Action, None]:
+        """ returns the action needed to reach the desired state, None when there is nothing to do """
         if mirror_session:
             if not self.should_manage(mirror_session):
                 logging.info(f'Ignoring externally managed session {mirror_session.id}')
                 return None  # don't manage this one
             if not do_tap:
-                self._untap(mirror_session.id)
-                return None
-            if mirror_session.target_id == target_id:  # already tapped correctly
-                return mirror_session
-            return self._tap(target_id)
-        else:
-            if self.eni_tag.state != Ec2ApiClient.STATE_RUNNING:
-                return None  # not running, no tap
-            if not do_tap:  # don't tap
-                return None
-            return self._tap(target_id)
+                return Action(MirrorPlan.DELETE, self, target_id, filter_id, mirror_session, packet_length)
+            if mirror_session.target_id == target_id and (not filter_id or mirror_session.filter_id == filter_id) \
+                    and mirror_session.packet_length == packet_length:
+                return None  # already tapped correctly
+            return Action(MirrorPlan.RETARGET, self, target_id, filter_id, mirror_session, packet_length)
+        if self.eni_tag.state != Ec2ApiClient.STATE_RUNNING:
+            return None  # not running, no tap
+        if not do_tap:  # don't tap
+            return None
+        return Action(MirrorPlan.CREATE, self, target_id, filter_id, None, packet_length)
+
+    def plan(self, target_id: str, do_tap: bool, filter_id: str = None,
+             packet_length: int = None) -> Union[Action, None]:
+        return self._plan(target_id, do_tap, self._find_tap(), filter_id, packet_length)
+
+    def apply(self, action: Action) -> Union[MirrorSession, None]:
+        if action.kind == MirrorPlan.DELETE:
+            self._untap(action.mirror_session.id)
+            return None
+        if action.kind == MirrorPlan.RETARGET:
+            return self._retarget(action.mirror_session, action.target_id, action.filter_id, action.packet_length)
+        return self._tap(action.target_id, action.filter_id, action.packet_length)
+
+    def manage(self, target_id: str, do_tap: bool) -> Union[MirrorSession, None]:
+        mirror_session = self._find_tap()
+        action = self._plan(target_id, do_tap, mirror_session)
+        if action:
+            return self.apply(action)
+        if mirror_session and self.should_manage(mirror_session):
+            return mirror_session
+        return None
 
     @classmethod
     def should_manage(cls, mirror_session: MirrorSession) -> bool:
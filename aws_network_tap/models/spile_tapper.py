@@ -1,13 +1,27 @@
 
-from typing import Generator, List
+import logging
+from collections import namedtuple
+from typing import Dict, FrozenSet, Generator, List, Set, Union
 from aws_network_tap.models.ec2_api_client import Ec2ApiClient, ENI_Tag
+from aws_network_tap.models.metrics import Metrics
+from aws_network_tap.models.mirror_plan import Action, MirrorPlan
+from aws_network_tap.models.nitro_catalog import NitroCatalog
+from aws_network_tap.models.profiler import Profiler
+from aws_network_tap.models.sap_filter import SapFilter
+from aws_network_tap.models.session_executor import SessionExecutor
 from aws_network_tap.models.spile import Spile
+from aws_network_tap.models.session_index import Session_Key, SessionIndex
+from aws_network_tap.models.target_scheduler import TargetScheduler
 from aws_network_tap.models.aws_tag import AWSTag
 from aws_network_tap.models.tag_config import EC2Config, VPCTagConfig
 
+Desired_Tap = namedtuple("Desired_Tap", "spile do_tap target_id filter_id az_fallback packet_length primary")
+Desired_Tap.__new__.__defaults__ = (False, None, True)  # az_fallback, packet_length, primary (on the vpc target)
+
 
 class SpileTapper(Ec2ApiClient):
 
+    # used when describe_instance_types is unavailable, see NitroCatalog
     FOREST_SPECIES = [
         # A1
         "a1.medium",
@@ -148,43 +162,207 @@ class SpileTapper(Ec2ApiClient):
         "z1d.metal",
     ]
 
-    def discover(self) -> Generator[Spile, None, None]:
-        """ find all the nitro instances and return a Spile if so"""
+    def instance_types(self) -> FrozenSet[str]:
+        """ instance types eligible for tapping in this region """
+        return NitroCatalog.instance_types(self.ec2_client, self.region, fallback=self.FOREST_SPECIES)
+
+    def discover(self, session_index: SessionIndex = None,
+                 instance_ids: List[str] = None) -> Generator[Spile, None, None]:
+        """ find all the nitro instances and return a Spile if so, optionally only for the given instances"""
         paginator = self.ec2_client.get_paginator("describe_instances")
-        filters = [{"Name": "instance-type", "Values": self.FOREST_SPECIES}]
-        if self.vpc_ids:
-            filters.append({"Name": "vpc-id", "Values": self.vpc_ids})
-        page_iterator = paginator.paginate(Filters=filters)
-        for page in page_iterator:
-            for garbo in page["Reservations"]:
-                for instance in garbo["Instances"]:
-                    instance_id = instance["InstanceId"]
-                    tags = AWSTag.to_dict(instance.get(AWSTag.TAGS_KEY))
-                    for interface in instance["NetworkInterfaces"]:
-                        yield Spile(
-                            ec2_client=self.ec2_client,
-                            eni_tag=ENI_Tag(
-                                instance_id,
-                                interface["NetworkInterfaceId"],
-                                tags,
-                                instance["State"]["Name"]
-                            ),
+        instance_types = self.instance_types()
+        # a catalog too large for one filter is matched client side, rather than splitting the scan
+        server_side = len(instance_types) <= self.FILTER_VALUES_MAX
+        vpc_ids = self.vpc_ids or []
+        # one scan covers every vpc, split only when there are more vpcs than filter values allowed
+        for i in range(0, max(len(vpc_ids), 1), self.FILTER_VALUES_MAX):
+            filters = []
+            if server_side:
+                filters.append({"Name": "instance-type", "Values": sorted(instance_types)})
+            if vpc_ids:
+                filters.append({"Name": "vpc-id", "Values": vpc_ids[i:i + self.FILTER_VALUES_MAX]})
+            if instance_ids:
+                filters.append({"Name": "instance-id", "Values": instance_ids})
+            page_iterator = paginator.paginate(Filters=filters)
+            for page in page_iterator:
+                for garbo in page["Reservations"]:
+                    for instance in garbo["Instances"]:
+                        if not server_side and instance.get("InstanceType") not in instance_types:
+                            continue
+                        instance_id = instance["InstanceId"]
+                        tags = AWSTag.to_dict(instance.get(AWSTag.TAGS_KEY))
+                        for interface in instance["NetworkInterfaces"]:
+                            yield Spile(
+                                ec2_client=self.ec2_client,
+                                eni_tag=ENI_Tag(
+                                    instance_id,
+                                    interface["NetworkInterfaceId"],
+                                    tags,
+                                    instance["State"]["Name"],
+                                    interface.get("VpcId", instance.get("VpcId")),
+                                    instance.get("Placement", {}).get("AvailabilityZone"),
+                                ),
+                                session_index=session_index,
+                            )
+
+    def discover_by_vpc(self, session_index: SessionIndex = None) -> Dict[str, List[Spile]]:
+        """ a single discovery pass for all of self.vpc_ids, partitioned by vpc in memory """
+        by_vpc = {vpc_id: [] for vpc_id in self.vpc_ids or []}  # type: Dict[str, List[Spile]]
+        if not by_vpc:
+            return by_vpc  # never scan the whole account
+        for spile in self.discover(session_index=session_index):  # type: Spile
+            if spile.eni_tag.vpc_id in by_vpc:
+                by_vpc[spile.eni_tag.vpc_id].append(spile)
+        return by_vpc
+
+    def desired_state(self, config: VPCTagConfig, session_index: SessionIndex = None,
+                      install_filter: bool = False, spiles: List[Spile] = None) -> Dict[Session_Key, Desired_Tap]:
+        """
+        phase one: the desired tap for every session of every ENI, keyed by interface id and session number.
+        Our sessions on numbers no longer wanted are desired untapped.
+        spiles may come from a shared discover_by_vpc() pass, otherwise this tapper's vpcs are discovered.
+        The filters are installed up front when writes will follow, so concurrent creates share them.
+        """
+        filter_ids = {}  # type: Dict[Union[str, None], Union[str, None]]  # by profile
+        desired = {}  # type: Dict[Session_Key, Desired_Tap]
+        if spiles is None:
+            with Metrics.phase(Metrics.DISCOVERY):
+                spiles = list(self.discover(session_index=session_index))
+        az_targets = config.az_targets
+        slots = config.sessions
+        # the session on the vpc target may be on any target of its pool or zone
+        extra = {x.target_id for x in slots if x.target_id != config.target}
+        primary_targets = (set(config.target_pool) | set(az_targets.values())) - extra
+        slot_targets = [primary_targets if x.target_id == config.target else {x.target_id} for x in slots]
+        for spile in spiles:
+            interface_id = spile.eni_tag.interface_id
+            # blacklist/whitelist membership comes from the instance tags already returned by discovery
+            ec2_config = EC2Config(spile.eni_tag.tags)
+            do_tap = ec2_config.enrolled(config)
+            packet_length = ec2_config.packet_length_for(config)
+            numbers, stale = spile.session_numbers([x.priority for x in slots], slot_targets)
+            for slot, number in zip(slots, numbers):
+                if number is None:
+                    continue
+                profile = slot.filter_profile or ec2_config.filter_profile or config.filter_profile
+                if profile not in filter_ids:
+                    with Metrics.phase(Metrics.FILTERS):
+                        filter_ids[profile] = SapFilter.resolve(
+                            self.ec2_client, self.account_number, self.region, install=install_filter,
+                            profile=profile,
                         )
+                primary = slot.target_id == config.target
+                target_id = (az_targets.get(spile.eni_tag.az) or config.target) if primary else slot.target_id
+                az_fallback = primary and bool(az_targets) and spile.eni_tag.az not in az_targets
+                desired[(interface_id, number)] = Desired_Tap(
+                    spile.for_session(number), do_tap, target_id, filter_ids[profile], az_fallback, packet_length,
+                    primary,
+                )
+            for number in stale:
+                desired[(interface_id, number)] = Desired_Tap(
+                    spile.for_session(number), False, None, None, False, None, False
+                )
+        if config.pooled:
+            desired = self.assign_targets(config, desired, session_index)
+        return desired
+
+    def assign_targets(self, config: VPCTagConfig, desired: Dict[Session_Key, Desired_Tap],
+                       session_index: SessionIndex = None) -> Dict[Session_Key, Desired_Tap]:
+        """
+        spread the tapped ENIs' sessions on the vpc target across the vpc's target pool,
+        sessions that fit nowhere are left out. ENIs with a target in their own zone keep it.
+        """
+        target_types = {x.target_id: x.type for x in self.list_mirror_targets(region=self.region)}
+        az_local = bool(config.az_targets)
+        tapped = {
+            key[0]: key for key, x in desired.items() if x.primary and x.do_tap and (x.az_fallback or not az_local)
+        }  # type: Dict[str, Session_Key]
+        scheduler = TargetScheduler.for_pool(config.target_pool, target_types, session_index, tapped)
+        current = {}  # type: Dict[str, str]
+        for interface_id, key in tapped.items():
+            mirror_session = session_index.get(*key) if session_index else None
+            if mirror_session:
+                current[interface_id] = mirror_session.target_id
+        assigned = scheduler.assign(tapped, current)
+        result = {}  # type: Dict[Session_Key, Desired_Tap]
+        for key, desired_tap in desired.items():
+            if tapped.get(key[0]) != key:
+                result[key] = desired_tap
+            elif assigned[key[0]]:
+                result[key] = desired_tap._replace(target_id=assigned[key[0]])
+        return result
 
     @classmethod
-    def manage(cls, region: str, vpc_ids: List[str], config: VPCTagConfig) -> None:
-        tapper = SpileTapper(region=region, vpc_ids=vpc_ids)
+    def plan(cls, region: str, vpc_ids: List[str], config: VPCTagConfig,
+             session_index: SessionIndex = None, install_filter: bool = False,
+             spiles: List[Spile] = None) -> MirrorPlan:
+        """
+        diff the desired state against the session index, without making any changes
+        Prebuilt spiles without a session index look up their own sessions, so a few ENIs never cost a full index.
+        """
+        plan = MirrorPlan(vpc_id=','.join(vpc_ids))
         if not config.enabled:
-            return
-        ec2_blacklist = []
-        ec2_whitelist = []
-        if config.auto_enrollment:
-            ec2_blacklist = Ec2ApiClient.get_instances_by_tag(region=region, tag=EC2Config.T_BLACKLIST)
-        else:
-            ec2_whitelist = Ec2ApiClient.get_instances_by_tag(region=region, tag=EC2Config.T_WHITELIST)
-        for spile in tapper.discover():  # type: Spile
-            if config.auto_enrollment:
-                do_tap = spile.eni_tag.instance_id not in ec2_blacklist
-            else:
-                do_tap = spile.eni_tag.instance_id in ec2_whitelist
-            spile.manage(target_id=config.target, do_tap=do_tap)
+            return plan
+        tapper = SpileTapper(region=region, vpc_ids=vpc_ids)
+        if session_index is None and spiles is None:
+            with Metrics.phase(Metrics.LOOKUP):
+                session_index = SessionIndex.build(tapper.ec2_client)
+        desired = tapper.desired_state(config, session_index, install_filter=install_filter, spiles=spiles)
+        with Metrics.phase(Metrics.PLAN):  # the lookup, discovery and filters above are phases of their own
+            for (interface_id, number), desired_tap in desired.items():  # type: Session_Key, Desired_Tap
+                vpc_id = desired_tap.spile.eni_tag.vpc_id
+                with Profiler.span('plan eni', vpc_id=vpc_id, interface_id=interface_id, session=number) as span:
+                    action = desired_tap.spile.plan(
+                        target_id=desired_tap.target_id, do_tap=desired_tap.do_tap,
+                        filter_id=desired_tap.filter_id, packet_length=desired_tap.packet_length,
+                    )
+                    span.tag(action=action.kind if action else None)
+                if action:
+                    plan.add(action)
+                if desired_tap.do_tap and desired_tap.az_fallback:
+                    plan.az_fallbacks.append(interface_id)
+        if plan.az_fallbacks:
+            logging.warning(f'{len(plan.az_fallbacks)} ENIs in {plan.vpc_id} have no mirror target in their zone')
+        cls._count_actions(plan, vpc_ids)
+        return plan
+
+    @staticmethod
+    def _count_actions(plan: MirrorPlan, vpc_ids: List[str]) -> None:
+        """ the planned actions of each vpc, a plan may span several """
+        by_vpc = {vpc_id: MirrorPlan(vpc_id=vpc_id) for vpc_id in vpc_ids}
+        for action in plan:
+            if action.spile.eni_tag.vpc_id in by_vpc:
+                by_vpc[action.spile.eni_tag.vpc_id].add(action)
+        for vpc_id, vpc_plan in by_vpc.items():
+            Metrics.count_actions(vpc_id, vpc_plan.counts())
+
+    @classmethod
+    def manage(cls, region: str, vpc_ids: List[str], config: VPCTagConfig, session_index: SessionIndex = None,
+               plan_only: bool = False, executor: SessionExecutor = None, spiles: List[Spile] = None) -> MirrorPlan:
+        """ the executor collects the succeeded/failed/skipped counts across calls """
+        plan = cls.plan(
+            region=region, vpc_ids=vpc_ids, config=config, session_index=session_index,
+            install_filter=not plan_only, spiles=spiles
+        )
+        if not plan_only:
+            with Metrics.phase(Metrics.WRITE):
+                (executor or SessionExecutor()).run(plan)
+        return plan
+
+    @classmethod
+    def plan_orphans(cls, region: str, session_index: SessionIndex, interface_ids: Set[str] = None) -> MirrorPlan:
+        """ delete our sessions whose source ENI no longer exists """
+        ec2_client = cls._get_client(region=region)
+        plan = MirrorPlan()
+        for mirror_session in session_index.find_orphans(ec2_client, interface_ids=interface_ids):
+            if not Spile.should_manage(mirror_session):
+                continue
+            numbers = session_index.for_interface(mirror_session.interface_id)
+            spile = Spile(
+                ec2_client=ec2_client,
+                eni_tag=ENI_Tag(None, mirror_session.interface_id, {}, None, None, None),
+                session_index=session_index,
+                session_number=next((n for n, x in numbers.items() if x.id == mirror_session.id), Spile.SESSION_NUMBER),
+            )
+            plan.add(Action(MirrorPlan.DELETE, spile, None, None, mirror_session, None))
+        return plan
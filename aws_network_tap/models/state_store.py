@@ -0,0 +1,140 @@
+"""
+Optional local snapshot of the last reconciled state, so a steady state account only plans the ENIs that changed.
+The sessions are still listed on every pass, one paginated call, so a session deleted or modified by hand is
+repaired on the next pass. Drift the snapshot cannot see, like room freed on a pool target, waits for the full resync.
+"""
+import json
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, Iterable, List, Set, Tuple
+from aws_network_tap.models.session_index import SessionIndex
+from aws_network_tap.models.spile import MirrorSession, Spile
+from aws_network_tap.models.tag_config import EC2Config, VPCTagConfig
+
+
+class StateStore:
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS sessions (
+            account TEXT, region TEXT, interface_id TEXT, session_number INTEGER,
+            session_id TEXT, target_id TEXT, filter_id TEXT, tags TEXT, packet_length INTEGER,
+            PRIMARY KEY (account, region, interface_id, session_number))""",
+        """CREATE TABLE IF NOT EXISTS interfaces (
+            account TEXT, region TEXT, interface_id TEXT, instance_id TEXT, vpc_id TEXT, fingerprint TEXT,
+            PRIMARY KEY (account, region, interface_id))""",
+        """CREATE TABLE IF NOT EXISTS vpcs (
+            account TEXT, region TEXT, vpc_id TEXT, fingerprint TEXT,
+            PRIMARY KEY (account, region, vpc_id))""",
+        """CREATE TABLE IF NOT EXISTS syncs (
+            account TEXT, region TEXT, full_sync REAL,
+            PRIMARY KEY (account, region))""",
+    ]
+    MIGRATIONS = [  # columns added since the first snapshots were written
+        "ALTER TABLE sessions ADD COLUMN packet_length INTEGER",
+    ]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with closing(self._connect()) as db, db:
+            for statement in self.SCHEMA:
+                db.execute(statement)
+            for statement in self.MIGRATIONS:
+                try:
+                    db.execute(statement)
+                except sqlite3.OperationalError as e:
+                    if 'duplicate column' not in str(e):
+                        raise
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection per call, so regions on different threads and processes can share the file
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def eni_fingerprint(spile: Spile) -> str:
+        """ everything about an ENI that can change its desired tap """
+        config = EC2Config(spile.eni_tag.tags)
+        return json.dumps([spile.eni_tag.state, spile.eni_tag.vpc_id, config.get_aws_tags()], sort_keys=True)
+
+    @staticmethod
+    def vpc_fingerprint(config: VPCTagConfig) -> str:
+        return json.dumps(config.get_aws_tags(), sort_keys=True)
+
+    def full_sync_due(self, account: str, region: str, interval: float) -> bool:
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT full_sync FROM syncs WHERE account = ? AND region = ?", (account, region)
+            ).fetchone()
+        return not row or time.time() - row[0] >= interval
+
+    def load_index(self, account: str, region: str) -> SessionIndex:
+        index = SessionIndex()
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT session_id, target_id, filter_id, interface_id, tags, packet_length, session_number "
+                "FROM sessions WHERE account = ? AND region = ?", (account, region)
+            ).fetchall()
+        for session_id, target_id, filter_id, interface_id, tags, packet_length, session_number in rows:
+            index.add(
+                MirrorSession(session_id, target_id, filter_id, interface_id, json.loads(tags), packet_length),
+                session_number,
+            )
+        return index
+
+    def drifted(self, account: str, region: str, session_index: SessionIndex) -> Set[str]:
+        """ the interface ids whose live sessions differ from the snapshot, such as a session deleted by hand """
+        known = self.load_index(account, region)
+        return {
+            interface_id for interface_id in known.interface_ids() | session_index.interface_ids()
+            if known.for_interface(interface_id) != session_index.for_interface(interface_id)
+        }
+
+    def changes(self, account: str, region: str, configs: Dict[str, VPCTagConfig],
+                spiles_by_vpc: Dict[str, List[Spile]],
+                session_index: SessionIndex = None) -> Tuple[Dict[str, List[Spile]], Set[str]]:
+        """
+        returns the ENIs to reconcile per vpc, and the interface ids that have disappeared since the snapshot.
+        Every ENI of a vpc whose config changed is reconciled, and every ENI whose sessions drifted from the
+        snapshot when the live session_index is given.
+        """
+        drifted = self.drifted(account, region, session_index) if session_index is not None else set()
+        with closing(self._connect()) as db:
+            known_vpcs = dict(db.execute(
+                "SELECT vpc_id, fingerprint FROM vpcs WHERE account = ? AND region = ?", (account, region)
+            ).fetchall())
+            known_enis = dict(db.execute(
+                "SELECT interface_id, fingerprint FROM interfaces WHERE account = ? AND region = ?", (account, region)
+            ).fetchall())
+        changed = {}  # type: Dict[str, List[Spile]]
+        seen = set()  # type: Set[str]
+        for vpc_id, spiles in spiles_by_vpc.items():
+            vpc_changed = known_vpcs.get(vpc_id) != self.vpc_fingerprint(configs[vpc_id])
+            changed[vpc_id] = []
+            for spile in spiles:
+                seen.add(spile.eni_tag.interface_id)
+                if vpc_changed or spile.eni_tag.interface_id in drifted or \
+                        known_enis.get(spile.eni_tag.interface_id) != self.eni_fingerprint(spile):
+                    changed[vpc_id].append(spile)
+        return changed, set(known_enis) - seen
+
+    def save(self, account: str, region: str, session_index: SessionIndex, configs: Dict[str, VPCTagConfig],
+             spiles: Iterable[Spile], failed: Set[str], full_sync: bool) -> None:
+        """
+        replace the snapshot of a region. ENIs whose writes failed are left out, so the next pass retries them.
+        """
+        scope = (account, region)
+        with closing(self._connect()) as db, db:
+            for table in ['sessions', 'interfaces', 'vpcs']:
+                db.execute(f"DELETE FROM {table} WHERE account = ? AND region = ?", scope)
+            db.executemany("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                scope + (x.interface_id, number, x.id, x.target_id, x.filter_id, json.dumps(x.tags), x.packet_length)
+                for (_, number), x in session_index.items()
+            ])
+            db.executemany("INSERT INTO interfaces VALUES (?, ?, ?, ?, ?, ?)", [
+                scope + (x.eni_tag.interface_id, x.eni_tag.instance_id, x.eni_tag.vpc_id, self.eni_fingerprint(x))
+                for x in spiles if x.eni_tag.interface_id not in failed
+            ])
+            db.executemany("INSERT INTO vpcs VALUES (?, ?, ?, ?)", [
+                scope + (vpc_id, self.vpc_fingerprint(config)) for vpc_id, config in configs.items()
+            ])
+            if full_sync:
+                db.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)", scope + (time.time(),))
@@ -3,12 +3,34 @@ These are models to hold business logic when using AWS Tags for persisted state,
 and to assist serializing back to AWS's tag format after transformations.
 """
 
-from typing import Union, List
+import logging
+from collections import namedtuple
+from typing import Dict, Union, List
 
 from aws_network_tap.models.aws_tag import AWSTag
 from aws_network_tap.constants import VENDOR
 
 
+Session_Slot = namedtuple("Session_Slot", "target_id priority filter_profile")  # filter_profile None is the eni's
+
+PACKET_LENGTH_MAX = 8500  # AWS accepts 1 to 8500 bytes
+
+
+def packet_length(value: Union[str, None]) -> Union[int, None]:
+    """ truncation length from a tag value, None mirrors whole packets (unset, 0 or invalid) """
+    if not value:
+        return None
+    try:
+        length = int(value)
+    except ValueError:
+        logging.warning(f'Ignoring invalid packet length {value}')
+        return None
+    if length > PACKET_LENGTH_MAX:
+        logging.warning(f'Ignoring packet length {value}, the maximum is {PACKET_LENGTH_MAX}')
+        return None
+    return length if length > 0 else None
+
+
 class TagConfig:
     """
     This is the abstract class. There are no tags keys defined, so it cannot hold any values.
@@ -31,12 +53,24 @@ class VPCTagConfig(TagConfig):
     """
     T_TARGET = VENDOR + ':session_mirroring_target'  # arn
     T_ENROLLMENT = VENDOR + ':session_mirroring_enrollment'  # enum (Auto)
+    T_TARGET_POOL = VENDOR + ':session_mirroring_target_pool'  # more targets, `tmt-a,tmt-b:limit`
+    T_TARGET_AZ = VENDOR + ':session_mirroring_target_az'  # per AZ targets, `us-east-1a=tmt-a,us-east-1b=tmt-b`
+    T_FILTER_PROFILE = VENDOR + ':session_mirroring_filter_profile'  # name, see FilterProfile
+    T_PACKET_LENGTH = VENDOR + ':session_mirroring_packet_length'  # bytes of each packet to mirror
+    T_SESSIONS = VENDOR + ':session_mirroring_sessions'  # more sessions per ENI, `tmt-a:2,tmt-b:3:profile`
 
     TAGS = [
         T_TARGET,
         T_ENROLLMENT,
+        T_TARGET_POOL,
+        T_TARGET_AZ,
+        T_FILTER_PROFILE,
+        T_PACKET_LENGTH,
+        T_SESSIONS,
     ]
 
+    TARGET_PRIORITY = 1  # of the vpc target, unless it is listed in T_SESSIONS
+
     @property
     def enabled(self) -> bool:
         return bool(self.target)
@@ -49,6 +83,69 @@ class VPCTagConfig(TagConfig):
     def target(self, value: Union[str, None]) -> None:
         self.tags[self.T_TARGET] = value if value else AWSTag.Delete
 
+    @property
+    def filter_profile(self) -> Union[str, None]:
+        return self.tags.get(self.T_FILTER_PROFILE) or None
+
+    @property
+    def packet_length(self) -> Union[int, None]:
+        return packet_length(self.tags.get(self.T_PACKET_LENGTH))
+
+    @property
+    def pooled(self) -> bool:
+        return bool(self.enabled and self.tags.get(self.T_TARGET_POOL))
+
+    @property
+    def target_pool(self) -> Dict[str, Union[int, None]]:
+        """ the target and the pool targets, each with its source limit if one is given """
+        pool = {}  # type: Dict[str, Union[int, None]]
+        if self.target:
+            pool[self.target] = None
+        for item in (self.tags.get(self.T_TARGET_POOL) or '').split(','):
+            target_id, _, limit = item.strip().partition(':')
+            if not target_id:
+                continue
+            try:
+                pool[target_id] = int(limit) if limit else None
+            except ValueError:
+                logging.warning(f'Ignoring pool target {item}, the limit is not a number')
+        return pool
+
+    @property
+    def az_targets(self) -> Dict[str, str]:
+        """ the target in each availability zone, so mirrored traffic stays in its zone """
+        az_targets = {}  # type: Dict[str, str]
+        for item in (self.tags.get(self.T_TARGET_AZ) or '').split(','):
+            az, _, target_id = item.strip().partition('=')
+            if az and target_id:
+                az_targets[az.strip()] = target_id.strip()
+        return az_targets
+
+    @property
+    def sessions(self) -> List[Session_Slot]:
+        """
+        the sessions of each ENI, by priority. A lower priority gets a lower session number,
+        and AWS mirrors a packet to the first session whose filter accepts it.
+        The session on the vpc target follows the pool and AZ tags.
+        """
+        if not self.enabled:
+            return []
+        slots = []  # type: List[Session_Slot]
+        for item in (self.tags.get(self.T_SESSIONS) or '').split(','):
+            target_id, _, rest = item.strip().partition(':')
+            priority, _, profile = rest.partition(':')
+            if not target_id:
+                continue
+            try:
+                number = int(priority) if priority else (slots[-1].priority if slots else 0) + 1
+            except ValueError:
+                logging.warning(f'Ignoring session {item}, the priority is not a number')
+                continue
+            slots.append(Session_Slot(target_id, number, profile or None))
+        if self.target not in [x.target_id for x in slots]:
+            slots.insert(0, Session_Slot(self.target, self.TARGET_PRIORITY, None))
+        return sorted(slots, key=lambda x: x.priority)
+
     V_ENROLLMENT_AUTO = 'auto'
     V_ENROLLMENT_WHITELIST = 'whitelist'
 
@@ -73,12 +170,19 @@ class EC2Config(TagConfig):
     """
     T_BLACKLIST = VENDOR + ':session_mirroring_blacklist'
     T_WHITELIST = VENDOR + ':session_mirroring_whitelist'
+    T_FILTER_PROFILE = VENDOR + ':session_mirroring_filter_profile'  # overrides the vpc's profile
+    T_PACKET_LENGTH = VENDOR + ':session_mirroring_packet_length'  # overrides the vpc's packet length
 
-    TAGS = [
+    LIST_TAGS = [
         T_BLACKLIST,
         T_WHITELIST,
     ]
 
+    TAGS = LIST_TAGS + [
+        T_FILTER_PROFILE,
+        T_PACKET_LENGTH,
+    ]
+
     V_TRUE = 'True'
     V_FALSE = AWSTag.Delete
 
@@ -105,3 +209,23 @@ class EC2Config(TagConfig):
         if value and self.blacklist:
             raise ValueError('cannot whitelist an instance which is blacklisted')
         self.tags[self.T_WHITELIST] = self.V_TRUE if value else self.V_FALSE
+
+    @property
+    def filter_profile(self) -> Union[str, None]:
+        return self.tags.get(self.T_FILTER_PROFILE) or None
+
+    @property
+    def packet_length(self) -> Union[int, None]:
+        return packet_length(self.tags.get(self.T_PACKET_LENGTH))
+
+    def packet_length_for(self, vpc_config: VPCTagConfig) -> Union[int, None]:
+        """ bytes of each packet to mirror, None mirrors whole packets. An instance tag of 0 undoes the vpc's """
+        if self.tags.get(self.T_PACKET_LENGTH):
+            return self.packet_length
+        return vpc_config.packet_length
+
+    def enrolled(self, vpc_config: VPCTagConfig) -> bool:
+        """ should this instance be tapped under the vpc's enrollment mode """
+        if vpc_config.auto_enrollment:
+            return not self.blacklist
+        return bool(self.whitelist)
@@ -0,0 +1,76 @@
+"""
+Spreads the ENIs of a VPC across a pool of mirror targets, within the number of sources each target accepts.
+"""
+import hashlib
+import logging
+from collections import namedtuple
+from typing import Dict, Iterable, List, Union
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient
+from aws_network_tap.models.session_index import SessionIndex
+
+Target_Slot = namedtuple("Target_Slot", "target_id limit")  # limit None is unbounded
+
+
+class TargetScheduler:
+    """
+    An ENI stays on its current target while that target is in the pool and has room.
+    Other ENIs go to the target with the highest rendezvous hash that has room,
+    so growing or shrinking the pool only moves the ENIs that have to move.
+    """
+    NIC_SOURCES_MAX = 10  # AWS quota of sessions per network interface target
+
+    def __init__(self, slots: List[Target_Slot], used: Dict[str, int] = None) -> None:
+        self.slots = {x.target_id: x for x in slots}
+        self.used = dict(used or {})  # sources already on each target
+
+    @classmethod
+    def for_pool(cls, pool: Dict[str, Union[int, None]], target_types: Dict[str, str],
+                 session_index: SessionIndex = None, interface_ids: Iterable[str] = ()) -> 'TargetScheduler':
+        """
+        pool as VPCTagConfig.target_pool, network interface targets default to the AWS quota.
+        Sessions on the pool targets from ENIs outside interface_ids count against the limits.
+        """
+        slots = []
+        for target_id, limit in pool.items():
+            if limit is None and target_types.get(target_id) == Ec2ApiClient.TARGET_NIC:
+                limit = cls.NIC_SOURCES_MAX
+            slots.append(Target_Slot(target_id, limit))
+        assigning = set(interface_ids)
+        used = {}  # type: Dict[str, int]
+        for mirror_session in session_index or []:
+            if mirror_session.target_id in pool and mirror_session.interface_id not in assigning:
+                used[mirror_session.target_id] = used.get(mirror_session.target_id, 0) + 1
+        return cls(slots, used)
+
+    @staticmethod
+    def weight(interface_id: str, target_id: str) -> int:
+        return int(hashlib.sha1(f'{interface_id}/{target_id}'.encode()).hexdigest()[:16], 16)
+
+    def has_room(self, target_id: str) -> bool:
+        limit = self.slots[target_id].limit
+        return limit is None or self.used.get(target_id, 0) < limit
+
+    def _take(self, interface_id: str, target_id: str, assigned: Dict[str, Union[str, None]]) -> None:
+        self.used[target_id] = self.used.get(target_id, 0) + 1
+        assigned[interface_id] = target_id
+
+    def assign(self, interface_ids: Iterable[str], current: Dict[str, str] = None) -> Dict[str, Union[str, None]]:
+        """ target of each ENI, None when the whole pool is full """
+        current = current or {}
+        interface_ids = sorted(set(interface_ids))
+        assigned = {}  # type: Dict[str, Union[str, None]]
+        for interface_id in interface_ids:  # existing sessions first, so they are never displaced
+            target_id = current.get(interface_id)
+            if target_id and target_id in self.slots and self.has_room(target_id):
+                self._take(interface_id, target_id, assigned)
+        for interface_id in interface_ids:
+            if interface_id in assigned:
+                continue
+            ranked = sorted(self.slots, key=lambda x: self.weight(interface_id, x), reverse=True)
+            room = [x for x in ranked if self.has_room(x)]
+            if room:
+                self._take(interface_id, room[0], assigned)
+            else:
+                logging.warning(f'Every mirror target in the pool is full, unable to tap {interface_id}')
+                assigned[interface_id] = None
+        return assigned
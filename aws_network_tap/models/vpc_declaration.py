@@ -0,0 +1,96 @@
+"""
+Declared VPC configuration, the file read by `session_mirror_config_vpc --apply`.
+
+    vpcs:
+      - selector: {Environment: prod*}   # VPCs whose tags match (values are shell patterns)
+        target: nlb                      # the VPC's own NLB mirror target, found or created
+        enrollment: auto
+      - vpc: vpc-0123456789abcdef0       # one VPC
+        target: tmt-0123456789abcdef0
+        enrollment: whitelist
+      - vpc: vpc-0fedcba9876543210
+        target: none                     # disable mirroring
+
+Each VPC takes the last entry matching it, so specific entries can follow broad selectors.
+VPCs matching no entry are left alone.
+"""
+import fnmatch
+import json
+from collections import namedtuple
+from typing import Any, Dict, Iterable, List, Union
+import yaml  # type: ignore
+from aws_network_tap.models.aws_tag import AWSTag
+from aws_network_tap.models.ec2_api_client import VPC_Props
+from aws_network_tap.models.tag_config import VPCTagConfig
+
+VPC_Declared = namedtuple("VPC_Declared", "vpc_prop target enrollment")
+
+
+class VPCDeclaration:
+    TARGET_NLB = 'nlb'
+    TARGET_NONE = 'none'
+
+    def __init__(self, entries: List[Dict[str, Any]]) -> None:
+        for entry in entries:
+            self.validate(entry)
+        self.entries = entries
+
+    @classmethod
+    def load(cls, path: str) -> 'VPCDeclaration':
+        with open(path) as f:
+            document = json.load(f) if path.endswith('.json') else yaml.safe_load(f)
+        entries = document.get('vpcs') if isinstance(document, dict) else document
+        if not isinstance(entries, list):
+            raise ValueError(f'{path}: expected a list of vpcs')
+        return cls(entries)
+
+    @classmethod
+    def validate(cls, entry: Dict[str, Any]) -> None:
+        if not isinstance(entry, dict) or not (entry.get('vpc') or entry.get('selector')):
+            raise ValueError(f'each entry needs a vpc or a selector: {entry}')
+        if entry.get('selector') is not None and not isinstance(entry['selector'], dict):
+            raise ValueError(f'a selector is a mapping of tag keys to values: {entry}')
+        if not entry.get('target'):
+            raise ValueError(f'each entry needs a target, `{cls.TARGET_NLB}` or `{cls.TARGET_NONE}`: {entry}')
+        if entry.get('enrollment', VPCTagConfig.V_ENROLLMENT_AUTO) not in [
+            VPCTagConfig.V_ENROLLMENT_AUTO, VPCTagConfig.V_ENROLLMENT_WHITELIST
+        ]:
+            raise ValueError(f'illegal enrollment: {entry}')
+
+    @staticmethod
+    def matches(entry: Dict[str, Any], vpc_prop: VPC_Props) -> bool:
+        if entry.get('vpc') and entry['vpc'] != vpc_prop.vpc_id:
+            return False
+        for key, pattern in (entry.get('selector') or {}).items():
+            value = vpc_prop.tags.get(key)
+            if value is None or not fnmatch.fnmatchcase(value, str(pattern)):
+                return False
+        return True
+
+    def declared(self, vpc_props: Iterable[VPC_Props]) -> List[VPC_Declared]:
+        """ the declared config of each matched VPC """
+        result = []
+        for vpc_prop in vpc_props:
+            entry = None  # type: Union[Dict[str, Any], None]
+            for candidate in self.entries:
+                if self.matches(candidate, vpc_prop):
+                    entry = candidate
+            if entry is None:
+                continue
+            target = None if entry['target'] == self.TARGET_NONE else entry['target']
+            enrollment = entry.get('enrollment', VPCTagConfig.V_ENROLLMENT_AUTO) if target else AWSTag.Delete
+            result.append(VPC_Declared(vpc_prop, target, enrollment))
+        return result
+
+    @staticmethod
+    def config(declared: VPC_Declared, target_id: Union[str, None]) -> Union[VPCTagConfig, None]:
+        """ the tags to write for a resolved target id, None when the VPC already has them """
+        current = VPCTagConfig(declared.vpc_prop.tags)
+        if current.target == target_id and current.tags.get(VPCTagConfig.T_ENROLLMENT) == declared.enrollment:
+            return None
+        if not target_id and not current.enabled and not current.tags.get(VPCTagConfig.T_ENROLLMENT):
+            return None
+        config = VPCTagConfig(dict(declared.vpc_prop.tags))
+        config.target = target_id
+        config.enrollment = declared.enrollment
+        return config
@@ -6,19 +6,330 @@ Took takes a "tap everything" approach at the VPC level.
 Specific instances can be opted out with the blacklist tool.
 
 """
+import argparse
 import logging
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+from aws_network_tap.models.assumed_role import AssumedRole
+from aws_network_tap.models.client_pool import ClientPool
+from aws_network_tap.models.daemon import Liveness, ResyncScheduler
 from aws_network_tap.models.ec2_api_client import Ec2ApiClient, VPC_Props
+from aws_network_tap.models.event_reconciler import EventReconciler
+from aws_network_tap.models.event_source import EventCoalescer, EventSource, JsonLinesEventSource, SqsEventSource
+from aws_network_tap.models.filter_profile import FilterProfile
+from aws_network_tap.models.metrics import Metrics
+from aws_network_tap.models.mirror_plan import MirrorPlan
+from aws_network_tap.models.profiler import Profiler
+from aws_network_tap.models.rate_governor import RateGovernor
+from aws_network_tap.models.run_summary import Region_Result, RunSummary
+from aws_network_tap.models.sap_filter import SapFilter
+from aws_network_tap.models.session_executor import SessionExecutor
+from aws_network_tap.models.session_index import SessionIndex
 from aws_network_tap.models.spile_tapper import SpileTapper
+from aws_network_tap.models.state_store import StateStore
 from aws_network_tap.models.tag_config import VPCTagConfig
 
+ALL_REGIONS = 'all'
+HEARTBEAT = 30  # seconds between liveness updates while the daemon waits
 
-def main() -> None:
+STOPPING = threading.Event()  # set on SIGTERM: in-flight writes finish, nothing new starts
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Create or remove Traffic Mirroring Sessions for configured VPCs')
+    parser.add_argument('--plan-only', action='store_true',
+                        help='print the planned session changes without applying them')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='maximum concurrent session writes, reduced automatically when throttled (default 8)')
+    parser.add_argument('--regions', default=None,
+                        help=f'comma separated regions to reconcile concurrently, or `{ALL_REGIONS}` for every '
+                             f'enabled region (default: the current region)')
+    parser.add_argument('--filter-cache', default=None,
+                        help='json file remembering the Traffic Mirror Filter id of each account and region')
+    parser.add_argument('--filter-profiles', default=None,
+                        help='yaml or json file of named Traffic Mirror Filter profiles, picked per VPC or instance '
+                             'with the session_mirroring_filter_profile tag')
+    parser.add_argument('--state-file', default=None,
+                        help='sqlite file holding the last reconciled state; passes then only reconcile changes')
+    parser.add_argument('--full-resync-interval', type=float, default=3600,
+                        help='seconds between full resyncs when using --state-file (default 3600)')
+    parser.add_argument('--full-resync', action='store_true',
+                        help='ignore the state file for this pass and reconcile everything')
+    parser.add_argument('--events-file', default=None,
+                        help='event mode: reconcile instances from EC2 state-change events, one JSON per line '
+                             '(`-` for stdin)')
+    parser.add_argument('--events-queue', default=None,
+                        help='event mode: SQS queue url receiving EC2 state-change events')
+    parser.add_argument('--event-window', type=float, default=5.0,
+                        help='seconds to coalesce events after the first of a burst (default 5)')
+    parser.add_argument('--roles-file', default=None,
+                        help='organisation mode: file of IAM role ARNs, one per line, to assume and reconcile')
+    parser.add_argument('--external-id', default=None,
+                        help='external id to pass when assuming the roles')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='organisation mode: number of accounts reconciled in parallel (default: cpu count)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running, with incremental passes every --interval seconds and a full resync '
+                             'every --full-resync-interval seconds, needs --state-file')
+    parser.add_argument('--interval', type=float, default=300,
+                        help='daemon mode: seconds between incremental passes (default 300)')
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help='daemon mode: random fraction added to or taken from each interval (default 0.1)')
+    parser.add_argument('--liveness-file', default=None,
+                        help='daemon mode: json file updated with the daemon status, for liveness probes')
+    parser.add_argument('--api-rates', default='describe=20,mutate=5',
+                        help='EC2 requests per second for describe and mutating calls, slowed automatically when '
+                             'throttled, or `off` (default describe=20,mutate=5)')
+    parser.add_argument('--api-rate-file', default=None,
+                        help='file sharing the api rates with every session_mirror_tap process on the host')
+    parser.add_argument('--profile', default=None,
+                        help=f'profile the run into a .pstats, .folded (flamegraph stacks) or .json (Chrome trace) '
+                             f'file, also set by the {Profiler.ENV} environment variable')
+    Metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if args.daemon and not args.state_file:
+        parser.error('--daemon needs --state-file, without it every pass reconciles everything')
+    if args.roles_file and (args.daemon or args.events_file or args.events_queue):
+        parser.error('--roles-file cannot be combined with --daemon, --events-file or --events-queue')
+    return args
+
+
+def setup(args: argparse.Namespace) -> None:
+    """ process level settings, repeated in each worker process """
     logging.getLogger().setLevel(logging.INFO)
-    region = Ec2ApiClient.get_region()
-    for vpc_prop in Ec2ApiClient.list_vpcs(region=region):  # type: VPC_Props
+    if args.concurrency > ClientPool.options['max_pool_connections']:
+        ClientPool.configure(max_pool_connections=args.concurrency)
+    if args.api_rates != 'off':
+        ClientPool.govern(RateGovernor(RateGovernor.parse_rates(args.api_rates), path=args.api_rate_file))
+    SapFilter.cache_path = args.filter_cache
+    SapFilter.profiles = FilterProfile.load(args.filter_profiles) if args.filter_profiles else {}
+    Metrics.setup(args)
+
+
+def print_plan(plan: MirrorPlan) -> None:
+    for action in plan.ordered():
+        print(MirrorPlan.describe(action))
+
+
+def resolve_regions(regions: str = None) -> List[str]:
+    if not regions:
+        return [Ec2ApiClient.get_region()]
+    if regions == ALL_REGIONS:
+        return Ec2ApiClient.list_regions(region=Ec2ApiClient.get_region())
+    resolved = [x.strip() for x in regions.split(',') if x.strip()]
+    if not resolved:
+        raise ValueError(f'--regions `{regions}` names no region, expected a comma separated list or `{ALL_REGIONS}`')
+    return resolved
+
+
+def tap_region(region: str, args: argparse.Namespace) -> Region_Result:
+    """
+    reconcile every configured VPC of one region
+    With a state file, only what changed since the last pass is reconciled, until a full resync is due.
+    """
+    start = time.monotonic()
+    account = ClientPool.account_id()
+    usage_key = RateGovernor.key(account, region)
+    usage = ClientPool.governor.usage(usage_key) if ClientPool.governor else {}
+    plan = MirrorPlan()
+    executor = SessionExecutor(max_workers=args.concurrency, stopping=STOPPING)
+    store = StateStore(args.state_file) if args.state_file else None
+    incremental = False
+    if store and not args.full_resync:
+        incremental = not store.full_sync_due(account, region, args.full_resync_interval)
+    with Metrics.phase(Metrics.LOOKUP):  # one paginated call, listed on incremental passes too to see drift
+        session_index = SessionIndex.build(Ec2ApiClient._get_client(region=region))
+    configs = {}  # type: Dict[str, VPCTagConfig]
+    with Metrics.phase(Metrics.VPC_LISTING):
+        vpc_props = list(Ec2ApiClient.list_vpcs(region=region, configured_only=True))  # type: List[VPC_Props]
+    for vpc_prop in vpc_props:
+        configs[vpc_prop.vpc_id] = VPCTagConfig(vpc_prop.tags)
         logging.info(f" Managing Session Mirroring for VPC {vpc_prop.name}: {vpc_prop.vpc_id}")
-        config = VPCTagConfig(vpc_prop.tags)
-        SpileTapper.manage(region=region, vpc_ids=[vpc_prop.vpc_id], config=config)
+    enabled = [vpc_id for vpc_id, config in configs.items() if config.enabled]
+    with Metrics.phase(Metrics.DISCOVERY):
+        spiles_by_vpc = SpileTapper(region=region, vpc_ids=enabled).discover_by_vpc(session_index=session_index)
+    to_reconcile = spiles_by_vpc
+    vanished = None  # type: Optional[Set[str]]
+    if store and incremental:
+        to_reconcile, vanished = store.changes(account, region, configs, spiles_by_vpc, session_index)
+        logging.info(f" {region} incremental pass, {sum(len(x) for x in to_reconcile.values())} ENIs changed")
+    for vpc_id in enabled:
+        if STOPPING.is_set():
+            break
+        if incremental and not to_reconcile[vpc_id]:
+            continue
+        with Profiler.span('vpc', vpc_id=vpc_id, region=region) as span:
+            vpc_plan = SpileTapper.manage(
+                region=region, vpc_ids=[vpc_id], config=configs[vpc_id], session_index=session_index,
+                plan_only=args.plan_only, executor=executor, spiles=to_reconcile[vpc_id]
+            )
+            span.tag(actions=vpc_plan.counts())
+        logging.info(f" VPC {vpc_id} plan: {vpc_plan.counts()}")
+        plan.extend(vpc_plan)
+    with Metrics.phase(Metrics.LOOKUP):
+        orphans = SpileTapper.plan_orphans(region=region, session_index=session_index, interface_ids=vanished)
+    logging.info(f" {region} orphaned sessions plan: {orphans.counts()}")
+    Metrics.count_actions(MirrorPlan.ORPHANS, orphans.counts())
+    if not args.plan_only:
+        with Metrics.phase(Metrics.WRITE):
+            executor.run(orphans)
+        logging.info(f" {region} session writes: {executor.report}")
+    plan.extend(orphans)
+    if args.plan_only:
+        print_plan(plan)
+    elif store and not STOPPING.is_set():  # an interrupted pass leaves the snapshot to the next full resync
+        store.save(
+            account, region, session_index, configs, [x for y in spiles_by_vpc.values() for x in y],
+            failed={x.interface_id for x in executor.report.errors} | set(executor.report.skipped),
+            full_sync=not incremental
+        )
+    if ClientPool.governor:
+        usage = RateGovernor.since(ClientPool.governor.usage(usage_key), usage)
+    return Region_Result(
+        account, region, plan.counts(), executor.report.counts, executor.report.errors,
+        time.monotonic() - start, None, len(plan.az_fallbacks), usage
+    )
+
+
+def tap_region_isolated(region: str, args: argparse.Namespace) -> Region_Result:
+    """ a failing region is reported without affecting the others """
+    start = time.monotonic()
+    try:
+        return tap_region(region, args)
+    except Exception as e:
+        logging.exception(f'Failed to manage Session Mirroring in {region}')
+        return Region_Result(None, region, {}, {}, [], time.monotonic() - start, str(e), 0, None)
+
+
+def tap_regions(regions: List[str], args: argparse.Namespace) -> List[Region_Result]:
+    with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+        return list(pool.map(lambda region: tap_region_isolated(region, args), regions))
+
+
+def tap_account(role_arn: str, args: argparse.Namespace) -> Tuple[List[Region_Result], Dict[str, Any]]:
+    """
+    runs in a worker process: assume the role, then reconcile its regions with the usual logic.
+    Returns the metrics of the account with its results.
+    """
+    start = time.monotonic()
+    ClientPool.clear()  # never reuse connections inherited from the parent process
+    Metrics.clear()
+    setup(args)
+    try:
+        AssumedRole(role_arn, external_id=args.external_id).register()
+        regions = resolve_regions(args.regions)
+    except Exception as e:
+        logging.exception(f'Failed to assume {role_arn}')
+        error = Region_Result(role_arn, args.regions or '-', {}, {}, [], time.monotonic() - start, str(e), 0, None)
+        return [error], Metrics.report()
+    return tap_regions(regions, args), Metrics.report()
+
+
+def tap_accounts(role_arns: List[str], args: argparse.Namespace) -> List[Region_Result]:
+    results = []  # type: List[Region_Result]
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        for account_results, report in pool.map(tap_account, role_arns, [args] * len(role_arns)):
+            results.extend(account_results)
+            Metrics.merge(report)
+    return results
+
+
+def tap_events(args: argparse.Namespace) -> None:
+    """ reconcile single instances as their state-change events arrive, until the source closes """
+    region = resolve_regions(args.regions)[0]
+    if args.events_queue:
+        reconcile_events(SqsEventSource(args.events_queue, region=region), region, args)
+    elif args.events_file == '-':
+        reconcile_events(JsonLinesEventSource(sys.stdin), region, args)
+    else:
+        with open(args.events_file) as f:
+            reconcile_events(JsonLinesEventSource(f), region, args)
+
+
+def reconcile_events(source: EventSource, region: str, args: argparse.Namespace) -> None:
+    executor = SessionExecutor(max_workers=args.concurrency)
+    reconciler = EventReconciler(default_region=region, executor=executor, plan_only=args.plan_only)
+    for events in EventCoalescer(source, window=args.event_window).batches():
+        try:
+            plan = reconciler.reconcile(events)
+        except Exception:
+            logging.exception('Failed to reconcile events, they will be redelivered')
+            continue
+        finally:
+            Metrics.write(args)
+        if args.plan_only:
+            print_plan(plan)
+        source.ack(events)
+    logging.info(f'Event source closed, session writes: {executor.report}')
+
+
+def tap_daemon(args: argparse.Namespace) -> None:
+    """ long running: the process keeps its clients, filter ids and instance types warm between passes """
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: STOPPING.set())
+    regions = resolve_regions(args.regions)
+    scheduler = ResyncScheduler(args.interval, args.full_resync_interval, jitter=args.jitter)
+    liveness = Liveness(args.liveness_file)
+    liveness.update(state='idle')
+    while True:
+        delay, full = scheduler.next_pass()
+        if delay > 0 and not STOPPING.wait(min(delay, HEARTBEAT)):
+            liveness.update()
+            continue
+        if STOPPING.is_set():
+            break
+        liveness.update(state='full resync' if full else 'incremental')
+        if full:
+            SapFilter.clear()  # look the filters up again, they may have been deleted or their profile edited
+        start = time.monotonic()
+        pass_args = argparse.Namespace(**vars(args))
+        pass_args.full_resync = full
+        pass_args.full_resync_interval = float('inf')  # the scheduler decides when to resync
+        summary = RunSummary()
+        summary.extend(tap_regions(regions, pass_args))
+        for line in summary.lines():
+            logging.info(line)
+        scheduler.completed(full)
+        Metrics.write(args)
+        errors = [f'{x.region}: {x.error}' for x in summary if x.error]
+        liveness.completed(full, time.monotonic() - start, error='; '.join(errors) or None)
+    logging.info('Stopped')
+    liveness.update(state='stopped')
+
+
+def main(argv: List[str] = None) -> None:
+    args = parse_args(argv)
+    profile = Profiler.path(args.profile)
+    if profile:
+        Profiler.run(profile, run, args)
+    else:
+        run(args)
+
+
+def run(args: argparse.Namespace) -> None:
+    setup(args)
+    if args.events_file or args.events_queue:
+        tap_events(args)
+        return
+    if args.daemon:
+        tap_daemon(args)
+        return
+    summary = RunSummary()
+    if args.roles_file:
+        summary.extend(tap_accounts(AssumedRole.read_roles(args.roles_file), args))
+    else:
+        summary.extend(tap_regions(resolve_regions(args.regions), args))
+    for line in summary.lines():
+        print(line)
+    Metrics.write(args)
+    if summary.failed:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
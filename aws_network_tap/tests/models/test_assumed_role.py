@@ -0,0 +1,50 @@
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from aws_network_tap.models.assumed_role import AssumedRole
+from aws_network_tap.models.client_pool import ClientPool
+
+ROLE = 'arn:aws:iam::123456789012:role/VectraTap'
+
+
+class TestAssumedRole(TestCase):
+
+    def tearDown(self):
+        ClientPool.clear()
+
+    def sts_factory(self, expiration):
+        sts = MagicMock()
+        sts.assume_role.return_value = {'Credentials': {
+            'AccessKeyId': 'AKIA', 'SecretAccessKey': 'secret', 'SessionToken': 'token', 'Expiration': expiration,
+        }}
+        return sts
+
+    def test_invalid_arn(self):
+        with self.assertRaises(ValueError):
+            AssumedRole('arn:aws:iam::123456789012:user/bob')
+
+    def test_session_refreshes_before_expiry(self):
+        sts = self.sts_factory(datetime.now(timezone.utc) + timedelta(minutes=5))
+        with patch.object(ClientPool, 'client', return_value=sts):
+            session = AssumedRole(ROLE, external_id='xyz').session()
+            self.assertEqual('AKIA', session.get_credentials().get_frozen_credentials().access_key)
+        # 5 minutes remaining is inside botocore's refresh window, so the role was assumed again
+        self.assertEqual(2, sts.assume_role.call_count)
+        self.assertEqual('xyz', sts.assume_role.call_args[1]['ExternalId'])
+
+    def test_register(self):
+        sts = self.sts_factory(datetime.now(timezone.utc) + timedelta(hours=1))
+        with patch.object(ClientPool, 'client', return_value=sts):
+            AssumedRole(ROLE).register()
+        self.assertEqual(ROLE, ClientPool.credentials)
+        self.assertIsNotNone(ClientPool.session(ROLE))
+
+    def test_read_roles(self):
+        with tempfile.NamedTemporaryFile('w', delete=False) as f:
+            f.write(f'# accounts\n{ROLE}\n\n  arn:aws:iam::210987654321:role/VectraTap  # prod\n')
+        try:
+            self.assertEqual([ROLE, 'arn:aws:iam::210987654321:role/VectraTap'], AssumedRole.read_roles(f.name))
+        finally:
+            os.unlink(f.name)
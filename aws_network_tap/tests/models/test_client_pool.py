@@ -0,0 +1,61 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from aws_network_tap.models.client_pool import ClientPool
+
+
+class TestClientPool(TestCase):
+
+    def setUp(self):
+        ClientPool.clear()
+
+    def tearDown(self):
+        ClientPool.clear()
+
+    def test_client_reused(self):
+        client = ClientPool.client('ec2', region='us-east-1')
+        self.assertIs(client, ClientPool.client('ec2', region='us-east-1'))
+        self.assertIsNot(client, ClientPool.client('ec2', region='us-west-2'))
+        self.assertEqual(50, client.meta.config.max_pool_connections)
+
+    def test_configure(self):
+        original = dict(ClientPool.options)
+        try:
+            client = ClientPool.client('ec2', region='us-east-1')
+            ClientPool.configure(max_pool_connections=7)
+            rebuilt = ClientPool.client('ec2', region='us-east-1')
+            self.assertIsNot(client, rebuilt)
+            self.assertEqual(7, rebuilt.meta.config.max_pool_connections)
+        finally:
+            ClientPool.options = original
+
+    @patch.object(ClientPool, 'account_id', return_value='123456789012')
+    def test_govern(self, account_id):
+        governor = MagicMock()
+        ec2 = ClientPool.client('ec2', region='us-east-1')
+        ClientPool.govern(governor)
+        governed = ClientPool.client('ec2', region='us-east-1')
+        self.assertIsNot(ec2, governed)
+        governor.attach.assert_called_once_with(governed, '123456789012/us-east-1')
+        account_id.assert_called_once_with(ClientPool.DEFAULT_CREDENTIALS)
+        ClientPool.client('sts')
+        governor.attach.assert_called_once()
+
+    def test_configure_unknown(self):
+        with self.assertRaises(ValueError):
+            ClientPool.configure(catfood=True)
+
+    def test_named_credentials(self):
+        session = MagicMock()
+        ClientPool.add_session('arn:aws:iam::123456789012:role/Tap', session)
+        ClientPool.client('ec2', region='us-east-1', credentials='arn:aws:iam::123456789012:role/Tap')
+        session.client.assert_called_once()
+        with self.assertRaises(KeyError):
+            ClientPool.session('nobody')
+
+    def test_account_id_resolved_once(self):
+        sts = MagicMock()
+        sts.get_caller_identity.return_value = {'Account': '123456789012'}
+        with patch.object(ClientPool, 'client', return_value=sts):
+            self.assertEqual('123456789012', ClientPool.account_id())
+            self.assertEqual('123456789012', ClientPool.account_id())
+        sts.get_caller_identity.assert_called_once()
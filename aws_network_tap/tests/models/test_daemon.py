@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from aws_network_tap.models.daemon import Liveness, ResyncScheduler
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResyncScheduler(TestCase):
+
+    def test_first_pass_is_full(self):
+        scheduler = ResyncScheduler(300, 3600, jitter=0, clock=FakeClock())
+        self.assertEqual((0.0, True), scheduler.next_pass())
+
+    def test_incremental_between_full(self):
+        clock = FakeClock()
+        scheduler = ResyncScheduler(300, 1000, jitter=0, clock=clock)
+        scheduler.completed(full=True)
+        self.assertEqual((300, False), scheduler.next_pass())
+        for _ in range(3):
+            clock.now += 300
+            scheduler.completed(full=False)
+        self.assertEqual((100, True), scheduler.next_pass())
+
+    def test_jitter(self):
+        clock = FakeClock()
+        scheduler = ResyncScheduler(100, 1000, jitter=0.2, clock=clock)
+        for _ in range(20):
+            scheduler.completed(full=True)
+            delay, full = scheduler.next_pass()
+            self.assertFalse(full)
+            self.assertTrue(80 <= delay <= 120)
+
+    def test_bad_jitter(self):
+        with self.assertRaises(ValueError):
+            ResyncScheduler(100, 1000, jitter=1)
+
+
+class TestLiveness(TestCase):
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'live.json')
+            liveness = Liveness(path)
+            liveness.update(state='idle')
+            liveness.completed(full=True, seconds=1.5)
+            liveness.completed(full=False, seconds=0.5, error='us-east-1: boom')
+            with open(path) as f:
+                status = json.load(f)
+        self.assertEqual(2, status['passes'])
+        self.assertEqual('idle', status['state'])
+        self.assertEqual('us-east-1: boom', status['last_error'])
+        self.assertIsNotNone(status['last_full_sync'])
+        self.assertLess(status['last_full_sync'], status['last_pass'] + 1)
+
+    def test_no_file(self):
+        liveness = Liveness()
+        liveness.completed(full=False, seconds=1)
+        self.assertEqual(1, liveness.status['passes'])
+        self.assertIsNone(liveness.status['last_full_sync'])
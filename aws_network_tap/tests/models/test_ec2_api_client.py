@@ -0,0 +1,121 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from aws_network_tap.models.client_pool import ClientPool
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient
+from aws_network_tap.models.tag_config import EC2Config
+
+LB_1 = 'arn:aws:elasticloadbalancing:us-east-1:123:loadbalancer/net/one/1'
+LB_GONE = 'arn:aws:elasticloadbalancing:us-east-1:123:loadbalancer/net/gone/2'
+
+
+class TestListMirrorTargets(TestCase):
+
+    def setUp(self):
+        Ec2ApiClient.mirror_targets.clear()
+        self.ec2 = MagicMock()
+        self.elbv2 = MagicMock()
+        pages = {
+            'describe_traffic_mirror_targets': [{'TrafficMirrorTargets': [
+                {'TrafficMirrorTargetId': 'tmt-eni', 'Type': Ec2ApiClient.TARGET_NIC, 'NetworkInterfaceId': 'eni-1'},
+                {'TrafficMirrorTargetId': 'tmt-eni-gone', 'Type': Ec2ApiClient.TARGET_NIC,
+                 'NetworkInterfaceId': 'eni-gone'},
+            ]}, {'TrafficMirrorTargets': [
+                {'TrafficMirrorTargetId': 'tmt-nlb', 'Type': Ec2ApiClient.TARGET_NLB, 'NetworkLoadBalancerArn': LB_1},
+                {'TrafficMirrorTargetId': 'tmt-nlb-gone', 'Type': Ec2ApiClient.TARGET_NLB,
+                 'NetworkLoadBalancerArn': LB_GONE},
+            ]}],
+            'describe_network_interfaces': [{'NetworkInterfaces': [{'NetworkInterfaceId': 'eni-1', 'VpcId': 'vpc-1'}]}],
+        }
+
+        def get_paginator(operation):
+            paginator = MagicMock()
+            paginator.paginate.return_value = pages[operation]
+            return paginator
+        self.ec2.get_paginator.side_effect = get_paginator
+
+        def describe_load_balancers(LoadBalancerArns):
+            if LB_GONE in LoadBalancerArns:
+                raise Exception('One or more load balancers not found')
+            return {'LoadBalancers': [{'LoadBalancerArn': LB_1, 'VpcId': 'vpc-2', 'Scheme': 'internal'}]}
+        self.elbv2.describe_load_balancers.side_effect = describe_load_balancers
+
+    def tearDown(self):
+        Ec2ApiClient.mirror_targets.clear()
+
+    def client(self, service, region=None, credentials=None):
+        return self.elbv2 if service == 'elbv2' else self.ec2
+
+    def test_batched_and_cached(self):
+        with patch.object(ClientPool, 'client', side_effect=self.client):
+            targets = Ec2ApiClient.list_mirror_targets(region='us-east-1')
+            self.assertEqual(targets, Ec2ApiClient.list_mirror_targets(region='us-east-1'))
+        self.assertEqual(['tmt-eni', 'tmt-nlb'], [x.target_id for x in targets])
+        self.assertEqual(('vpc-1', True), (targets[0].vpc_id, targets[0].vpc_bound))
+        self.assertEqual(('vpc-2', True), (targets[1].vpc_id, targets[1].vpc_bound))
+        # one batch of two, then a one at a time retry for the batch holding the deleted NLB
+        self.assertEqual(3, self.elbv2.describe_load_balancers.call_count)
+        self.assertEqual(2, self.ec2.get_paginator.call_count)
+
+    def test_refresh(self):
+        with patch.object(ClientPool, 'client', side_effect=self.client):
+            Ec2ApiClient.list_mirror_targets(region='us-east-1')
+            Ec2ApiClient.list_mirror_targets(region='us-east-1', refresh=True)
+        self.assertEqual(4, self.ec2.get_paginator.call_count)
+
+
+class TestGetRegion(TestCase):
+
+    def setUp(self):
+        Ec2ApiClient.cache.pop('region', None)
+
+    def tearDown(self):
+        Ec2ApiClient.cache.pop('region', None)
+
+    def test_environment_first(self):
+        with patch.dict('os.environ', {'AWS_REGION': 'eu-west-3'}), \
+                patch.object(ClientPool, 'session', side_effect=AssertionError('not expected')), \
+                patch.dict('sys.modules', {'ec2_metadata': None}):
+            self.assertEqual('eu-west-3', Ec2ApiClient.get_region())
+
+
+class TestTagInstances(TestCase):
+
+    def setUp(self):
+        self.ec2 = MagicMock()
+        patcher = patch.object(Ec2ApiClient, '_get_client', return_value=self.ec2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_chunks(self):
+        ids = [f'i-{n:04x}' for n in range(450)]
+        failures = Ec2ApiClient.tag_instances('us-east-1', ids, EC2Config.T_BLACKLIST, enabled=True)
+        self.assertEqual({}, failures)
+        self.assertEqual(3, self.ec2.create_tags.call_count)
+        tagged = [x for call in self.ec2.create_tags.call_args_list for x in call[1]['Resources']]
+        self.assertEqual(sorted(ids), sorted(tagged))
+        self.assertEqual([{'Key': EC2Config.T_BLACKLIST, 'Value': EC2Config.V_TRUE}],
+                         self.ec2.create_tags.call_args[1]['Tags'])
+
+    def test_failure_isolated(self):
+        def create_tags(Tags, Resources):
+            if 'i-bad' in Resources:
+                raise Exception('InvalidInstanceID.NotFound')
+        self.ec2.create_tags.side_effect = create_tags
+        failures = Ec2ApiClient.tag_instances('us-east-1', ['i-1', 'i-bad', 'i-2'], EC2Config.T_WHITELIST, True)
+        self.assertEqual(['i-bad'], list(failures))
+        self.assertIn('NotFound', failures['i-bad'])
+
+    def test_remove(self):
+        Ec2ApiClient.tag_instances('us-east-1', ['i-1'], EC2Config.T_WHITELIST, enabled=False)
+        self.ec2.delete_tags.assert_called_once()
+        self.ec2.create_tags.assert_not_called()
+
+    def test_find_instances(self):
+        self.ec2.get_paginator.return_value.paginate.return_value = [
+            {'Reservations': [{'Instances': [{'InstanceId': 'i-1'}, {'InstanceId': 'i-2'}]}]},
+            {'Reservations': [{'Instances': [{'InstanceId': 'i-3'}]}]},
+        ]
+        self.assertEqual({'i-1', 'i-2', 'i-3'}, Ec2ApiClient.find_instances('us-east-1', 'role', 'sensor'))
+        self.ec2.get_paginator.return_value.paginate.assert_called_with(
+            Filters=[{'Name': 'tag:role', 'Values': ['sensor']}]
+        )
@@ -0,0 +1,94 @@
+import io
+import json
+import queue
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from aws_network_tap.models.event_reconciler import EventReconciler, VPCConfigCache
+from aws_network_tap.models.event_source import EventCoalescer, Instance_Event, JsonLinesEventSource, \
+    MemoryEventSource, SqsEventSource, parse_event, DETAIL_TYPE
+from aws_network_tap.models.mirror_plan import MirrorPlan
+from aws_network_tap.models.spile_tapper import SpileTapper
+from aws_network_tap.models.tag_config import VPCTagConfig
+
+
+def event_factory(instance_id, state='running', region='us-east-1'):
+    return {'detail-type': DETAIL_TYPE, 'region': region, 'detail': {'instance-id': instance_id, 'state': state}}
+
+
+class TestEventSource(TestCase):
+
+    def test_parse_event(self):
+        self.assertEqual(Instance_Event('i-1', 'running', 'us-east-1', None), parse_event(event_factory('i-1')))
+        self.assertIsNone(parse_event({'detail-type': 'AWS API Call via CloudTrail', 'detail': {}}))
+
+    def test_parse_sns_wrapped(self):
+        body = json.dumps({'Message': json.dumps(event_factory('i-1'))})
+        self.assertEqual('i-1', parse_event(body, receipt='r-1').instance_id)
+
+    def test_json_lines(self):
+        stream = io.StringIO('\n'.join([json.dumps(event_factory('i-1')), '', 'garbage', json.dumps(event_factory('i-2'))]))
+        batches = list(EventCoalescer(JsonLinesEventSource(stream), window=0.5).batches())
+        self.assertEqual([['i-1', 'i-2']], [[x.instance_id for x in batch] for batch in batches])
+
+    def test_memory_coalesce_and_dedupe(self):
+        events = queue.Queue()
+        for item in [event_factory('i-1', 'pending'), event_factory('i-1', 'running'), event_factory('i-2'), None]:
+            events.put(item)
+        batches = list(EventCoalescer(MemoryEventSource(events), window=0.5, poll=0.1).batches())
+        self.assertEqual(1, len(batches))
+        latest = EventCoalescer.latest(batches[0])
+        self.assertEqual(['i-1', 'i-2'], sorted(latest))
+        self.assertEqual('running', latest['i-1'].state)
+
+    def test_sqs_ack(self):
+        sqs = MagicMock()
+        sqs.receive_message.return_value = {'Messages': [
+            {'Body': json.dumps(event_factory('i-1')), 'ReceiptHandle': 'r-1'},
+            {'Body': 'not json', 'ReceiptHandle': 'r-2'},
+        ]}
+        source = SqsEventSource('https://sqs/queue', sqs_client=sqs)
+        events = source.receive(timeout=1)
+        self.assertEqual(['i-1'], [x.instance_id for x in events])
+        sqs.delete_message_batch.assert_called_once()  # the malformed message is dropped immediately
+        source.ack(events)
+        self.assertEqual('r-1', sqs.delete_message_batch.call_args[1]['Entries'][0]['ReceiptHandle'])
+
+
+class TestEventReconciler(TestCase):
+
+    def reconcile(self, plan_only=False):
+        cache = VPCConfigCache()
+        self.config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'})
+        cache.configs = MagicMock(return_value={'vpc-1': self.config})
+        self.spile = MagicMock()
+        self.spile.eni_tag.vpc_id = 'vpc-1'
+        self.executor = MagicMock()
+        vpc_plan = MirrorPlan(vpc_id='vpc-1')
+        vpc_plan.add(MagicMock(kind=MirrorPlan.CREATE))
+        vpc_plan.az_fallbacks.append('eni-1')
+        with patch('aws_network_tap.models.event_reconciler.SpileTapper') as tapper_class:
+            tapper_class.return_value.FILTER_VALUES_MAX = SpileTapper.FILTER_VALUES_MAX
+            self.discover = tapper_class.return_value.discover
+            self.discover.return_value = [self.spile]
+            self.plan = tapper_class.plan
+            self.plan.return_value = vpc_plan
+            return EventReconciler('us-east-1', self.executor, cache, plan_only=plan_only).reconcile([
+                Instance_Event('i-1', 'pending', None, None), Instance_Event('i-1', 'running', None, None),
+            ])
+
+    def test_reconcile_only_event_instances(self):
+        plan = self.reconcile()
+        self.discover.assert_called_once_with(instance_ids=['i-1'])
+        self.plan.assert_called_once_with(
+            region='us-east-1', vpc_ids=['vpc-1'], config=self.config, session_index=None, install_filter=True,
+            spiles=[self.spile],
+        )
+        self.assertEqual(1, len(plan))
+        self.assertEqual(['eni-1'], plan.az_fallbacks)
+        self.executor.run.assert_called_once_with(plan)
+
+    def test_plan_only(self):
+        plan = self.reconcile(plan_only=True)
+        self.assertFalse(self.plan.call_args[1]['install_filter'])
+        self.assertEqual(1, len(plan))
+        self.executor.run.assert_not_called()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+from unittest import TestCase
+from aws_network_tap.models.filter_profile import FilterProfile, Filter_Rule, Rule_Changes
+
+
+def api_rule(rule_id, rule):
+    item = FilterProfile.to_api(rule)
+    item['TrafficMirrorFilterRuleId'] = rule_id
+    return item
+
+
+class TestFilterProfile(TestCase):
+
+    def test_default_matches_original_filter(self):
+        rules = FilterProfile.default().rules()
+        self.assertEqual(4, len(rules))
+        self.assertIn(Filter_Rule('ingress', 100, 'accept', None, '0.0.0.0/0', '0.0.0.0/0', None, None), rules)
+        self.assertIn(Filter_Rule('egress', 200, 'accept', None, '::/0', '::/0', None, None), rules)
+
+    def test_reject_rules(self):
+        profile = FilterProfile('no-s3', reject=[{'cidr': '52.216.0.0/15', 'protocol': 'tcp', 'ports': 443}],
+                                protocols=['tcp', 'udp'])
+        rules = profile.rules()
+        self.assertIn(Filter_Rule('ingress', 1, 'reject', 6, '52.216.0.0/15', '0.0.0.0/0', (443, 443), None), rules)
+        self.assertIn(Filter_Rule('egress', 1, 'reject', 6, '0.0.0.0/0', '52.216.0.0/15', None, (443, 443)), rules)
+        self.assertIn(Filter_Rule('egress', 110, 'accept', 17, '0.0.0.0/0', '0.0.0.0/0', None, None), rules)
+        self.assertIn(Filter_Rule('egress', 210, 'accept', 17, '::/0', '::/0', None, None), rules)
+        self.assertEqual(10, len(rules))
+
+    def test_rule_quota(self):
+        reject = [{'cidr': f'10.{n}.0.0/16'} for n in range(4)]
+        with self.assertRaises(ValueError):
+            FilterProfile('wide', reject=reject)  # 8 rejects and 4 accepts
+        self.assertEqual(12, len(FilterProfile('wide', reject=reject, rules_max=20).rules()))
+
+    def test_accept_families_never_overlap(self):
+        protocols = list(range(100, 112))
+        rules = FilterProfile('many', protocols=protocols, rules_max=100).rules()
+        numbers = [x.number for x in rules if x.direction == 'ingress']
+        self.assertEqual(len(numbers), len(set(numbers)))
+        self.assertEqual(300, min(x.number for x in rules if x.destination_cidr == '::/0'))
+
+    def test_local_ports_one_direction(self):
+        profile = FilterProfile('no-db', reject=[
+            {'local_ports': '5432-5433', 'protocol': 'tcp', 'direction': 'egress'}
+        ])
+        rejects = [x for x in profile.rules() if x.action == 'reject']
+        self.assertEqual(['egress', 'egress'], [x.direction for x in rejects])
+        self.assertEqual((5432, 5433), rejects[0].source_ports)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            FilterProfile('bad', reject=[{'ports': 443}])
+        with self.assertRaises(ValueError):
+            FilterProfile('bad', protocols=['sctp-ish'])
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'profiles.yaml')
+            with open(path, 'w') as f:
+                f.write('profiles:\n  lean:\n    dns: false\n    reject:\n      - cidr: 10.9.0.0/16\n')
+            profiles = FilterProfile.load(path)
+            self.assertFalse(profiles['lean'].dns)
+            with open(path, 'w') as f:
+                f.write('profiles:\n  lean:\n    protocols: [tcp, udp, icmp]\n')
+            with self.assertRaises(ValueError):
+                FilterProfile.load(path)
+            with open(path, 'w') as f:
+                f.write('rules_max: 12\nprofiles:\n  lean:\n    protocols: [tcp, udp, icmp]\n')
+            self.assertEqual(12, len(FilterProfile.load(path)['lean'].rules()))
+            with open(path, 'w') as f:
+                f.write('profiles:\n  default: {}\n')
+            with self.assertRaises(ValueError):
+                FilterProfile.load(path)
+
+    def test_diff(self):
+        profile = FilterProfile('lean', reject=[{'cidr': '10.9.0.0/16'}])
+        default_rules = FilterProfile.default().rules()
+        old_reject = Filter_Rule('egress', 1, 'reject', 17, '0.0.0.0/0', '10.8.0.0/16', None, None)
+        installed = {
+            'IngressFilterRules': [
+                api_rule(f'r-{n}', x) for n, x in enumerate(default_rules) if x.direction == 'ingress'
+            ],
+            'EgressFilterRules': [api_rule('r-old', old_reject)] + [
+                api_rule(f'r-{n}', x) for n, x in enumerate(default_rules) if x.direction == 'egress'
+            ],
+        }
+        changes = profile.diff(installed)
+        self.assertEqual([('ingress', 1)], [(x.direction, x.number) for x in changes.create])
+        self.assertEqual(['r-old'], [rule_id for rule_id, _ in changes.modify])
+        self.assertEqual([], changes.delete)
+        self.assertEqual(Rule_Changes([], [], []), FilterProfile.default().diff({
+            'IngressFilterRules': [api_rule('a', x) for x in default_rules if x.direction == 'ingress'],
+            'EgressFilterRules': [api_rule('b', x) for x in default_rules if x.direction == 'egress'],
+        }))
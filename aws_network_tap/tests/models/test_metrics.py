@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import socket
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+from aws_network_tap.models.metrics import Metrics, StatsdSink
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        Metrics.clear()
+        Metrics.statsd = None
+
+    def tearDown(self):
+        Metrics.clear()
+        Metrics.statsd = None
+
+    def test_observe_call(self):
+        Metrics.observe_call('ec2', 'DescribeInstances', 0.2)
+        Metrics.observe_call('ec2', 'DescribeInstances', 3.0, error=True)
+        api = Metrics.report()['api']['ec2.DescribeInstances']
+        self.assertEqual((2, 1), (api['calls'], api['errors']))
+        self.assertAlmostEqual(3.2, api['seconds'])
+        self.assertEqual(0, api['buckets']['0.1'])
+        self.assertEqual(1, api['buckets']['0.25'])
+        self.assertEqual(1, api['buckets']['5.0'])
+
+    def test_phase_and_actions(self):
+        with Metrics.phase(Metrics.DISCOVERY):
+            pass
+        with self.assertRaises(ValueError), Metrics.phase(Metrics.DISCOVERY):
+            raise ValueError()
+        Metrics.count_actions('vpc-1', {'create': 2, 'delete': 0})
+        Metrics.count_actions('vpc-1', {'create': 1})
+        report = Metrics.report()
+        self.assertEqual(2, report['phases'][Metrics.DISCOVERY]['count'])
+        self.assertEqual({'create': 3, 'delete': 0}, report['vpcs']['vpc-1'])
+
+    def test_merge(self):
+        Metrics.observe_call('ec2', 'DescribeInstances', 0.2)
+        Metrics.count_actions('vpc-1', {'create': 1})
+        report = Metrics.report()
+        Metrics.merge(json.loads(json.dumps(report)))  # as returned by a worker process
+        merged = Metrics.report()
+        self.assertEqual(2, merged['api']['ec2.DescribeInstances']['calls'])
+        self.assertEqual(2, merged['api']['ec2.DescribeInstances']['buckets']['0.25'])
+        self.assertEqual({'create': 2}, merged['vpcs']['vpc-1'])
+
+    def test_prometheus(self):
+        Metrics.observe_call('ec2', 'CreateTrafficMirrorSession', 0.2)
+        with Metrics.phase(Metrics.WRITE):
+            pass
+        Metrics.count_actions('vpc-1', {'create': 1})
+        text = Metrics.prometheus()
+        labels = 'service="ec2",operation="CreateTrafficMirrorSession"'
+        self.assertIn(f'session_mirror_tap_api_calls_total{{{labels}}} 1\n', text)
+        self.assertIn(f'session_mirror_tap_api_seconds_bucket{{{labels},le="0.1"}} 0\n', text)
+        self.assertIn(f'session_mirror_tap_api_seconds_bucket{{{labels},le="10.0"}} 1\n', text)
+        self.assertIn(f'session_mirror_tap_api_seconds_bucket{{{labels},le="+Inf"}} 1\n', text)
+        self.assertIn('session_mirror_tap_phase_runs_total{phase="write"} 1\n', text)
+        self.assertIn('session_mirror_tap_vpc_actions_total{vpc_id="vpc-1",kind="create"} 1\n', text)
+
+    def test_attach(self):
+        client = MagicMock()
+        client.meta.service_model.service_id.hyphenize.return_value = 'ec2'
+        Metrics.attach(client)
+        events = [x[0][0] for x in client.meta.events.register.call_args_list]
+        self.assertEqual(['before-call.ec2', 'after-call.ec2', 'after-call-error.ec2'], events)
+
+    def test_call_hooks(self):
+        context = {}
+        Metrics._before_call(context=context, model=None)
+        Metrics._after_call(event_name='after-call.ec2.DescribeVpcs', context=context,
+                            http_response=MagicMock(status_code=503), parsed={})
+        context = {}
+        Metrics._before_call(context=context)
+        Metrics._after_call(event_name='after-call-error.ec2.DescribeVpcs', context=context, exception=OSError())
+        Metrics._after_call(event_name='after-call.ec2.DescribeVpcs', context={}, http_response=MagicMock())
+        api = Metrics.report()['api']['ec2.DescribeVpcs']
+        self.assertEqual((2, 2), (api['calls'], api['errors']))
+
+    def test_write(self):
+        Metrics.count_actions('vpc-1', {'create': 1})
+        with tempfile.TemporaryDirectory() as tmp:
+            args = argparse.Namespace(
+                report_file=os.path.join(tmp, 'report.json'), prometheus_file=os.path.join(tmp, 'tap.prom')
+            )
+            Metrics.write(args)
+            with open(args.report_file) as f:
+                self.assertEqual({'create': 1}, json.load(f)['vpcs']['vpc-1'])
+            self.assertEqual(['report.json', 'tap.prom'], sorted(os.listdir(tmp)))
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        self.addCleanup(server.close)
+        Metrics.statsd = StatsdSink(f'127.0.0.1:{server.getsockname()[1]}', Metrics.PREFIX)
+        Metrics.count_actions('vpc-1', {'create': 2})
+        self.assertEqual(b'session_mirror_tap.vpc.vpc-1.create:2|c', server.recv(1024))
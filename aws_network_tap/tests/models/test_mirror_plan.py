@@ -0,0 +1,31 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from aws_network_tap.models.mirror_plan import Action, MirrorPlan
+
+
+class TestMirrorPlan(TestCase):
+
+    def action_factory(self, kind, calls):
+        spile = MagicMock()
+        spile.apply.side_effect = lambda action: calls.append(action.kind)
+        return Action(kind, spile, 'tmt-1', None, None)
+
+    def test_illegal_action(self):
+        with self.assertRaises(ValueError):
+            MirrorPlan().add(Action('explode', None, None, None, None))
+
+    def test_counts(self):
+        plan = MirrorPlan()
+        plan.add(self.action_factory(MirrorPlan.CREATE, []))
+        plan.add(self.action_factory(MirrorPlan.CREATE, []))
+        plan.add(self.action_factory(MirrorPlan.DELETE, []))
+        self.assertEqual({MirrorPlan.CREATE: 2, MirrorPlan.DELETE: 1, MirrorPlan.RETARGET: 0}, plan.counts())
+        self.assertEqual(3, len(plan))
+
+    def test_apply_deletes_first(self):
+        calls = []
+        plan = MirrorPlan()
+        for kind in [MirrorPlan.CREATE, MirrorPlan.RETARGET, MirrorPlan.DELETE]:
+            plan.add(self.action_factory(kind, calls))
+        plan.apply()
+        self.assertEqual([MirrorPlan.DELETE, MirrorPlan.RETARGET, MirrorPlan.CREATE], calls)
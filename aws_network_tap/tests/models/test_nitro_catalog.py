@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from aws_network_tap.models.nitro_catalog import NitroCatalog
+
+
+class TestNitroCatalog(TestCase):
+
+    def setUp(self):
+        NitroCatalog.clear()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.original_cache_dir = NitroCatalog.cache_dir
+        NitroCatalog.cache_dir = self.cache_dir.name
+
+    def tearDown(self):
+        NitroCatalog.clear()
+        NitroCatalog.cache_dir = self.original_cache_dir
+        self.cache_dir.cleanup()
+
+    def client_factory(self, *pages):
+        client = MagicMock()
+        client.get_paginator.return_value.paginate.side_effect = [[{'InstanceTypes': x}] for x in pages]
+        return client
+
+    def test_describe_and_memoize(self):
+        client = self.client_factory([{'InstanceType': 'm6i.large'}], [{'InstanceType': 'm5.metal'}])
+        types = NitroCatalog.instance_types(client, 'us-east-1')
+        self.assertEqual(frozenset(['m6i.large', 'm5.metal']), types)
+        self.assertEqual(types, NitroCatalog.instance_types(client, 'us-east-1'))
+        self.assertEqual(2, client.get_paginator.return_value.paginate.call_count)
+
+    def test_disk_cache(self):
+        client = self.client_factory([{'InstanceType': 'c7g.large'}], [])
+        NitroCatalog.instance_types(client, 'us-east-1')
+        NitroCatalog.clear()
+        other_client = MagicMock()
+        self.assertEqual(frozenset(['c7g.large']), NitroCatalog.instance_types(other_client, 'us-east-1'))
+        other_client.get_paginator.assert_not_called()
+
+    def test_disk_cache_expired(self):
+        with open(os.path.join(self.cache_dir.name, 'nitro_us-east-1.json'), 'w') as f:
+            json.dump({'fetched': time.time() - NitroCatalog.TTL - 1, 'instance_types': ['m5.large']}, f)
+        client = self.client_factory([{'InstanceType': 'r7i.large'}], [])
+        self.assertEqual(frozenset(['r7i.large']), NitroCatalog.instance_types(client, 'us-east-1'))
+
+    def test_fallback(self):
+        client = MagicMock()
+        client.get_paginator.side_effect = Exception('UnauthorizedOperation')
+        self.assertEqual(frozenset(['m5.large']), NitroCatalog.instance_types(client, 'us-east-1', ['m5.large']))
+
+    def test_old_botocore_falls_back_quietly(self):
+        client = MagicMock()
+        client.can_paginate.return_value = False
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(frozenset(['m5.large']), NitroCatalog.instance_types(client, 'us-east-1', ['m5.large']))
+            NitroCatalog.instance_types(client, 'us-west-2', ['m5.large'])
+        self.assertEqual(1, len(logs.output))
+        client.get_paginator.assert_not_called()
+
+    def test_memory_expires(self):
+        client = self.client_factory([{'InstanceType': 'm6i.large'}], [], [{'InstanceType': 'm7i.large'}], [])
+        now = time.time()
+        with patch('aws_network_tap.models.nitro_catalog.time.time', return_value=now):
+            self.assertEqual(frozenset(['m6i.large']), NitroCatalog.instance_types(client, 'us-east-1'))
+        with patch('aws_network_tap.models.nitro_catalog.time.time', return_value=now + NitroCatalog.TTL + 1):
+            self.assertEqual(frozenset(['m7i.large']), NitroCatalog.instance_types(client, 'us-east-1'))
+        self.assertEqual(4, client.get_paginator.return_value.paginate.call_count)
+
+    def test_fallback_retried(self):
+        client = self.client_factory([{'InstanceType': 'm8g.large'}], [])
+        client.get_paginator.side_effect = [Exception('RequestLimitExceeded'), client.get_paginator.return_value]
+        now = time.time()
+        with patch('aws_network_tap.models.nitro_catalog.time.time', return_value=now):
+            self.assertEqual(frozenset(['m5.large']), NitroCatalog.instance_types(client, 'us-east-1', ['m5.large']))
+            NitroCatalog.instance_types(client, 'us-east-1', ['m5.large'])
+        self.assertEqual(1, client.get_paginator.call_count)
+        with patch('aws_network_tap.models.nitro_catalog.time.time', return_value=now + NitroCatalog.RETRY_TTL + 1):
+            self.assertEqual(frozenset(['m8g.large']), NitroCatalog.instance_types(client, 'us-east-1', ['m5.large']))
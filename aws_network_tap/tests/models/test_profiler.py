@@ -0,0 +1,98 @@
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from aws_network_tap.models.profiler import NO_SPAN, Profiler
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def worker_only(seconds):
+    busy(seconds)
+
+
+def work():
+    worker = threading.Thread(target=worker_only, args=(0.05,))
+    worker.start()
+    busy(0.05)
+    worker.join()
+    return 'done'
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_span_off(self):
+        self.assertIs(NO_SPAN, Profiler.span('vpc', vpc_id='vpc-1'))
+        with Profiler.span('vpc') as span:
+            span.tag(action='create')
+
+    def test_path(self):
+        self.assertEqual('a.json', Profiler.path('a.json'))
+        with patch.dict(os.environ, {Profiler.ENV: 'b.pstats'}):
+            self.assertEqual('a.json', Profiler.path('a.json'))
+            self.assertEqual('b.pstats', Profiler.path(None))
+        with patch.dict(os.environ, {Profiler.ENV: ''}):
+            self.assertIsNone(Profiler.path(None))
+
+    def test_trace(self):
+        path = os.path.join(self.dir.name, 'run.json')
+
+        def traced():
+            with Profiler.span('vpc', vpc_id='vpc-1') as span:
+                with Profiler.span('write eni', interface_id='eni-1'):
+                    pass
+                span.tag(actions={'create': 1})
+        Profiler.run(path, traced)
+        self.assertFalse(Profiler.tracing)
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual(['write eni', 'vpc'], [x['name'] for x in events])
+        self.assertEqual({'vpc_id': 'vpc-1', 'actions': {'create': 1}}, events[1]['args'])
+        self.assertEqual('X', events[1]['ph'])
+        self.assertLessEqual(events[1]['ts'], events[0]['ts'])
+
+    def test_trace_written_on_failure(self):
+        path = os.path.join(self.dir.name, 'run.json')
+
+        def failing():
+            with Profiler.span('vpc'):
+                raise RuntimeError('boom')
+        with self.assertRaises(RuntimeError):
+            Profiler.run(path, failing)
+        with open(path) as f:
+            self.assertEqual(1, len(json.load(f)['traceEvents']))
+
+    def test_pstats_every_thread(self):
+        path = os.path.join(self.dir.name, 'run.pstats')
+        self.assertEqual('done', Profiler.run(path, work))
+        functions = {name for _, _, name in pstats.Stats(path).stats}
+        self.assertIn('work', functions)
+        self.assertIn('worker_only', functions)  # only ever called on the worker thread
+
+    def test_stacks(self):
+        path = os.path.join(self.dir.name, 'run.folded')
+        Profiler.run(path, busy, 0.1)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        stack, _, count = lines[0].rpartition(' ')
+        self.assertGreater(int(count), 0)
+        self.assertIn('busy (test_profiler.py', stack.split(';')[-1])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            Profiler.run('run.txt', work)
@@ -0,0 +1,95 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import boto3
+from aws_network_tap.models.rate_governor import Budget_Usage, RateGovernor
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def attempt(error=None):
+    """ needs-retry arguments for an answered attempt """
+    parsed = {'Error': error} if error else {}
+    return {'response': (MagicMock(status_code=400 if error else 200), parsed), 'attempts': 5,
+            'caught_exception': None, 'request_dict': {'context': {}}, 'operation': MagicMock()}
+
+
+def governor_factory(rates=None, path=None):
+    clock = FakeClock()
+    return RateGovernor(rates, path=path, clock=clock, sleep=clock.sleep), clock
+
+
+class TestRateGovernor(TestCase):
+
+    def test_budget(self):
+        self.assertEqual(RateGovernor.DESCRIBE, RateGovernor.budget('DescribeInstances'))
+        self.assertEqual(RateGovernor.MUTATE, RateGovernor.budget('CreateTrafficMirrorSession'))
+
+    def test_parse_rates(self):
+        self.assertEqual({'describe': 10.0, 'mutate': 2.5}, RateGovernor.parse_rates('describe=10, mutate=2.5'))
+        with self.assertRaises(ValueError):
+            RateGovernor.parse_rates('create=1')
+
+    def test_burst_then_rate(self):
+        governor, clock = governor_factory({'mutate': 2.0})
+        for _ in range(10):  # the burst, 5 seconds at 2 per second
+            self.assertEqual(0, governor.acquire('default/us-east-1', 'mutate'))
+        self.assertEqual(0.5, governor.acquire('default/us-east-1', 'mutate'))
+        self.assertEqual(0, governor.acquire('default/us-west-2', 'mutate'))  # every region has its own bucket
+        self.assertEqual(0, governor.acquire('default/us-east-1', 'describe'))
+        self.assertEqual(Budget_Usage(11, 0, 0.5), governor.usage('default/us-east-1')['mutate'])
+
+    def test_throttle_backs_off_then_recovers(self):
+        governor, clock = governor_factory({'mutate': 2.0})
+        governor.throttled('k', 'mutate')
+        governor.throttled('k', 'mutate')  # same burst of concurrent calls
+        self.assertEqual(1.0, governor.acquire('k', 'mutate'))  # empty bucket at half the rate
+        for _ in range(100):
+            governor.succeeded('k', 'mutate')
+        clock.now += 60
+        for _ in range(10):
+            governor.acquire('k', 'mutate')
+        self.assertEqual(0.5, governor.acquire('k', 'mutate'))
+        self.assertEqual(2, governor.usage('k')['mutate'].throttled)
+
+    def test_since(self):
+        before = {'describe': Budget_Usage(3, 1, 0.5)}
+        after = {'describe': Budget_Usage(5, 1, 1.5), 'mutate': Budget_Usage(2, 0, 0.0)}
+        self.assertEqual({'describe': Budget_Usage(2, 0, 1.0), 'mutate': Budget_Usage(2, 0, 0.0)},
+                         RateGovernor.since(after, before))
+
+    def test_shared_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'rates.json')
+            first, clock = governor_factory({'mutate': 1.0}, path=path)
+            second = RateGovernor({'mutate': 1.0}, path=path, clock=clock, sleep=clock.sleep)
+            for _ in range(5):
+                first.acquire('k', 'mutate')
+            self.assertEqual(1.0, second.acquire('k', 'mutate'))  # the other process drained the bucket
+
+    def test_attach(self):
+        governor, _ = governor_factory()
+        client = boto3.client('ec2', region_name='us-east-1')
+        governor.attach(client, 'default/us-east-1')
+        events = client.meta.events
+        events.emit('before-send.ec2.DescribeInstances', request=MagicMock())
+        with patch.object(RateGovernor, 'throttled') as throttled:
+            events.emit('needs-retry.ec2.CreateTrafficMirrorSession', **attempt({'Code': 'RequestLimitExceeded'}))
+        throttled.assert_called_once_with('default/us-east-1', 'mutate')
+        with patch.object(RateGovernor, 'succeeded') as succeeded:
+            events.emit('needs-retry.ec2.DescribeInstances', **attempt())
+        succeeded.assert_called_once_with('default/us-east-1', 'describe')
+        self.assertEqual(1, governor.usage('default/us-east-1')['describe'].calls)
@@ -0,0 +1,56 @@
+import pickle
+from unittest import TestCase
+from aws_network_tap.models.rate_governor import Budget_Usage
+from aws_network_tap.models.run_summary import Region_Result, RunSummary
+from aws_network_tap.models.session_executor import Action_Error
+
+
+class TestRunSummary(TestCase):
+
+    def test_totals(self):
+        summary = RunSummary()
+        summary.add(Region_Result('123', 'us-west-2', {'create': 2}, {'succeeded': 2}, [], 1.5, None))
+        summary.add(Region_Result('123', 'us-east-1', {'create': 1}, {'succeeded': 1}, [], 2.0, None))
+        lines = list(summary.lines())
+        self.assertIn('us-east-1', lines[0])
+        self.assertEqual("Total: 2 regions (0 failed) planned {'create': 3} writes {'succeeded': 3}", lines[-1])
+        self.assertFalse(summary.failed)
+
+    def test_failed_region(self):
+        summary = RunSummary()
+        summary.add(Region_Result(None, 'eu-west-1', {}, {}, [], 0.1, 'AccessDenied'))
+        self.assertTrue(summary.failed)
+        self.assertIn('FAILED: AccessDenied', list(summary.lines())[0])
+
+    def test_failed_action(self):
+        summary = RunSummary()
+        error = Action_Error('create', 'i-1', 'eni-1', 'boom')
+        summary.add(Region_Result('123', 'eu-west-1', {'create': 1}, {'failed': 1}, [error], 0.1, None))
+        self.assertTrue(summary.failed)
+        self.assertIn('eni-1: boom', list(summary.lines())[1])
+
+    def test_az_fallbacks(self):
+        summary = RunSummary()
+        summary.add(Region_Result('123', 'us-east-1', {}, {}, [], 1.0, None, 3))
+        summary.add(Region_Result('123', 'us-west-2', {}, {}, [], 1.0, None))
+        lines = list(summary.lines())
+        self.assertIn('cross-zone fallbacks 3', lines[0])
+        self.assertNotIn('cross-zone', lines[1])
+        self.assertTrue(lines[-1].endswith('cross-zone fallbacks 3'))
+
+    def test_api_usage(self):
+        summary = RunSummary()
+        east = Region_Result('123', 'us-east-1', {}, {}, [], 1.0, None, 0, {
+            'describe': Budget_Usage(10, 1, 0.5), 'mutate': Budget_Usage(4, 0, 0.0)
+        })
+        summary.add(east)
+        summary.add(Region_Result('123', 'us-west-2', {}, {}, [], 1.0, None, 0, {'describe': Budget_Usage(5, 0, 0.25)}))
+        lines = list(summary.lines())
+        mutate = 'mutate 4 (throttled 0, waited 0.0s)'
+        self.assertTrue(lines[0].endswith(f'api describe 10 (throttled 1, waited 0.5s), {mutate}'))
+        self.assertTrue(lines[-1].endswith(f'api describe 15 (throttled 1, waited 0.8s), {mutate}'))
+        self.assertEqual(east, pickle.loads(pickle.dumps(east)))
+
+    def test_picklable(self):
+        result = Region_Result('123', 'us-east-1', {}, {}, [Action_Error('create', 'i-1', 'eni-1', 'boom')], 1.0, None)
+        self.assertEqual(result, pickle.loads(pickle.dumps(result)))
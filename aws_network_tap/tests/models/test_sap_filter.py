@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+from aws_network_tap.models.filter_profile import FilterProfile
+from aws_network_tap.models.sap_filter import SapFilter
+
+
+class TestSapFilter(TestCase):
+
+    def setUp(self):
+        SapFilter.clear()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        SapFilter.cache_path = os.path.join(self.cache_dir.name, 'filters.json')
+
+    def tearDown(self):
+        SapFilter.clear()
+        SapFilter.cache_path = None
+        self.cache_dir.cleanup()
+
+    def client_factory(self, filters):
+        client = MagicMock()
+        client.describe_traffic_mirror_filters.return_value = {'TrafficMirrorFilters': filters}
+        client.create_traffic_mirror_filter.return_value = {'TrafficMirrorFilter': {'TrafficMirrorFilterId': 'tmf-new'}}
+        return client
+
+    def filter_factory(self, filter_id):
+        return {'TrafficMirrorFilterId': filter_id, 'Description': SapFilter(None)._filter_description}
+
+    def test_resolve_memoized(self):
+        client = self.client_factory([self.filter_factory('tmf-1')])
+        self.assertEqual('tmf-1', SapFilter.resolve(client, '123', 'us-east-1'))
+        self.assertEqual('tmf-1', SapFilter.resolve(client, '123', 'us-east-1'))
+        client.describe_traffic_mirror_filters.assert_called_once()
+
+    def test_duplicates_keep_lowest_id(self):
+        client = self.client_factory([self.filter_factory('tmf-2'), self.filter_factory('tmf-1')])
+        self.assertEqual('tmf-1', SapFilter(client).find_filter())
+        client.delete_traffic_mirror_filter.assert_not_called()
+        client.delete_traffic_mirror_filter.side_effect = Exception('in use by mirror sessions')
+        self.assertEqual('tmf-1', SapFilter(client).install())
+        client.delete_traffic_mirror_filter.assert_called_once_with(TrafficMirrorFilterId='tmf-2')
+        client.create_traffic_mirror_filter.assert_not_called()
+
+    def test_clear_looks_up_again(self):
+        client = self.client_factory([self.filter_factory('tmf-1')])
+        SapFilter.resolve(client, '123', 'us-east-1')
+        SapFilter.clear()
+        client.describe_traffic_mirror_filters.return_value = {'TrafficMirrorFilters': []}
+        client.create_traffic_mirror_filter.return_value = {'TrafficMirrorFilter': {'TrafficMirrorFilterId': 'tmf-2'}}
+        self.assertEqual('tmf-2', SapFilter.resolve(client, '123', 'us-east-1'))
+
+    def test_resolve_plan_only_does_not_create(self):
+        client = self.client_factory([])
+        self.assertIsNone(SapFilter.resolve(client, '123', 'us-east-1', install=False))
+        client.create_traffic_mirror_filter.assert_not_called()
+
+    def test_create_uses_client_token(self):
+        client = self.client_factory([])
+        self.assertEqual('tmf-new', SapFilter.resolve(client, '123', 'us-east-1'))
+        self.assertTrue(client.create_traffic_mirror_filter.call_args[1]['ClientToken'])
+        self.assertEqual(4, client.create_traffic_mirror_filter_rule.call_count)
+        with open(SapFilter.cache_path) as f:
+            self.assertEqual({'123:us-east-1': 'tmf-new'}, json.load(f))
+
+    def test_disk_cache_validated(self):
+        with open(SapFilter.cache_path, 'w') as f:
+            json.dump({'123:us-east-1': 'tmf-cached'}, f)
+        client = self.client_factory([self.filter_factory('tmf-cached')])
+        self.assertEqual('tmf-cached', SapFilter.resolve(client, '123', 'us-east-1'))
+        client.describe_traffic_mirror_filters.assert_called_once_with(TrafficMirrorFilterIds=['tmf-cached'])
+
+    def test_disk_cache_stale(self):
+        with open(SapFilter.cache_path, 'w') as f:
+            json.dump({'123:us-east-1': 'tmf-deleted'}, f)
+        client = self.client_factory([])
+        client.describe_traffic_mirror_filters.side_effect = [
+            Exception('InvalidTrafficMirrorFilterId.NotFound'),
+            {'TrafficMirrorFilters': [self.filter_factory('tmf-1')]},
+        ]
+        self.assertEqual('tmf-1', SapFilter.resolve(client, '123', 'us-east-1'))
+
+    def test_profile_filter_synced(self):
+        SapFilter.profiles = {'lean': FilterProfile('lean', reject=[{'cidr': '10.9.0.0/16'}], dns=False)}
+        self.addCleanup(setattr, SapFilter, 'profiles', {})
+        installed = {
+            'TrafficMirrorFilterId': 'tmf-lean',
+            'Description': SapFilter(None, SapFilter.profiles['lean'])._filter_description,
+            'NetworkServices': ['amazon-dns'],
+            'IngressFilterRules': [],
+            'EgressFilterRules': [],
+        }
+        client = self.client_factory([installed])
+        self.assertEqual('tmf-lean', SapFilter.resolve(client, '123', 'us-east-1', profile='lean'))
+        self.assertEqual(6, client.create_traffic_mirror_filter_rule.call_count)
+        client.modify_traffic_mirror_filter_network_services.assert_called_once_with(
+            TrafficMirrorFilterId='tmf-lean', RemoveNetworkServices=['amazon-dns']
+        )
+        client.create_traffic_mirror_filter.assert_not_called()
+        with open(SapFilter.cache_path) as f:
+            self.assertEqual({'123:us-east-1:lean': 'tmf-lean'}, json.load(f))
+
+    def test_unknown_profile_uses_default(self):
+        client = self.client_factory([self.filter_factory('tmf-1')])
+        self.assertEqual('tmf-1', SapFilter.resolve(client, '123', 'us-east-1', profile='missing'))
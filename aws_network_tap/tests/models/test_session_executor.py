@@ -0,0 +1,75 @@
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock
+from aws_network_tap.models.mirror_plan import Action, MirrorPlan
+from aws_network_tap.models.session_executor import AdaptiveLimit, ExecutionReport, SessionExecutor
+
+
+class TestAdaptiveLimit(TestCase):
+
+    def test_throttle_halves(self):
+        limit = AdaptiveLimit(maximum=8)
+        limit.acquire()
+        limit.release(throttled=True)
+        self.assertEqual(4, limit.limit)
+        for _ in range(3):
+            limit.acquire()
+            limit.release(throttled=True)
+        self.assertEqual(1, limit.limit)
+
+    def test_recovers(self):
+        limit = AdaptiveLimit(maximum=4)
+        limit.limit = 2
+        for _ in range(2):
+            limit.acquire()
+            limit.release()
+        self.assertEqual(3, limit.limit)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            AdaptiveLimit(maximum=0)
+
+
+class TestSessionExecutor(TestCase):
+
+    def plan_factory(self, *side_effects):
+        plan = MirrorPlan()
+        for side_effect in side_effects:
+            spile = MagicMock()
+            spile.apply.side_effect = side_effect
+            plan.add(Action(MirrorPlan.CREATE, spile, 'tmt-1', None, None))
+        return plan
+
+    def test_error_isolation(self):
+        plan = self.plan_factory(
+            [MagicMock()],
+            RuntimeError('boom'),
+            [None],
+        )
+        report = SessionExecutor(max_workers=2).run(plan)
+        self.assertEqual(1, report.counts[ExecutionReport.SUCCEEDED])
+        self.assertEqual(1, report.counts[ExecutionReport.FAILED])
+        self.assertEqual(1, report.counts[ExecutionReport.SKIPPED])
+        self.assertEqual('boom', report.errors[0].error)
+        self.assertEqual([plan.actions[2].spile.eni_tag.interface_id], report.skipped)
+
+    def test_throttle_retried(self):
+        plan = self.plan_factory([Exception('RequestLimitExceeded'), MagicMock()])
+        executor = SessionExecutor(max_workers=4, backoff=0)
+        report = executor.run(plan)
+        self.assertEqual(1, report.counts[ExecutionReport.SUCCEEDED])
+        self.assertEqual(2, executor.limit.limit)
+
+    def test_throttle_gives_up(self):
+        plan = self.plan_factory(Exception('RequestLimitExceeded'))
+        report = SessionExecutor(max_workers=1, max_attempts=2, backoff=0).run(plan)
+        self.assertEqual(1, report.counts[ExecutionReport.FAILED])
+
+    def test_stopping_skips_remaining(self):
+        stopping = threading.Event()
+        stopping.set()
+        plan = self.plan_factory([MagicMock()])
+        report = SessionExecutor(stopping=stopping).run(plan)
+        self.assertEqual(1, report.counts[ExecutionReport.SKIPPED])
+        self.assertEqual(1, len(report.skipped))
+        plan.actions[0].spile.apply.assert_not_called()
@@ -0,0 +1,82 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from aws_network_tap.models.session_index import SessionIndex
+from aws_network_tap.models.spile import Spile
+
+
+def session_item(session_id, interface_id, session_number=1, creator=Spile.CREATOR_VALUE):
+    return {
+        'TrafficMirrorSessionId': session_id,
+        'TrafficMirrorTargetId': 'tmt-1',
+        'TrafficMirrorFilterId': 'tmf-1',
+        'NetworkInterfaceId': interface_id,
+        'SessionNumber': session_number,
+        'Tags': [{'Key': Spile.CREATOR_KEY, 'Value': creator}],
+    }
+
+
+def paginated_client(pages_by_operation):
+    client = MagicMock()
+
+    def get_paginator(operation):
+        paginator = MagicMock()
+        paginator.paginate.return_value = pages_by_operation[operation]
+        return paginator
+    client.get_paginator.side_effect = get_paginator
+    return client
+
+
+class TestSessionIndex(TestCase):
+
+    def test_build_keys_by_interface_and_number(self):
+        client = paginated_client({'describe_traffic_mirror_sessions': [
+            {'TrafficMirrorSessions': [session_item('tms-1', 'eni-1')]},
+            {'TrafficMirrorSessions': [session_item('tms-2', 'eni-1', 2), session_item('tms-3', 'eni-2')]},
+        ]})
+        index = SessionIndex.build(client)
+        self.assertEqual(3, len(index))
+        self.assertEqual('tms-1', index.get('eni-1', 1).id)
+        self.assertEqual('tms-2', index.get('eni-1', 2).id)
+        self.assertIsNone(index.get('eni-3', 1))
+        self.assertEqual({'eni-1', 'eni-2'}, index.interface_ids())
+
+    def test_add_remove(self):
+        index = SessionIndex()
+        session = Spile.to_mirror_session(session_item('tms-1', 'eni-1'))
+        index.add(session, 1)
+        self.assertEqual(session, index.get('eni-1', 1))
+        index.remove('eni-1', 1)
+        self.assertIsNone(index.get('eni-1', 1))
+
+    def test_for_interface(self):
+        index = SessionIndex()
+        first = Spile.to_mirror_session(session_item('tms-1', 'eni-1'))
+        second = Spile.to_mirror_session(session_item('tms-2', 'eni-1', 3))
+        index.add(first, 1)
+        index.add(second, 3)
+        self.assertEqual({1: first, 3: second}, index.for_interface('eni-1'))
+        index.discard(first)
+        self.assertEqual({3: second}, index.for_interface('eni-1'))
+        index.remove('eni-1', 3)
+        self.assertEqual({}, index.for_interface('eni-1'))
+        self.assertEqual(set(), index.interface_ids())
+
+    def test_find_orphans(self):
+        client = paginated_client({
+            'describe_traffic_mirror_sessions': [
+                {'TrafficMirrorSessions': [session_item('tms-1', 'eni-1'), session_item('tms-2', 'eni-gone')]},
+            ],
+            'describe_network_interfaces': [{'NetworkInterfaces': [{'NetworkInterfaceId': 'eni-1'}]}],
+        })
+        index = SessionIndex.build(client)
+        orphans = index.find_orphans(client)
+        self.assertEqual(['tms-2'], [x.id for x in orphans])
+
+    def test_spile_uses_index(self):
+        index = SessionIndex()
+        session = Spile.to_mirror_session(session_item('tms-1', 'eni-1'))
+        index.add(session, 1)
+        client = MagicMock()
+        spile = Spile(client, MagicMock(interface_id='eni-1'), session_index=index)
+        self.assertEqual(session, spile._find_tap())
+        client.describe_traffic_mirror_sessions.assert_not_called()
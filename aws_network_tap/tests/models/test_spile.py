@@ -3,6 +3,8 @@ from unittest.mock import MagicMock
 from uuid import uuid4
 import boto3
 from aws_network_tap.models.spile import Spile, ENI_Tag, Ec2ApiClient, MirrorSession
+from aws_network_tap.models.mirror_plan import MirrorPlan
+from aws_network_tap.models.session_index import SessionIndex
 
 
 class TestSpile(TestCase):
@@ -74,7 +76,106 @@ class TestSpile(TestCase):
         spile = Spile(boto3.client('s3'), eni_tag)
         existing_session = self.mirror_session_factory({Spile.CREATOR_KEY: Spile.CREATOR_VALUE})
         spile._find_tap = MagicMock(return_value=existing_session)
-        spile._tap = MagicMock()
+        spile._retarget = MagicMock()
         result = spile.manage('tmt-12345', do_tap=True)
         self.assertIsNotNone(result)
-        spile._tap.assert_called_once()
\ No newline at end of file
+        spile._retarget.assert_called_once()
+
+    def test_manage_ignores_external(self):
+        eni_tag = ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_RUNNING)
+        spile = Spile(boto3.client('s3'), eni_tag)
+        existing_session = self.mirror_session_factory({Spile.CREATOR_KEY: 'Bob Barker'})
+        spile._find_tap = MagicMock(return_value=existing_session)
+        self.assertIsNone(spile.manage('tmt-12345', do_tap=True))
+
+    def test_plan_create(self):
+        eni_tag = ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_RUNNING)
+        spile = Spile(boto3.client('s3'), eni_tag)
+        spile._find_tap = MagicMock(return_value=None)
+        action = spile.plan('tmt-12345', do_tap=True)
+        self.assertEqual(MirrorPlan.CREATE, action.kind)
+        self.assertEqual('tmt-12345', action.target_id)
+
+    def test_plan_retarget_on_filter_change(self):
+        eni_tag = ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_RUNNING)
+        spile = Spile(boto3.client('s3'), eni_tag)
+        existing_session = self.mirror_session_factory({Spile.CREATOR_KEY: Spile.CREATOR_VALUE})
+        spile._find_tap = MagicMock(return_value=existing_session)
+        self.assertIsNone(spile.plan(existing_session.target_id, do_tap=True, filter_id=existing_session.filter_id))
+        action = spile.plan(existing_session.target_id, do_tap=True, filter_id='tmf-other')
+        self.assertEqual(MirrorPlan.RETARGET, action.kind)
+        self.assertEqual(existing_session, action.mirror_session)
+
+    def test_plan_retarget_on_packet_length_change(self):
+        eni_tag = ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_RUNNING)
+        spile = Spile(boto3.client('s3'), eni_tag)
+        existing_session = self.mirror_session_factory({Spile.CREATOR_KEY: Spile.CREATOR_VALUE})
+        spile._find_tap = MagicMock(return_value=existing_session)
+        action = spile.plan(existing_session.target_id, do_tap=True, packet_length=128)
+        self.assertEqual(MirrorPlan.RETARGET, action.kind)
+        self.assertEqual(128, action.packet_length)
+
+    def test_retarget_packet_length(self):
+        eni_tag = ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_RUNNING)
+        ec2_client = MagicMock()
+        spile = Spile(ec2_client, eni_tag)
+        truncated = self.mirror_session_factory({Spile.CREATOR_KEY: Spile.CREATOR_VALUE})._replace(packet_length=128)
+        spile.to_mirror_session = MagicMock()
+        spile._retarget(truncated, truncated.target_id, packet_length=96)
+        self.assertEqual(96, ec2_client.modify_traffic_mirror_session.call_args[1]['PacketLength'])
+        spile._retarget(truncated, truncated.target_id)
+        kwargs = ec2_client.modify_traffic_mirror_session.call_args[1]
+        self.assertEqual(['packet-length'], kwargs['RemoveFields'])
+        self.assertNotIn('PacketLength', kwargs)
+
+    def session_numbers(self, sessions, priorities, targets=None, session_targets=None):
+        index = SessionIndex()
+        for number, creator in sessions.items():
+            target_id = (session_targets or {}).get(number, 'tmt-1')
+            index.add(MirrorSession(f'tms-{number}', target_id, 'tmf-1', 'eth0', {Spile.CREATOR_KEY: creator}), number)
+        spile = Spile(MagicMock(), ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_RUNNING), index)
+        numbers, stale = spile.session_numbers(priorities, targets)
+        return numbers, sorted(stale)
+
+    def test_session_numbers(self):
+        self.assertEqual(([1, 2], []), self.session_numbers({}, [1, 2]))
+        self.assertEqual(([10, 20], []), self.session_numbers({}, [10, 20]))
+
+    def test_session_numbers_avoid_others(self):
+        self.assertEqual(([2, 4], []), self.session_numbers({1: 'Bob Barker', 3: 'Bob Barker'}, [1, 3]))
+
+    def test_session_numbers_keep_ours(self):
+        self.assertEqual(([2, 3], []), self.session_numbers({2: Spile.CREATOR_VALUE, 3: Spile.CREATOR_VALUE}, [1, 2]))
+        # ours below a raised priority are replaced
+        self.assertEqual(([1, 10], [2]), self.session_numbers({1: Spile.CREATOR_VALUE, 2: Spile.CREATOR_VALUE},
+                                                              [1, 10]))
+        self.assertEqual(([1], [5]), self.session_numbers({1: Spile.CREATOR_VALUE, 5: Spile.CREATOR_VALUE}, [1]))
+
+    def test_session_numbers_keep_targets(self):
+        ours = {2: Spile.CREATOR_VALUE, 3: Spile.CREATOR_VALUE}
+        on_targets = {2: 'tmt-a', 3: 'tmt-b'}
+        # a slot added in front takes a new number, rather than moving every session down one target
+        self.assertEqual(([1, 2, 3], []), self.session_numbers(ours, [1, 2, 3], [{'tmt-c'}, {'tmt-a'}, {'tmt-b'}],
+                                                               on_targets))
+        # of two swapped targets the first in priority order keeps its session, the other moves above it
+        self.assertEqual(([3, 4], [2]), self.session_numbers(ours, [1, 2], [{'tmt-b'}, {'tmt-a'}], on_targets))
+        # a slot with no room below a kept session takes its place
+        self.assertEqual(([2, 3], []), self.session_numbers(ours, [2, 3], [{'tmt-c'}, {'tmt-a'}], on_targets))
+
+    def test_session_numbers_exhausted(self):
+        numbers, _ = self.session_numbers({Spile.SESSION_NUMBER_MAX: 'Bob Barker'}, [Spile.SESSION_NUMBER_MAX])
+        self.assertEqual([None], numbers)
+
+    def test_for_session(self):
+        spile = Spile(MagicMock(), ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_RUNNING))
+        self.assertIs(spile, spile.for_session(Spile.SESSION_NUMBER))
+        self.assertEqual(2, spile.for_session(2).session_number)
+        self.assertEqual(spile.eni_tag, spile.for_session(2).eni_tag)
+
+    def test_plan_delete(self):
+        eni_tag = ENI_Tag('id-12345', 'eth0', None, Ec2ApiClient.STATE_STOPPED)
+        spile = Spile(boto3.client('s3'), eni_tag)
+        existing_session = self.mirror_session_factory({Spile.CREATOR_KEY: Spile.CREATOR_VALUE})
+        spile._find_tap = MagicMock(return_value=existing_session)
+        action = spile.plan(existing_session.target_id, do_tap=False)
+        self.assertEqual(MirrorPlan.DELETE, action.kind)
\ No newline at end of file
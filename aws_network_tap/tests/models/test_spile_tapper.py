@@ -0,0 +1,214 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from aws_network_tap.models.client_pool import ClientPool
+from aws_network_tap.models.metrics import Metrics
+from aws_network_tap.models.mirror_plan import MirrorPlan
+from aws_network_tap.models.sap_filter import SapFilter
+from aws_network_tap.models.session_index import SessionIndex
+from aws_network_tap.models.spile import MirrorSession, Spile
+from aws_network_tap.models.spile_tapper import Desired_Tap, SpileTapper
+from aws_network_tap.models.tag_config import EC2Config, VPCTagConfig
+
+
+def instance_factory(instance_id, vpc_id, interface_ids, tags=None, state='running', instance_type='m5.large',
+                     az='us-east-1a'):
+    return {
+        'InstanceId': instance_id,
+        'InstanceType': instance_type,
+        'VpcId': vpc_id,
+        'Placement': {'AvailabilityZone': az},
+        'State': {'Name': state},
+        'Tags': [{'Key': k, 'Value': v} for k, v in (tags or {}).items()],
+        'NetworkInterfaces': [{'NetworkInterfaceId': x, 'VpcId': vpc_id} for x in interface_ids],
+    }
+
+
+def tapper_factory(vpc_ids, instances, instance_types=frozenset(['m5.large'])):
+    tapper = SpileTapper(account_number='123456789012', region='us-east-1', vpc_ids=vpc_ids)
+    tapper.instance_types = MagicMock(return_value=instance_types)
+    tapper.ec2_client = MagicMock()
+    paginator = tapper.ec2_client.get_paginator.return_value
+    paginator.paginate.return_value = [{'Reservations': [{'Instances': instances}]}]
+    return tapper
+
+
+class TestSpileTapper(TestCase):
+
+    def test_discover_by_vpc_single_scan(self):
+        tapper = tapper_factory(['vpc-1', 'vpc-2'], [
+            instance_factory('i-1', 'vpc-1', ['eni-1', 'eni-2']),
+            instance_factory('i-2', 'vpc-2', ['eni-3']),
+        ])
+        by_vpc = tapper.discover_by_vpc()
+        self.assertEqual(['eni-1', 'eni-2'], [x.eni_tag.interface_id for x in by_vpc['vpc-1']])
+        self.assertEqual(['eni-3'], [x.eni_tag.interface_id for x in by_vpc['vpc-2']])
+        paginator = tapper.ec2_client.get_paginator.return_value
+        paginator.paginate.assert_called_once()
+        filters = paginator.paginate.call_args[1]['Filters']
+        self.assertIn({'Name': 'vpc-id', 'Values': ['vpc-1', 'vpc-2']}, filters)
+
+    def test_discover_by_vpc_chunks_filter_values(self):
+        vpc_ids = ['vpc-{}'.format(i) for i in range(SpileTapper.FILTER_VALUES_MAX + 1)]
+        tapper = tapper_factory(vpc_ids, [])
+        tapper.discover_by_vpc()
+        self.assertEqual(2, tapper.ec2_client.get_paginator.return_value.paginate.call_count)
+
+    def test_discover_by_vpc_nothing_configured(self):
+        tapper = tapper_factory([], [instance_factory('i-1', 'vpc-1', ['eni-1'])])
+        self.assertEqual({}, tapper.discover_by_vpc())
+        tapper.ec2_client.get_paginator.assert_not_called()
+
+    def test_desired_state_enrollment_from_tags(self):
+        tapper = tapper_factory(['vpc-1'], [
+            instance_factory('i-1', 'vpc-1', ['eni-1']),
+            instance_factory('i-2', 'vpc-1', ['eni-2'], tags={EC2Config.T_BLACKLIST: EC2Config.V_TRUE}),
+        ])
+        tapper.ec2_client.describe_traffic_mirror_filters.return_value = {'TrafficMirrorFilters': []}
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'})
+        desired = tapper.desired_state(config)
+        self.assertTrue(desired[('eni-1', 1)].do_tap)
+        self.assertFalse(desired[('eni-2', 1)].do_tap)
+        tapper.ec2_client.describe_tags.assert_not_called()
+
+    def test_desired_state_target_pool(self):
+        tapper = tapper_factory(['vpc-1'], [
+            instance_factory('i-1', 'vpc-1', ['eni-1', 'eni-2', 'eni-3']),
+            instance_factory('i-2', 'vpc-1', ['eni-4'], tags={EC2Config.T_BLACKLIST: EC2Config.V_TRUE}),
+        ])
+        tapper.ec2_client.describe_traffic_mirror_filters.return_value = {'TrafficMirrorFilters': []}
+        tapper.list_mirror_targets = MagicMock(return_value=[])
+        ours = {Spile.CREATOR_KEY: Spile.CREATOR_VALUE}
+        index = SessionIndex({('eni-1', 1): MirrorSession('tms-1', 'tmt-2', 'tmf-1', 'eni-1', ours)})
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_TARGET_POOL: 'tmt-2:1'})
+        desired = tapper.desired_state(config, session_index=index)
+        self.assertEqual('tmt-2', desired[('eni-1', 1)].target_id)  # kept
+        self.assertEqual('tmt-1', desired[('eni-2', 1)].target_id)  # tmt-2 is full
+        self.assertEqual('tmt-1', desired[('eni-3', 1)].target_id)
+        self.assertFalse(desired[('eni-4', 1)].do_tap)
+
+    def test_desired_state_az_targets(self):
+        tapper = tapper_factory(['vpc-1'], [
+            instance_factory('i-1', 'vpc-1', ['eni-1'], az='us-east-1a'),
+            instance_factory('i-2', 'vpc-1', ['eni-2'], az='us-east-1b'),
+            instance_factory('i-3', 'vpc-1', ['eni-3'], az='us-east-1c'),
+        ])
+        tapper.ec2_client.describe_traffic_mirror_filters.return_value = {'TrafficMirrorFilters': []}
+        config = VPCTagConfig({
+            VPCTagConfig.T_TARGET: 'tmt-default',
+            VPCTagConfig.T_TARGET_AZ: 'us-east-1a=tmt-a,us-east-1b=tmt-b',
+        })
+        desired = tapper.desired_state(config)
+        self.assertEqual('us-east-1a', desired[('eni-1', 1)].spile.eni_tag.az)
+        keys = [('eni-1', 1), ('eni-2', 1), ('eni-3', 1)]
+        self.assertEqual(['tmt-a', 'tmt-b', 'tmt-default'], [desired[x].target_id for x in keys])
+        self.assertEqual([False, False, True], [desired[x].az_fallback for x in keys])
+
+    def test_desired_state_filter_profiles(self):
+        tapper = tapper_factory(['vpc-1'], [
+            instance_factory('i-1', 'vpc-1', ['eni-1']),
+            instance_factory('i-2', 'vpc-1', ['eni-2'], tags={EC2Config.T_FILTER_PROFILE: 'full'}),
+        ])
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_FILTER_PROFILE: 'lean'})
+        with patch.object(SapFilter, 'resolve', side_effect=lambda *args, **kwargs: f'tmf-{kwargs["profile"]}'):
+            desired = tapper.desired_state(config)
+        self.assertEqual('tmf-lean', desired[('eni-1', 1)].filter_id)
+        self.assertEqual('tmf-full', desired[('eni-2', 1)].filter_id)
+
+    def test_desired_state_sessions(self):
+        tapper = tapper_factory(['vpc-1'], [instance_factory('i-1', 'vpc-1', ['eni-1'])])
+        ours = {Spile.CREATOR_KEY: Spile.CREATOR_VALUE}
+        index = SessionIndex({
+            ('eni-1', 1): MirrorSession('tms-1', 'tmt-other', 'tmf-1', 'eni-1', {}),
+            ('eni-1', 7): MirrorSession('tms-7', 'tmt-old', 'tmf-1', 'eni-1', ours),
+        })
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_SESSIONS: 'tmt-2:2:recorder'})
+        with patch.object(SapFilter, 'resolve', side_effect=lambda *args, **kwargs: f'tmf-{kwargs["profile"]}'):
+            desired = tapper.desired_state(config, session_index=index)
+        # session 1 belongs to someone else, ours on 7 is kept for the vpc target and the recorder follows it
+        self.assertEqual([('eni-1', 7), ('eni-1', 8)], sorted(desired))
+        primary, recorder = desired[('eni-1', 7)], desired[('eni-1', 8)]
+        self.assertEqual(('tmt-1', 'tmf-None', True), (primary.target_id, primary.filter_id, primary.primary))
+        self.assertEqual(('tmt-2', 'tmf-recorder', False), (recorder.target_id, recorder.filter_id, recorder.primary))
+        self.assertEqual(8, recorder.spile.session_number)
+        index.remove('eni-1', 7)
+        with patch.object(SapFilter, 'resolve', return_value='tmf-1'):
+            desired = tapper.desired_state(config, session_index=index)
+        self.assertEqual([('eni-1', 2), ('eni-1', 3)], sorted(desired))
+
+    def test_desired_state_sessions_keep_targets(self):
+        tapper = tapper_factory(['vpc-1'], [instance_factory('i-1', 'vpc-1', ['eni-1'])])
+        ours = {Spile.CREATOR_KEY: Spile.CREATOR_VALUE}
+        index = SessionIndex({
+            ('eni-1', 1): MirrorSession('tms-1', 'tmt-1', 'tmf-1', 'eni-1', ours),
+            ('eni-1', 3): MirrorSession('tms-3', 'tmt-3', 'tmf-1', 'eni-1', ours),
+        })
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_SESSIONS: 'tmt-2:2,tmt-3:3'})
+        with patch.object(SapFilter, 'resolve', return_value='tmf-1'):
+            desired = tapper.desired_state(config, session_index=index)
+        # the added tmt-2 session takes a free number instead of the session on tmt-3
+        self.assertEqual({1: 'tmt-1', 2: 'tmt-2', 3: 'tmt-3'}, {k[1]: x.target_id for k, x in desired.items()})
+
+    def test_desired_state_stale_session(self):
+        tapper = tapper_factory(['vpc-1'], [instance_factory('i-1', 'vpc-1', ['eni-1'])])
+        ours = {Spile.CREATOR_KEY: Spile.CREATOR_VALUE}
+        index = SessionIndex({
+            ('eni-1', 1): MirrorSession('tms-1', 'tmt-1', 'tmf-1', 'eni-1', ours),
+            ('eni-1', 2): MirrorSession('tms-2', 'tmt-2', 'tmf-1', 'eni-1', ours),
+        })
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'})
+        with patch.object(SapFilter, 'resolve', return_value='tmf-1'):
+            desired = tapper.desired_state(config, session_index=index)
+        self.assertTrue(desired[('eni-1', 1)].do_tap)
+        self.assertFalse(desired[('eni-1', 2)].do_tap)
+        self.assertEqual(MirrorPlan.DELETE, desired[('eni-1', 2)].spile.plan(None, do_tap=False).kind)
+
+    def test_plan_prebuilt_spiles(self):
+        spile = MagicMock()
+        spile.plan.return_value = MagicMock(kind=MirrorPlan.CREATE)
+        desired = {('eni-1', 1): Desired_Tap(spile, True, 'tmt-1', 'tmf-1', True)}
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'})
+        with patch.object(ClientPool, 'account_id', return_value='123456789012'), \
+                patch.object(SpileTapper, '_get_client'), \
+                patch.object(SessionIndex, 'build') as build, \
+                patch.object(SpileTapper, 'desired_state', return_value=desired) as desired_state:
+            plan = SpileTapper.plan('us-east-1', ['vpc-1'], config, spiles=[spile])
+        build.assert_not_called()  # the spiles look up their own sessions
+        self.assertEqual([spile], desired_state.call_args[1]['spiles'])
+        spile.plan.assert_called_once_with(target_id='tmt-1', do_tap=True, filter_id='tmf-1', packet_length=None)
+        self.assertEqual(1, len(plan))
+        self.assertEqual(['eni-1'], plan.az_fallbacks)
+
+    def test_plan_counts_actions_by_vpc(self):
+        desired = {}
+        for n, vpc_id in enumerate(['vpc-1', 'vpc-2', 'vpc-2']):
+            spile = MagicMock()
+            spile.eni_tag.vpc_id = vpc_id
+            spile.plan.return_value = MagicMock(kind=MirrorPlan.CREATE, spile=spile)
+            desired[(f'eni-{n}', 1)] = Desired_Tap(spile, True, 'tmt-1', 'tmf-1')
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'})
+        Metrics.clear()
+        with patch.object(ClientPool, 'account_id', return_value='123456789012'), \
+                patch.object(SpileTapper, '_get_client'), \
+                patch.object(SpileTapper, 'desired_state', return_value=desired):
+            SpileTapper.plan('us-east-1', ['vpc-1', 'vpc-2'], config, spiles=[])
+        report = Metrics.report()
+        Metrics.clear()
+        self.assertEqual({'vpc-1', 'vpc-2'}, set(report['vpcs']))
+        self.assertEqual(2, report['vpcs']['vpc-2'][MirrorPlan.CREATE])
+        self.assertEqual(['plan'], list(report['phases']))
+
+    def test_discover_client_side_type_match(self):
+        catalog = frozenset(['m5.large'] + ['x{}.large'.format(i) for i in range(SpileTapper.FILTER_VALUES_MAX)])
+        tapper = tapper_factory(['vpc-1'], [
+            instance_factory('i-1', 'vpc-1', ['eni-1']),
+            instance_factory('i-2', 'vpc-1', ['eni-2'], instance_type='c4.large'),
+        ], instance_types=catalog)
+        self.assertEqual(['eni-1'], [x.eni_tag.interface_id for x in tapper.discover()])
+        filters = tapper.ec2_client.get_paginator.return_value.paginate.call_args[1]['Filters']
+        self.assertEqual(['vpc-id'], [x['Name'] for x in filters])
+
+    def test_discover_server_side_type_filter(self):
+        tapper = tapper_factory(['vpc-1'], [])
+        list(tapper.discover())
+        filters = tapper.ec2_client.get_paginator.return_value.paginate.call_args[1]['Filters']
+        self.assertIn({'Name': 'instance-type', 'Values': ['m5.large']}, filters)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+from aws_network_tap.models.ec2_api_client import ENI_Tag, Ec2ApiClient
+from aws_network_tap.models.session_index import SessionIndex
+from aws_network_tap.models.spile import MirrorSession, Spile
+from aws_network_tap.models.state_store import StateStore
+from aws_network_tap.models.tag_config import EC2Config, VPCTagConfig
+
+
+def spile_factory(interface_id, tags=None, state=Ec2ApiClient.STATE_RUNNING):
+    return Spile(MagicMock(), ENI_Tag('i-' + interface_id, interface_id, tags or {}, state, 'vpc-1'))
+
+
+class TestStateStore(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = StateStore(os.path.join(self.tmp.name, 'state.db'))
+        self.configs = {'vpc-1': VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'})}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def save(self, spiles, failed=frozenset()):
+        index = SessionIndex()
+        index.add(MirrorSession('tms-1', 'tmt-1', 'tmf-1', 'eni-1', {Spile.CREATOR_KEY: Spile.CREATOR_VALUE}), 1)
+        self.store.save('123', 'us-east-1', index, self.configs, spiles, set(failed), full_sync=True)
+
+    def test_full_sync_due(self):
+        self.assertTrue(self.store.full_sync_due('123', 'us-east-1', 3600))
+        self.save([])
+        self.assertFalse(self.store.full_sync_due('123', 'us-east-1', 3600))
+        self.assertTrue(self.store.full_sync_due('123', 'us-east-1', 0))
+
+    def test_load_index(self):
+        self.save([])
+        index = self.store.load_index('123', 'us-east-1')
+        self.assertEqual('tms-1', index.get('eni-1', 1).id)
+        self.assertTrue(Spile.should_manage(index.get('eni-1', 1)))
+        self.assertEqual(0, len(self.store.load_index('123', 'eu-west-1')))
+
+    def test_packet_length(self):
+        index = SessionIndex()
+        index.add(MirrorSession('tms-1', 'tmt-1', 'tmf-1', 'eni-1', {}, 128), 1)
+        self.store.save('123', 'us-east-1', index, self.configs, [], set(), full_sync=True)
+        self.assertEqual(128, self.store.load_index('123', 'us-east-1').get('eni-1', 1).packet_length)
+        StateStore(self.store.path)  # reopening an up to date snapshot is fine
+
+    def test_changes(self):
+        self.save([spile_factory('eni-1'), spile_factory('eni-2'), spile_factory('eni-gone')])
+        current = {'vpc-1': [
+            spile_factory('eni-1'),
+            spile_factory('eni-2', tags={EC2Config.T_BLACKLIST: EC2Config.V_TRUE}),
+            spile_factory('eni-new'),
+        ]}
+        changed, vanished = self.store.changes('123', 'us-east-1', self.configs, current)
+        self.assertEqual(['eni-2', 'eni-new'], [x.eni_tag.interface_id for x in changed['vpc-1']])
+        self.assertEqual({'eni-gone'}, vanished)
+
+    def test_changes_vpc_config(self):
+        self.save([spile_factory('eni-1')])
+        configs = {'vpc-1': VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-2'})}
+        changed, _ = self.store.changes('123', 'us-east-1', configs, {'vpc-1': [spile_factory('eni-1')]})
+        self.assertEqual(1, len(changed['vpc-1']))
+
+    def test_failed_retried(self):
+        self.save([spile_factory('eni-1')], failed={'eni-1'})
+        changed, _ = self.store.changes('123', 'us-east-1', self.configs, {'vpc-1': [spile_factory('eni-1')]})
+        self.assertEqual(1, len(changed['vpc-1']))
+
+    def test_changes_session_drift(self):
+        self.save([spile_factory('eni-1'), spile_factory('eni-2')])
+        live = SessionIndex()  # the session of eni-1 was deleted by hand
+        current = {'vpc-1': [spile_factory('eni-1'), spile_factory('eni-2')]}
+        changed, _ = self.store.changes('123', 'us-east-1', self.configs, current, live)
+        self.assertEqual(['eni-1'], [x.eni_tag.interface_id for x in changed['vpc-1']])
+        live = self.store.load_index('123', 'us-east-1')
+        changed, _ = self.store.changes('123', 'us-east-1', self.configs, current, live)
+        self.assertEqual([], changed['vpc-1'])
@@ -1,6 +1,6 @@
 from unittest import TestCase
 from aws_network_tap.models.aws_tag import AWSTag
-from aws_network_tap.models.tag_config import VPCTagConfig, EC2Config, TagConfig
+from aws_network_tap.models.tag_config import VPCTagConfig, EC2Config, Session_Slot, TagConfig
 import logging
 logging.getLogger().setLevel(logging.INFO)
 
@@ -89,6 +89,26 @@ class TestVPCTags(TestCase):
         for tag in config.get_aws_tags():
             self.assertEqual(1, len(tag))
 
+    def test_target_pool(self):
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_TARGET_POOL: 'tmt-2:5, tmt-3,,'})
+        self.assertTrue(config.pooled)
+        self.assertEqual({'tmt-1': None, 'tmt-2': 5, 'tmt-3': None}, config.target_pool)
+
+    def test_target_pool_bad_limit(self):
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_TARGET_POOL: 'tmt-a:abc,tmt-b:2'})
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual({'tmt-1': None, 'tmt-b': 2}, config.target_pool)
+
+    def test_az_targets(self):
+        config = VPCTagConfig({VPCTagConfig.T_TARGET_AZ: 'us-east-1a=tmt-a, us-east-1b = tmt-b,us-east-1c='})
+        self.assertEqual({'us-east-1a': 'tmt-a', 'us-east-1b': 'tmt-b'}, config.az_targets)
+        self.assertEqual({}, VPCTagConfig().az_targets)
+
+    def test_target_pool_unset(self):
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'})
+        self.assertFalse(config.pooled)
+        self.assertEqual({'tmt-1': None}, config.target_pool)
+
 
 class TestEc2Tags(TestCase):
 
@@ -122,3 +142,39 @@ class TestEc2Tags(TestCase):
         with self.assertRaises(ValueError) as e:
             config.whitelist = True
 
+
+    def test_enrolled_auto(self):
+        vpc_config = VPCTagConfig()
+        self.assertTrue(EC2Config().enrolled(vpc_config))
+        self.assertFalse(EC2Config({EC2Config.T_BLACKLIST: EC2Config.V_TRUE}).enrolled(vpc_config))
+
+    def test_enrolled_whitelist(self):
+        vpc_config = VPCTagConfig()
+        vpc_config.enrollment = VPCTagConfig.V_ENROLLMENT_WHITELIST
+        self.assertFalse(EC2Config().enrolled(vpc_config))
+        self.assertFalse(EC2Config({EC2Config.T_BLACKLIST: EC2Config.V_TRUE}).enrolled(vpc_config))
+        self.assertTrue(EC2Config({EC2Config.T_WHITELIST: EC2Config.V_TRUE}).enrolled(vpc_config))
+
+    def test_packet_length(self):
+        vpc_config = VPCTagConfig({VPCTagConfig.T_PACKET_LENGTH: '128'})
+        self.assertEqual(128, vpc_config.packet_length)
+        self.assertEqual(128, EC2Config().packet_length_for(vpc_config))
+        self.assertEqual(96, EC2Config({EC2Config.T_PACKET_LENGTH: '96'}).packet_length_for(vpc_config))
+        self.assertIsNone(EC2Config({EC2Config.T_PACKET_LENGTH: '0'}).packet_length_for(vpc_config))
+        self.assertIsNone(EC2Config().packet_length_for(VPCTagConfig()))
+
+    def test_sessions(self):
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_SESSIONS: 'tmt-2:5:bulk, tmt-3'})
+        self.assertEqual([
+            Session_Slot('tmt-1', 1, None), Session_Slot('tmt-2', 5, 'bulk'), Session_Slot('tmt-3', 6, None)
+        ], config.sessions)
+        config = VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_SESSIONS: 'tmt-2:1,tmt-1:2'})
+        self.assertEqual(['tmt-2', 'tmt-1'], [x.target_id for x in config.sessions])
+
+    def test_sessions_default(self):
+        self.assertEqual([Session_Slot('tmt-1', 1, None)], VPCTagConfig({VPCTagConfig.T_TARGET: 'tmt-1'}).sessions)
+        self.assertEqual([], VPCTagConfig({VPCTagConfig.T_SESSIONS: 'tmt-2:2'}).sessions)
+
+    def test_packet_length_invalid(self):
+        self.assertIsNone(VPCTagConfig({VPCTagConfig.T_PACKET_LENGTH: 'jumbo'}).packet_length)
+        self.assertIsNone(VPCTagConfig({VPCTagConfig.T_PACKET_LENGTH: '9001'}).packet_length)
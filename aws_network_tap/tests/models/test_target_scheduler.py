@@ -0,0 +1,45 @@
+from unittest import TestCase
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient
+from aws_network_tap.models.session_index import SessionIndex
+from aws_network_tap.models.spile import MirrorSession
+from aws_network_tap.models.target_scheduler import TargetScheduler, Target_Slot
+
+ENIS = [f'eni-{n}' for n in range(100)]
+
+
+class TestTargetScheduler(TestCase):
+
+    def test_limits_respected(self):
+        scheduler = TargetScheduler([Target_Slot('tmt-1', 10), Target_Slot('tmt-2', 10)])
+        assigned = scheduler.assign(ENIS[:25])
+        counts = {}
+        for target_id in assigned.values():
+            counts[target_id] = counts.get(target_id, 0) + 1
+        self.assertEqual({'tmt-1': 10, 'tmt-2': 10, None: 5}, counts)
+
+    def test_existing_sessions_stay(self):
+        current = {eni: 'tmt-1' for eni in ENIS[:10]}
+        slots = [Target_Slot('tmt-1', None), Target_Slot('tmt-2', None), Target_Slot('tmt-3', None)]
+        assigned = TargetScheduler(slots).assign(ENIS, current)
+        self.assertTrue(all(assigned[eni] == 'tmt-1' for eni in ENIS[:10]))
+
+    def test_stable_when_pool_grows(self):
+        before = TargetScheduler([Target_Slot('tmt-1', None), Target_Slot('tmt-2', None)]).assign(ENIS)
+        after = TargetScheduler([
+            Target_Slot('tmt-1', None), Target_Slot('tmt-2', None), Target_Slot('tmt-3', None)
+        ]).assign(ENIS)
+        moved = [eni for eni in ENIS if before[eni] != after[eni]]
+        self.assertTrue(all(after[eni] == 'tmt-3' for eni in moved))
+        self.assertLess(len(moved), 60)
+        self.assertGreater(len(moved), 10)
+
+    def test_for_pool_counts_other_sessions(self):
+        index = SessionIndex({
+            ('eni-other', 1): MirrorSession('tms-1', 'tmt-1', 'tmf-1', 'eni-other', {}),
+            ('eni-0', 1): MirrorSession('tms-2', 'tmt-1', 'tmf-1', 'eni-0', {}),
+        })
+        scheduler = TargetScheduler.for_pool(
+            {'tmt-1': None, 'tmt-2': 5}, {'tmt-1': Ec2ApiClient.TARGET_NIC}, index, ['eni-0']
+        )
+        self.assertEqual(Target_Slot('tmt-1', TargetScheduler.NIC_SOURCES_MAX), scheduler.slots['tmt-1'])
+        self.assertEqual({'tmt-1': 1}, scheduler.used)
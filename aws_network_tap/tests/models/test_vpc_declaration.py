@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase
+from aws_network_tap.models.ec2_api_client import VPC_Props
+from aws_network_tap.models.tag_config import VPCTagConfig
+from aws_network_tap.models.vpc_declaration import VPCDeclaration
+
+PROD = VPC_Props('vpc-1', 'prod-a', {'Name': 'prod-a', 'Environment': 'production'})
+DEV = VPC_Props('vpc-2', 'dev', {'Name': 'dev', 'Environment': 'dev'})
+TAPPED = VPC_Props('vpc-3', 'tapped', {
+    'Name': 'tapped', VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_ENROLLMENT: VPCTagConfig.V_ENROLLMENT_AUTO
+})
+
+
+class TestVPCDeclaration(TestCase):
+
+    def test_load_yaml(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'vpcs.yaml')
+            with open(path, 'w') as f:
+                f.write('vpcs:\n  - selector: {Environment: prod*}\n    target: nlb\n')
+            declaration = VPCDeclaration.load(path)
+        self.assertEqual([{'selector': {'Environment': 'prod*'}, 'target': 'nlb'}], declaration.entries)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            VPCDeclaration([{'target': 'nlb'}])
+        with self.assertRaises(ValueError):
+            VPCDeclaration([{'vpc': 'vpc-1', 'target': 'nlb', 'enrollment': 'sometimes'}])
+
+    def test_last_match_wins(self):
+        declaration = VPCDeclaration([
+            {'selector': {'Name': '*'}, 'target': 'tmt-all'},
+            {'vpc': 'vpc-2', 'target': 'none'},
+        ])
+        declared = {x.vpc_prop.vpc_id: x for x in declaration.declared([PROD, DEV])}
+        self.assertEqual('tmt-all', declared['vpc-1'].target)
+        self.assertEqual(VPCTagConfig.V_ENROLLMENT_AUTO, declared['vpc-1'].enrollment)
+        self.assertIsNone(declared['vpc-2'].target)
+
+    def test_unmatched_left_alone(self):
+        declaration = VPCDeclaration([{'selector': {'Environment': 'prod*'}, 'target': 'tmt-1'}])
+        self.assertEqual(['vpc-1'], [x.vpc_prop.vpc_id for x in declaration.declared([PROD, DEV])])
+
+    def test_config_diff(self):
+        declaration = VPCDeclaration([{'vpc': 'vpc-3', 'target': 'tmt-1'}, {'vpc': 'vpc-1', 'target': 'none'}])
+        tapped, prod = declaration.declared([TAPPED, PROD])
+        self.assertIsNone(VPCDeclaration.config(tapped, 'tmt-1'))
+        self.assertIsNone(VPCDeclaration.config(prod, None))
+        config = VPCDeclaration.config(tapped, 'tmt-2')
+        self.assertEqual('tmt-2', config.target)
+        self.assertNotIn('Name', {x['Key'] for x in config.get_aws_tags()})
+
+    def test_disable(self):
+        declaration = VPCDeclaration([{'vpc': 'vpc-3', 'target': 'none'}])
+        config = VPCDeclaration.config(declaration.declared([TAPPED])[0], None)
+        self.assertFalse(config.enabled)
+        self.assertEqual([{'Key': VPCTagConfig.T_TARGET}, {'Key': VPCTagConfig.T_ENROLLMENT}], config.get_aws_tags())
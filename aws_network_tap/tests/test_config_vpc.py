@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from aws_network_tap import config_vpc
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient, VPC_Props
+from aws_network_tap.models.tag_config import VPCTagConfig
+
+VPCS = [
+    VPC_Props('vpc-1', 'one', {'Name': 'one'}),
+    VPC_Props('vpc-2', 'two', {'Name': 'two', VPCTagConfig.T_TARGET: 'tmt-1', VPCTagConfig.T_ENROLLMENT: 'auto'}),
+]
+
+
+class TestApply(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'vpcs.json')
+        with open(self.path, 'w') as f:
+            json.dump([{'selector': {'Name': '*'}, 'target': 'nlb'}, {'vpc': 'vpc-2', 'target': 'tmt-1'}], f)
+        for name, value in [('list_vpcs', VPCS), ('list_mirror_targets', [])]:
+            patcher = patch.object(Ec2ApiClient, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch.object(Ec2ApiClient, 'set_vpc_config')
+    @patch.object(config_vpc, 'resolve_target', side_effect=lambda region, vpc_id, target, dry_run:
+                  'tmt-nlb' if target == 'nlb' else target)
+    def test_only_changes_applied(self, resolve_target, set_vpc_config):
+        self.assertTrue(config_vpc.apply(self.path, 'us-east-1'))
+        resolve_target.assert_any_call('us-east-1', 'vpc-1', 'nlb', False)
+        set_vpc_config.assert_called_once()
+        self.assertEqual('vpc-1', set_vpc_config.call_args[1]['vpc_id'])
+        self.assertEqual('tmt-nlb', set_vpc_config.call_args[1]['config'].target)
+
+    @patch.object(Ec2ApiClient, 'set_vpc_config')
+    @patch.object(config_vpc, 'resolve_target', return_value=config_vpc.NEW_NLB_TARGET)
+    def test_dry_run(self, resolve_target, set_vpc_config):
+        self.assertTrue(config_vpc.apply(self.path, 'us-east-1', dry_run=True))
+        resolve_target.assert_any_call('us-east-1', 'vpc-1', 'nlb', True)
+        set_vpc_config.assert_not_called()
+
+    @patch.object(Ec2ApiClient, 'set_vpc_config', side_effect=Exception('UnauthorizedOperation'))
+    @patch.object(config_vpc, 'resolve_target', return_value='tmt-nlb')
+    def test_failure(self, *_):
+        self.assertFalse(config_vpc.apply(self.path, 'us-east-1'))
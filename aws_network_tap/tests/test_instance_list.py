@@ -0,0 +1,38 @@
+import io
+from unittest import TestCase
+from unittest.mock import patch
+from aws_network_tap import instance_list
+from aws_network_tap.models.ec2_api_client import Ec2ApiClient
+from aws_network_tap.models.tag_config import EC2Config
+
+
+class TestInstanceList(TestCase):
+
+    def test_read_ids(self):
+        stream = io.StringIO('i-1, i-2\n# sensors\ni-3 i-4  # brain\n\n')
+        self.assertEqual(['i-1', 'i-2', 'i-3', 'i-4'], instance_list.read_ids(stream))
+
+    @patch.object(Ec2ApiClient, 'get_instances_by_tag', return_value={'i-0a'})
+    @patch.object(Ec2ApiClient, 'find_instances', return_value={'i-0b'})
+    @patch.object(Ec2ApiClient, 'tag_instances', return_value={})
+    def test_batch(self, tag_instances, find_instances, _):
+        instance_list.main(EC2Config.T_BLACKLIST, 'blacklist', [
+            '--region', 'us-east-1', '--ids', 'i-0a', '--selector', 'role=sensor'
+        ])
+        find_instances.assert_called_once_with(region='us-east-1', key='role', value='sensor')
+        self.assertEqual(['i-0a', 'i-0b'], tag_instances.call_args[1]['instance_ids'])
+        self.assertTrue(tag_instances.call_args[1]['enabled'])
+
+    @patch.object(Ec2ApiClient, 'get_instances_by_tag', return_value=set())
+    @patch.object(Ec2ApiClient, 'tag_instances', return_value={'i-0c': 'InvalidInstanceID.NotFound'})
+    def test_failures_exit(self, tag_instances, _):
+        with self.assertRaises(SystemExit):
+            instance_list.main(EC2Config.T_WHITELIST, 'whitelist', [
+                '--region', 'us-east-1', '--remove', '--ids', 'i-0c,bogus'
+            ])
+        self.assertEqual(['i-0c'], tag_instances.call_args[1]['instance_ids'])
+        self.assertFalse(tag_instances.call_args[1]['enabled'])
+
+    def test_concurrency(self):
+        with patch('sys.stderr', new_callable=io.StringIO), self.assertRaises(SystemExit):
+            instance_list.parse_args('blacklist', ['--concurrency', '0'])
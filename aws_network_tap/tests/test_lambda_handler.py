@@ -0,0 +1,55 @@
+import json
+import subprocess
+import sys
+from unittest import TestCase, skipIf
+from aws_network_tap import lambda_handler
+
+IMPORT_BUDGET = 0.5  # seconds, generous: boto3 alone takes about a third of it
+
+STATE_CHANGE = {
+    'detail-type': 'EC2 Instance State-change Notification',
+    'region': 'us-east-1',
+    'detail': {'instance-id': 'i-1', 'state': 'running'},
+}
+
+
+class TestColdStart(TestCase):
+
+    @skipIf(sys.version_info < (3, 7), '-X importtime needs python 3.7')
+    def test_import_budget(self):
+        """
+        python -X importtime reports microseconds per module on stderr.
+        The tapper is what the first invocation imports, boto3 waits for the first client.
+        """
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import aws_network_tap.lambda_handler, aws_network_tap.tap'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True
+        )
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = [x.strip() for x in line[len('import time:'):].split('|')]
+            modules[name] = int(cumulative)
+        self.assertNotIn('boto3', modules)
+        self.assertNotIn('botocore', modules)
+        self.assertNotIn('ec2_metadata', modules)
+        self.assertNotIn('yaml', modules)
+        self.assertLess(modules['aws_network_tap.tap'] / 1e6, IMPORT_BUDGET)
+
+
+class TestInstanceEvents(TestCase):
+
+    def test_scheduled(self):
+        self.assertEqual([], lambda_handler.instance_events({'detail-type': 'Scheduled Event', 'detail': {}}))
+
+    def test_eventbridge(self):
+        self.assertEqual(['i-1'], [x.instance_id for x in lambda_handler.instance_events(STATE_CHANGE)])
+
+    def test_sqs_and_sns_records(self):
+        event = {'Records': [
+            {'body': json.dumps(STATE_CHANGE)},
+            {'Sns': {'Message': json.dumps(STATE_CHANGE)}},
+            {'body': 'not json'},
+        ]}
+        self.assertEqual(['i-1', 'i-1'], [x.instance_id for x in lambda_handler.instance_events(event)])
@@ -0,0 +1,36 @@
+import io
+from unittest import TestCase
+from unittest.mock import patch
+from aws_network_tap import tap
+
+
+class TestParseArgs(TestCase):
+
+    def assertRejected(self, argv):
+        with patch('sys.stderr', new_callable=io.StringIO), self.assertRaises(SystemExit):
+            tap.parse_args(argv)
+
+    def test_concurrency(self):
+        self.assertRejected(['--concurrency', '0'])
+        self.assertEqual(1, tap.parse_args(['--concurrency', '1']).concurrency)
+
+    def test_daemon_needs_state_file(self):
+        self.assertRejected(['--daemon'])
+        self.assertTrue(tap.parse_args(['--daemon', '--state-file', 'state.db']).daemon)
+
+    def test_roles_file_runs_once(self):
+        self.assertRejected(['--roles-file', 'roles.txt', '--daemon', '--state-file', 'state.db'])
+        self.assertRejected(['--roles-file', 'roles.txt', '--events-file', '-'])
+        self.assertRejected(['--roles-file', 'roles.txt', '--events-queue', 'https://sqs.example/queue'])
+        self.assertEqual('roles.txt', tap.parse_args(['--roles-file', 'roles.txt']).roles_file)
+
+
+class TestResolveRegions(TestCase):
+
+    def test_list(self):
+        self.assertEqual(['us-east-1', 'us-west-2'], tap.resolve_regions(' us-east-1, us-west-2,'))
+
+    def test_empty_list(self):
+        for regions in [',', ' , ']:
+            with self.assertRaises(ValueError):
+                tap.resolve_regions(regions)